@@ -1,6 +1,8 @@
 import time
+from array import array
 from micropython import const
 import machine
+import micropython
 
 from i2c_helper import I2C
 
@@ -42,6 +44,11 @@ REG_POWER_CTL = const(0x2D)
 REG_SELF_TEST = const(0x2E)
 REG_RESET = const(0x2F)
 
+# FIFO entry flags (stored in the low byte of each 3-byte entry)
+FIFO_X_MARKER = const(0x01)
+FIFO_EMPTY = const(0x02)
+FIFO_MAX_ENTRIES = const(96)
+
 # Settings
 SET_RANGE_2G = 0b01
 SET_RANGE_4G = 0b10
@@ -59,6 +66,24 @@ SET_ODR_15_625 = 0b1000
 SET_ODR_7_813 = 0b1001
 SET_ODR_3_906 = 0b1010
 
+# High-pass corner as a fraction of the ODR (REG_FILTER bits 6:4)
+SET_HPF_OFF = 0b000
+SET_HPF_24_7 = 0b001  # 24.7e-4 x ODR
+SET_HPF_6_2084 = 0b010
+SET_HPF_1_5545 = 0b011
+SET_HPF_0_3862 = 0b100
+SET_HPF_0_0954 = 0b101
+SET_HPF_0_0238 = 0b110
+
+# REG_INT_MAP sources, shift left by INT2_SHIFT to route to INT2 instead of INT1
+INT_RDY = 0b0001
+INT_FULL = 0b0010  # FIFO entries reached REG_FIFO_SAMPLES
+INT_OVR = 0b0100
+INT_ACT = 0b1000
+INT2_SHIFT = 4
+
+INT_POL_HIGH = 0b01000000  # REG_RANGE INT_POL
+
 ODR_TO_BIT = {4000: SET_ODR_4000,
               2000: SET_ODR_2000,
               1000: SET_ODR_1000,
@@ -70,30 +95,184 @@ ODR_TO_BIT = {4000: SET_ODR_4000,
               15.625: SET_ODR_15_625,
               7.813: SET_ODR_7_813,
               3.906: SET_ODR_3_906}
+BIT_TO_ODR = {bit: odr for odr, bit in ODR_TO_BIT.items()}
+
+
+try:
+    @micropython.viper
+    def _decode_viper(buf: ptr8, entries: int, out: ptr32, start: int):
+        i = 0
+        j = start
+        end = start + entries
+        while j < end:
+            v = (buf[i] << 12) | (buf[i + 1] << 4) | (buf[i + 2] >> 4)
+            if v & 0x80000:
+                v -= 0x100000
+            out[j] = v
+            i += 3
+            j += 1
+except NameError:
+    # No viper pointer types outside MicroPython (e.g. the simulator), use the loop below
+    _decode_viper = None
+
+
+def decode_raw_into(buf, n, out, offset=0):
+    """
+    Decode n consecutive 9-byte X/Y/Z samples (XDATA3..ZDATA1 layout, FIFO triplets
+    included) from buf into the array('i') out as signed 20-bit counts, sample k
+    landing at out[3 * (offset + k)]. Nothing is allocated per sample.
+    """
+    if _decode_viper is not None:
+        _decode_viper(buf, n * 3, out, offset * 3)
+        return out
+    i = 0
+    j = offset * 3
+    end = j + n * 3
+    while j < end:
+        v = (buf[i] << 12) | (buf[i + 1] << 4) | (buf[i + 2] >> 4)
+        out[j] = v - 0x100000 if v & 0x80000 else v
+        i += 3
+        j += 1
+    return out
+
+
+@micropython.native
+def decode_into(buf, n, out, factor, offset=0):
+    """
+    Like decode_raw_into, scaling the counts by factor into the array('f') out.
+    """
+    i = 0
+    j = offset * 3
+    end = j + n * 3
+    while j < end:
+        v = (buf[i] << 12) | (buf[i + 1] << 4) | (buf[i + 2] >> 4)
+        if v & 0x80000:
+            v -= 0x100000
+        out[j] = v * factor
+        i += 3
+        j += 1
+    return out
 
 
 class ADXL355(I2C):
+    CHANNELS = ("X", "Y", "Z")
+    BUFFER_SIZE = 9
     factor = 2.048 * 2 / 2 ** 20
 
     def __init__(self, *args, i2c: machine.I2C, **kwargs):
         super().__init__(*args, i2c=i2c, **kwargs)
+        self.fifo_resyncs = 0
+        self._axis = array('f', (0.0, 0.0, 0.0))
+        self._axis_raw = array('i', (0, 0, 0))
+        # A full FIFO drain: one view per sample count, and its decoded samples
+        self._fifo_buf = bytearray(FIFO_MAX_ENTRIES * 3)
+        fifo_view = memoryview(self._fifo_buf)
+        self._fifo_views = [fifo_view[:9 * n] for n in range(FIFO_MAX_ENTRIES // 3 + 1)]
+        self._fifo_out = array('f', bytes(4 * FIFO_MAX_ENTRIES))
+        self._fifo_raw = array('i', bytes(4 * FIFO_MAX_ENTRIES))
+        # Whatever the device runs at, e.g. kept across a WDT reset
+        filt = self.dev_read_int(REG_FILTER)
+        self.odr = BIT_TO_ODR.get(filt & 0x0F, 4000)
+        self._hpf = (filt >> 4) & 0b111
+        self.irq_overruns = 0
+        self._irq_pin = None
+        self._irq_watermark = False
+        self._irq_callback = None
+        # Bound once, creating a bound method inside the IRQ handler would allocate
+        self._irq_task_ref = self._irq_task
         self.setrange()
+        if "odr" in kwargs:
+            self.set_odr(kwargs["odr"], kwargs.get("hpf", SET_HPF_OFF))
 
     def setrange(self, r=SET_RANGE_2G):
-        self.stop()
-        temp = self.dev_read_int(REG_RANGE)
+        self._range = r
         if r == SET_RANGE_2G:
-            self.dev_write(REG_RANGE, (temp & 0b11111100) | SET_RANGE_2G)
             self.factor = 2.048 * 2 / 2 ** 20
         if r == SET_RANGE_4G:
-            self.dev_write(REG_RANGE, (temp & 0b11111100) | SET_RANGE_4G)
             self.factor = 4.096 * 2 / 2 ** 20
         if r == SET_RANGE_8G:
-            self.dev_write(REG_RANGE, (temp & 0b11111100) | SET_RANGE_8G)
             self.factor = 8.192 * 2 / 2 ** 20
+        temp = self.dev_read_int(REG_RANGE)
+        if (temp & 0b11) == r and not self.dev_read_int(REG_POWER_CTL) & 0b1:
+            # Already set and measuring, e.g. after a WDT reset: skip the standby round trip and settling
+            return
+        self.stop()
+        self.dev_write(REG_RANGE, (temp & 0b11111100) | r)
         self.start()
         time.sleep(0.05)
 
+    def set_odr(self, odr=4000, hpf=SET_HPF_OFF):
+        """
+        Output data rate (a key of ODR_TO_BIT, the low-pass corner follows at ODR / 4)
+        and high-pass corner (SET_HPF_*). Filter changes are made in standby.
+        """
+        if odr not in ODR_TO_BIT:
+            raise ValueError("Unsupported ODR {}, use one of {}".format(odr, sorted(ODR_TO_BIT)))
+        self.stop()
+        self.dev_write(REG_FILTER, ((hpf & 0b111) << 4) | ODR_TO_BIT[odr])
+        self.odr = odr
+        self._hpf = hpf
+        self.start()
+
+    def set_hpf(self, hpf=SET_HPF_OFF):
+        self.set_odr(self.odr, hpf)
+
+    def reinit(self):
+        self.setrange(self._range)
+        self.set_odr(self.odr, self._hpf)
+
+    def set_interrupts(self, int1=0, int2=0, active_high=True):
+        """
+        Route INT_* sources to the INT1/INT2 pins, e.g. set_interrupts(int1=INT_FULL).
+        """
+        self.dev_write(REG_INT_MAP, (int1 & 0x0F) | ((int2 & 0x0F) << INT2_SHIFT))
+        tmp = self.dev_read_int(REG_RANGE)
+        self.dev_write(REG_RANGE, (tmp | INT_POL_HIGH) if active_high else (tmp & ~INT_POL_HIGH & 0xFF))
+
+    def set_activity(self, axes=0b111, threshold=0, count=1):
+        """
+        Activity detection on the X/Y/Z axes (bits 0-2), threshold in 15.6 mg steps at 2g.
+        """
+        self.dev_write(REG_ACT_EN, axes & 0b111)
+        self.dev_write(REG_ACT_THRESH_H, (threshold >> 8) & 0xFF)
+        self.dev_write(REG_ACT_THRESH_L, threshold & 0xFF)
+        self.dev_write(REG_ACT_COUNT, count & 0xFF)
+
+    def start_irq(self, pin: machine.Pin, watermark=False, callback=None, samples=FIFO_MAX_ENTRIES):
+        """
+        Sample on interrupts instead of polling. pin is the GPIO wired to DRDY (or to
+        an INTx mapped to INT_RDY), or with watermark=True to an INTx mapped to
+        INT_FULL, with the FIFO watermark set to samples entries.
+        The IRQ handler only schedules the read (micropython.schedule), callback()
+        runs in thread context afterwards; it defaults to print / print_fifo.
+        """
+        self.stop_irq()
+        self._irq_watermark = watermark
+        self._irq_callback = callback if callback is not None else (self.print_fifo if watermark else self.print)
+        if watermark:
+            self.set_fifo_samples(samples)
+        self._irq_pin = pin
+        pin.init(mode=machine.Pin.IN)
+        pin.irq(handler=self._irq, trigger=machine.Pin.IRQ_RISING)
+        if watermark:
+            # FIFO_FULL is a level, drain once so it drops and the next crossing gives an edge
+            self._irq(pin)
+
+    def stop_irq(self):
+        if self._irq_pin is not None:
+            self._irq_pin.irq(handler=None)
+            self._irq_pin = None
+
+    def _irq(self, pin):
+        try:
+            micropython.schedule(self._irq_task_ref, 0)
+        except RuntimeError:
+            # Schedule queue full, the previous read has not run yet
+            self.irq_overruns += 1
+
+    def _irq_task(self, arg):
+        self._irq_callback()
+
     def format_output(self):
         return "X:{} Y:{} Z:{}".format(*self.get3V())
 
@@ -112,16 +291,106 @@ class ADXL355(I2C):
         return res
 
     def get3V(self):
-        axis = []
-        data_raw = self.dev_read(REG_XDATA3, 9)
-        for datal in [data_raw[:3], data_raw[3:6], data_raw[6:]]:
-            low = (datal[2] >> 4)
-            mid = (datal[1] << 4)
-            high = (datal[0] << 12)
-            res = low | mid | high
-            axis.append(float(self.twocomp(res)) * self.factor)
+        """
+        Returns the device's [x, y, z] array, overwritten by the next call.
+        """
+        return decode_into(self.dev_read_into(REG_XDATA3, 9), 1, self._axis, self.factor)
+
+    def get3V_raw(self):
+        """
+        Returns the device's signed 20-bit [x, y, z] counts, overwritten by the next call.
+        """
+        return decode_raw_into(self.dev_read_into(REG_XDATA3, 9), 1, self._axis_raw)
+
+    def values(self):
+        return self.get3V()
+
+    def raw_values(self):
+        return self.get3V_raw()
+
+    def scaled_values(self):
+        axis, raw, factor = self._axis, self._axis_raw, self.factor
+        axis[0] = raw[0] * factor
+        axis[1] = raw[1] * factor
+        axis[2] = raw[2] * factor
         return axis
 
+    def set_fifo_samples(self, samples=FIFO_MAX_ENTRIES):
+        # Watermark in axis entries (3 per X/Y/Z sample), 1..96
+        self.dev_write(REG_FIFO_SAMPLES, max(1, min(samples, FIFO_MAX_ENTRIES)))
+
+    def fifo_entries(self) -> int:
+        return self.dev_read_int(REG_FIFO_ENTRIES) & 0x7F
+
+    def read_fifo_into(self, out, offset=0, scaled=True) -> int:
+        """
+        Drain the complete X/Y/Z triplets held in the FIFO with one multi-byte read
+        of REG_FIFO_DATA (the register pointer does not auto-increment there), as
+        many as fit in out after sample offset. Entries are realigned on the X-axis
+        marker, anything that cannot form a full triplet is dropped and counted in
+        fifo_resyncs. Samples are decoded in one batch into out, an array('f') of g
+        or with scaled=False an array('i') of counts, oldest first.
+        Returns the number of samples written.
+        """
+        entries = self.fifo_entries()
+        entries = min(entries - entries % 3, FIFO_MAX_ENTRIES, 3 * (len(out) // 3 - offset))
+        if entries < 3:
+            return 0
+
+        buf = self.reg_read_into(self._device, REG_FIFO_DATA, self._fifo_views[entries // 3])
+        n = self._fifo_align(buf, entries * 3)
+        if scaled:
+            decode_into(buf, n, out, self.factor, offset)
+        else:
+            decode_raw_into(buf, n, out, offset)
+        return n
+
+    def read_fifo(self):
+        """
+        Returns a list of [x, y, z] samples drained from the FIFO, oldest first.
+        See read_fifo_into for the allocation free version.
+        """
+        out = self._fifo_out
+        return [[out[i], out[i + 1], out[i + 2]] for i in range(0, 3 * self.read_fifo_into(out), 3)]
+
+    def print_fifo(self, *args):
+        try:
+            writer = self.frame_writer
+            scaled = writer is None or self.frame_scaled
+            out = self._fifo_out if scaled else self._fifo_raw
+            n = self.read_fifo_into(out, 0, scaled)
+            if writer is not None:
+                for i in range(0, 3 * n, 3):
+                    writer.write(self.sensor_id, out, scaled, None, i, 3)
+            else:
+                for i in range(0, 3 * n, 3):
+                    print("X:{} Y:{} Z:{}".format(out[i], out[i + 1], out[i + 2]))
+            self.wdt.feed()
+        except Exception as e:
+            print(e)
+            self.led.on()
+
+    def _fifo_align(self, buf, nbytes) -> int:
+        """
+        Move every complete X/Y/Z triplet of buf[:nbytes] to the front of buf in
+        place and return how many there are. Only a misaligned FIFO copies.
+        """
+        i = 0
+        n = 0
+        end = nbytes - 8
+        while i < end:
+            if (buf[i + 2] & (FIFO_X_MARKER | FIFO_EMPTY)) != FIFO_X_MARKER \
+                    or (buf[i + 5] | buf[i + 8]) & (FIFO_X_MARKER | FIFO_EMPTY):
+                self.fifo_resyncs += 1
+                i += 3
+                continue
+            if i != 9 * n:
+                for k in range(9):
+                    buf[9 * n + k] = buf[i + k]
+            n += 1
+            i += 9
+        return n
+
     def twocomp(self, value):
         if 0x80000 & value:
             ret = - (0x0100000 - value)
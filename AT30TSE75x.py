@@ -1,3 +1,5 @@
+import time
+from array import array
 from micropython import const
 from i2c_helper import I2C
 
@@ -17,13 +19,24 @@ class AT30TSE75x(I2C):
     ------
 
     RA - Registry address
+
+    The chip keeps its register pointer between transfers, so once it points at
+    RA_TEMPERATURE a reading is a plain 2-byte read without the pointer write
+    (fast_read, on by default). Every register access through this driver updates
+    the tracked pointer; call invalidate_pointer() after touching the chip otherwise.
     """
+    CHANNELS = ("T",)
     STEP_12BIT = 0.0625
 
     RA_TEMPERATURE = const(0x00)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Register the chip's pointer was last set to, None when unknown
+        self._pointer = None
+        self.fast_read = kwargs.get("fast_read", True)
+        self._raw = array('i', (0,))
+        self._values = array('f', (0.0,))
         self.set_to_12bit()
 
     def read_temp1(self, n_bytes=2):
@@ -37,24 +50,85 @@ class AT30TSE75x(I2C):
         return celcius_temperature
 
     def read_temp(self, n_bytes=2):
-        raw_temperature = self.read_temp_raw(n_bytes=n_bytes, return_int=False)
+        return self.read_temp_counts(n_bytes) * self.STEP_12BIT
+
+    def read_temp_counts(self, n_bytes=2) -> int:
+        """
+        Signed temperature in 12-bit steps of STEP_12BIT degrees.
+        """
+        if self.fast_read and self._pointer == self.RA_TEMPERATURE:
+            raw_temperature = self._read_latched_into(self._rviews[n_bytes])
+        else:
+            raw_temperature = self.dev_read_into(self.RA_TEMPERATURE, n_bytes)
 
         temp_raw = (raw_temperature[0] << 8 | raw_temperature[1]) >> 4
         if temp_raw & 0x800:
-            temp_c = (temp_raw - 0x1000) * 0.0625
-        else:
-            temp_c = temp_raw * 0.0625
-        return temp_c
+            temp_raw -= 0x1000
+        return temp_raw
+
+    def invalidate_pointer(self):
+        self._pointer = None
+
+    def _read_latched_into(self, buf):
+        start = time.ticks_us()
+        try:
+            self._i2c.readfrom_into(self._device, buf)
+            self.stats.record(start, len(buf), 0)
+            return buf
+        except OSError as e:
+            # Retry through the register path, which sets the pointer again
+            self._pointer = None
+            self.stats.error(e)
+            return self.reg_read_into(self._device, self.RA_TEMPERATURE, buf)
+
+    # Register accesses move the chip's pointer, track it (unknown while a transfer fails)
+    def reg_read(self, add, reg, nbytes=1) -> bytes:
+        self._pointer = None
+        data = super().reg_read(add, reg, nbytes)
+        self._pointer = reg
+        return data
+
+    def reg_read_into(self, add, reg, buf):
+        self._pointer = None
+        data = super().reg_read_into(add, reg, buf)
+        self._pointer = reg
+        return data
+
+    def reg_write(self, addr, reg, data):
+        self._pointer = None
+        super().reg_write(addr, reg, data)
+        self._pointer = reg
+
+    def dev_write_from(self, reg, data):
+        self._pointer = None
+        super().dev_write_from(reg, data)
+        self._pointer = reg
+
+    def values(self):
+        self._values[0] = self.read_temp()
+        return self._values
+
+    def raw_values(self):
+        self._raw[0] = self.read_temp_counts()
+        return self._raw
+
+    def scaled_values(self):
+        self._values[0] = self._raw[0] * self.STEP_12BIT
+        return self._values
 
     def set_to_12bit(self):
         self.dev_write(0xAC, 0x80)
 
+    def reinit(self):
+        self._pointer = None
+        self.set_to_12bit()
+
     @property
     def temp(self):
         return self.read_temp()
 
     def format_output(self):
-        return "T:{temp} Add:{address}".format(temp=self.read_temp(), address=self._device & 0x7)
+        return "T:{temp} Add:{address}".format(temp=self.read_temp(), address=self.sensor_id)
 
     def read_temp_raw(self, n_bytes=2, return_int=True):
         if return_int:
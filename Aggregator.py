@@ -0,0 +1,111 @@
+import math
+import time
+from array import array
+
+# Statistics of each channel in a summary, followed after the last channel by the sample count
+SUMMARY_STATS = ("mean", "min", "max", "rms")
+
+
+class Aggregator:
+    """
+    Streaming per-channel mean, min, max and RMS over consecutive windows, so a
+    sensor can be read at its full rate while only one summary per window is sent.
+    Mean and variance are kept with Welford's update and RMS follows from them
+    (sqrt(mean^2 + variance)), so no samples are stored. Inputs are raw counts,
+    factor scales the summary.
+
+    A window closes after window_samples samples or, when that is 0, at the first
+    add after window_ms since its first sample. The last closed window stays in
+    summary (SUMMARY_STATS per channel, then the count) until the next one closes,
+    on_window(aggregator) is called for each.
+    """
+    on_window = None
+
+    def __init__(self, channels=3, window_samples=0, window_ms=1000, factor=1.0):
+        self.channels = channels
+        self.window_samples = window_samples
+        self.window_ms = window_ms
+        self.factor = factor
+        self.summary = array('f', bytes(4 * (len(SUMMARY_STATS) * channels + 1)))
+        self.summary_ticks = 0
+        self.windows = 0
+        self._mean = array('f', bytes(4 * channels))
+        self._m2 = array('f', bytes(4 * channels))
+        self._min = array('i', bytes(4 * channels))
+        self._max = array('i', bytes(4 * channels))
+        self._count = 0
+        self._start_ms = 0
+
+    def add(self, values, offset=0) -> bool:
+        """
+        Add the sample in values[offset:offset + channels], True when it closed a window.
+        """
+        return self.add_into(values, 1, offset) > 0
+
+    def add_into(self, data, n, offset=0) -> int:
+        """
+        Add n samples laid out one after the other in data from sample offset, as
+        ADXL355.read_fifo_into(scaled=False) leaves them. Returns the windows closed.
+        """
+        channels = self.channels
+        mean, m2, lo, hi = self._mean, self._m2, self._min, self._max
+        closed = 0
+        pos = offset * channels
+        end = pos + n * channels
+        while pos < end:
+            if not self._count:
+                self._start_ms = time.ticks_ms()
+                for c in range(channels):
+                    x = data[pos + c]
+                    lo[c] = x
+                    hi[c] = x
+                    mean[c] = 0.0
+                    m2[c] = 0.0
+            self._count += 1
+            count = self._count
+            for c in range(channels):
+                x = data[pos + c]
+                if x < lo[c]:
+                    lo[c] = x
+                elif x > hi[c]:
+                    hi[c] = x
+                delta = x - mean[c]
+                mean[c] += delta / count
+                m2[c] += delta * (x - mean[c])
+            pos += channels
+            if self.window_samples:
+                if count >= self.window_samples:
+                    self._close()
+                    closed += 1
+            elif time.ticks_diff(time.ticks_ms(), self._start_ms) >= self.window_ms:
+                self._close()
+                closed += 1
+        return closed
+
+    def _close(self):
+        summary = self.summary
+        factor = self.factor
+        count = self._count
+        stats = len(SUMMARY_STATS)
+        for c in range(self.channels):
+            mean = self._mean[c]
+            summary[stats * c] = mean * factor
+            summary[stats * c + 1] = self._min[c] * factor
+            summary[stats * c + 2] = self._max[c] * factor
+            summary[stats * c + 3] = math.sqrt(mean * mean + self._m2[c] / count) * factor
+        summary[stats * self.channels] = count
+        self.summary_ticks = time.ticks_us()
+        self.windows += 1
+        self._count = 0
+        if self.on_window is not None:
+            self.on_window(self)
+
+    def reset(self):
+        """
+        Drop the window in progress.
+        """
+        self._count = 0
+
+    @property
+    def pending(self) -> int:
+        return self._count
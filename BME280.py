@@ -1,4 +1,7 @@
 import time
+from array import array
+import ujson
+import ustruct
 from micropython import const
 from i2c_helper import I2C
 
@@ -41,177 +44,379 @@ BMX280_REGISTER_CONFIG = const(0xF5)  # IIR filter config
 
 BMX280_REGISTER_DATA = const(0xF7)
 
+BMX280_MODE_SLEEP = const(0)
+BMX280_MODE_FORCED = const(1)
+BMX280_MODE_NORMAL = const(3)
+
+# Normal mode standby time between conversions (t_sb, ms)
+BMX280_STANDBY_0_5 = const(0)
+BMX280_STANDBY_62_5 = const(1)
+BMX280_STANDBY_125 = const(2)
+BMX280_STANDBY_250 = const(3)
+BMX280_STANDBY_500 = const(4)
+BMX280_STANDBY_1000 = const(5)
+BMX280_STANDBY_10 = const(6)  # 2000 ms on the BMP280
+BMX280_STANDBY_20 = const(7)  # 4000 ms on the BMP280
+
+# IIR filter coefficient
+BMX280_IIR_OFF = const(0)
+BMX280_IIR_2 = const(1)
+BMX280_IIR_4 = const(2)
+BMX280_IIR_8 = const(3)
+BMX280_IIR_16 = const(4)
+
 BMX280_BMP_CHIP_ID = const(0x58)  # temperature and pressure
 BMX280_BME_CHIP_ID = const(0x60)  # temperature pressure and humidity
 
+# Calibration block layout, 0x88-0xA1 followed by 0xE1-0xE7 (BME280 only)
+# < little-endian, H/h unsigned/signed short, B/b unsigned/signed char, x reserved 0xA0
+BMX280_CALIBRATION_FORMAT = "<HhhHhhhhhhhh"
+BME280_CALIBRATION_FORMAT = BMX280_CALIBRATION_FORMAT + "xBhBbBbb"
+BMX280_CALIBRATION_SIZE = const(24)
+BME280_CALIBRATION_SIZE = const(33)
+
+
+def read_calibration_cache(path) -> dict:
+    try:
+        with open(path) as f:
+            return ujson.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_calibration_cache(path, key, block):
+    cache = read_calibration_cache(path)
+    cache[key] = list(block)
+    with open(path, "w") as f:
+        ujson.dump(cache, f)
+
+
+# Compensation coefficients as stored in the array('i') used below, H1-H6 on the BME280 only
+CAL_T1 = const(0)
+CAL_P1 = const(3)
+CAL_H1 = const(12)
+CAL_SIZE_BMP = const(12)
+CAL_SIZE_BME = const(18)
+
+
+def calibration_array(block) -> array:
+    """
+    Unpack a calibration block (0x88-0xA1, plus 0xE1-0xE7 on the BME280) into the
+    T1-T3, P1-P9[, H1-H6] coefficient array taken by the compensate_* functions.
+    """
+    if len(block) == BME280_CALIBRATION_SIZE:
+        cal = ustruct.unpack(BME280_CALIBRATION_FORMAT, block)
+        e4, e5, e6 = cal[15], cal[16], cal[17]
+        # H4 and H5 are 12-bit values sharing the nibbles of 0xE5
+        return array('i', cal[:15] + ((e4 << 4) | (e5 & 0x0F), (e6 << 4) | (e5 >> 4), cal[18]))
+    return array('i', ustruct.unpack(BMX280_CALIBRATION_FORMAT, block[:BMX280_CALIBRATION_SIZE]))
+
+
+# Integer compensation from the datasheet (4.2.3 and 8.2), no floats anywhere.
+# Pressure follows the 64-bit reference, which uses long ints on MicroPython.
+
+def compensate_t_fine(cal, adc_t) -> int:
+    t1 = cal[CAL_T1]
+    var1 = (((adc_t >> 3) - (t1 << 1)) * cal[CAL_T1 + 1]) >> 11
+    var2 = (((((adc_t >> 4) - t1) * ((adc_t >> 4) - t1)) >> 12) * cal[CAL_T1 + 2]) >> 14
+    return var1 + var2
+
+
+def compensate_pressure(cal, adc_p, t_fine) -> int:
+    """
+    Pressure in Pa as Q24.8 (Pa * 256), 0 if the calibration cannot produce one.
+    """
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * cal[CAL_P1 + 5]
+    var2 += (var1 * cal[CAL_P1 + 4]) << 17
+    var2 += cal[CAL_P1 + 3] << 35
+    var1 = ((var1 * var1 * cal[CAL_P1 + 2]) >> 8) + ((var1 * cal[CAL_P1 + 1]) << 12)
+    var1 = (((1 << 47) + var1) * cal[CAL_P1]) >> 33
+    if var1 == 0:
+        return 0
+    p = 1048576 - adc_p
+    p = (((p << 31) - var2) * 3125) // var1
+    var1 = (cal[CAL_P1 + 8] * (p >> 13) * (p >> 13)) >> 25
+    var2 = (cal[CAL_P1 + 7] * p) >> 19
+    return ((p + var1 + var2) >> 8) + (cal[CAL_P1 + 6] << 4)
+
+
+def compensate_humidity(cal, adc_h, t_fine) -> int:
+    """
+    Relative humidity in % as Q22.10 (%RH * 1024), 0 without humidity coefficients.
+    """
+    if len(cal) < CAL_SIZE_BME:
+        return 0
+    v = t_fine - 76800
+    v = ((((adc_h << 14) - (cal[CAL_H1 + 3] << 20) - (cal[CAL_H1 + 4] * v)) + 16384) >> 15) * \
+        (((((((v * cal[CAL_H1 + 5]) >> 10) * (((v * cal[CAL_H1 + 2]) >> 11) + 32768)) >> 10) + 2097152) *
+          cal[CAL_H1 + 1] + 8192) >> 14)
+    v -= ((((v >> 15) * (v >> 15)) >> 7) * cal[CAL_H1]) >> 4
+    if v < 0:
+        v = 0
+    elif v > 419430400:
+        v = 419430400
+    return v >> 12
+
+
+def compensate_into(cal, raw, out, n=1, offset=0):
+    """
+    Compensate n raw (p, t, h) triples starting at raw[offset] (e.g. a raw sample
+    store) into out at the same positions: Pa * 256, 0.01 degC and %RH * 1024.
+    """
+    end = offset + 3 * n
+    i = offset
+    while i < end:
+        t_fine = compensate_t_fine(cal, raw[i + 1])
+        out[i] = compensate_pressure(cal, raw[i], t_fine)
+        out[i + 1] = (t_fine * 5 + 128) >> 8
+        out[i + 2] = compensate_humidity(cal, raw[i + 2], t_fine)
+        i += 3
+    return out
+
 
 class BME280(I2C):
+    CHANNELS = ("P", "T", "H")
+    BUFFER_SIZE = 8
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._chip_id = self.chip_id
+        # Optional flash file holding calibration blocks keyed by bus, address and chip ID
+        self._calibration_cache = kwargs.get("calibration_cache", None)
 
-        self._buf1 = bytearray(1)
-        self._buf2 = bytearray(2)
         self._load_calibration()
 
         self._t_os = BMX280_OS_2  # temperature oversampling
         self._p_os = BMX280_OS_16  # pressure oversampling
-        self._h_os = BMX280_OS_2  # pressure oversampling
-
-        self._t_raw = 0
-        self._t_fine = 0
-        self._t = 0
-
-        self._p_raw = 0
-        self._p = 0
-
-        self._h_raw = 0
-        self._h = 0
-
-        self.dev_read_wait_ms = 100
+        self._h_os = BMX280_OS_2  # humidity oversampling
+
+        # Latest (p, t, h) conversion and its compensation, see fixed_values()
+        self._raw = array('i', (0, 0, 0))
+        self._fixed = array('i', (0, 0, 0))
+        self._values = array('f', (0, 0, 0))
+        self._compensated = False
+
+        self._delay_us = self._calc_delay_us(self._t_os, self._p_os, self._h_os)
+        self._pending = False
+        self._ready_us = 0
+        self._has_data = False
         self._new_read_ms = 200
         self._last_read_ts = 0
+        # ticks_us the latest conversion was measured at, see sample_ticks()
+        self._sample_us = 0
+
+        if kwargs.get("mode", BMX280_MODE_FORCED) == BMX280_MODE_NORMAL:
+            self.set_mode_normal(kwargs.get("standby", BMX280_STANDBY_62_5), kwargs.get("iir", BMX280_IIR_OFF))
+        else:
+            self.set_mode_forced()
 
     @staticmethod
-    def __calc_delay(sampling) -> float:
-        t_delay = 0.000575 + 0.0023 * (1 << sampling)
-        h_delay = 0.000575 + 0.0023 * (1 << sampling)
-        p_delay = 0.001250 + 0.0023 * (1 << sampling)
-        return t_delay + h_delay + p_delay
+    def _calc_delay_us(t_os, p_os, h_os) -> int:
+        # Maximum measurement time from the datasheet (9.1), (1 << os) >> 1 is the oversampling ratio
+        delay = 1250 + 2300 * ((1 << t_os) >> 1)
+        if p_os:
+            delay += 575 + 2300 * ((1 << p_os) >> 1)
+        if h_os:
+            delay += 575 + 2300 * ((1 << h_os) >> 1)
+        return delay
+
+    def _ctrl_meas(self, mode) -> int:
+        return (self._t_os << 5) | (self._p_os << 2) | mode
+
+    def set_mode_forced(self):
+        self._mode = BMX280_MODE_FORCED
+        self.dev_write_from(BMX280_REGISTER_CONTROL, self._ctrl_meas(BMX280_MODE_SLEEP))
+        if self._chip_id != BMX280_BMP_CHIP_ID:
+            self.dev_write_from(BMX280_REGISTER_HUMIDITY_CONTROL, self._h_os)
+
+    def set_mode_normal(self, standby=BMX280_STANDBY_62_5, iir=BMX280_IIR_OFF):
+        """
+        Let the chip convert continuously, every read is then a single data burst.
+        The config register is only writable in sleep mode.
+        """
+        self._mode = BMX280_MODE_NORMAL
+        self._standby = standby
+        self._iir = iir
+        self._pending = False
+        self.dev_write_from(BMX280_REGISTER_CONTROL, self._ctrl_meas(BMX280_MODE_SLEEP))
+        self.dev_write_from(BMX280_REGISTER_CONFIG, (standby << 5) | (iir << 2))
+        if self._chip_id != BMX280_BMP_CHIP_ID:
+            self.dev_write_from(BMX280_REGISTER_HUMIDITY_CONTROL, self._h_os)
+        self.dev_write_from(BMX280_REGISTER_CONTROL, self._ctrl_meas(BMX280_MODE_NORMAL))
+        self._ready_us = time.ticks_add(time.ticks_us(), self._delay_us)
+        self._has_data = False
+
+    def reinit(self):
+        self._pending = False
+        if self._mode == BMX280_MODE_NORMAL:
+            self.set_mode_normal(self._standby, self._iir)
+        else:
+            self.set_mode_forced()
+
+    def trigger(self) -> int:
+        """
+        Start a forced mode conversion, returns the microseconds until collect() has data.
+        """
+        self.dev_write_from(BMX280_REGISTER_CONTROL, self._ctrl_meas(BMX280_MODE_FORCED))
+        self._pending = True
+        self._ready_us = time.ticks_add(time.ticks_us(), self._delay_us)
+        return self._delay_us
+
+    def prepare(self):
+        """
+        In forced mode trigger a conversion for the next read to hand out, so it is
+        made now rather than at the previous read; None in normal mode.
+        """
+        if self._mode == BMX280_MODE_NORMAL:
+            return None
+        delay = self.trigger()
+        # Expire the cached conversion so the next read collects this one
+        self._last_read_ts = time.ticks_add(time.ticks_ms(), -self._new_read_ms - 1)
+        return delay
+
+    def ready(self) -> bool:
+        return time.ticks_diff(time.ticks_us(), self._ready_us) >= 0
+
+    def collect(self) -> bool:
+        """
+        Burst-read the latest conversion, False while a triggered one is still running.
+        """
+        if self._pending and not self.ready():
+            return False
+        self._pending = False
+
+        raw = self._raw
+        if self._chip_id == BMX280_BMP_CHIP_ID:
+            d = self.dev_read_into(BMX280_REGISTER_DATA, 6)
+        else:
+            d = self.dev_read_into(BMX280_REGISTER_DATA, 8)
+            raw[2] = (d[6] << 8) + d[7]
+        raw[0] = (d[0] << 12) + (d[1] << 4) + (d[2] >> 4)
+        raw[1] = (d[3] << 12) + (d[4] << 4) + (d[5] >> 4)
+
+        if self._mode == BMX280_MODE_NORMAL:
+            # The latest of the continuous conversions, at most a standby period old
+            self._sample_us = time.ticks_us()
+        else:
+            # Middle of the forced conversion, which ended by _ready_us
+            self._sample_us = time.ticks_add(self._ready_us, -(self._delay_us >> 1))
+        self._has_data = True
+        self._last_read_ts = time.ticks_ms()
+        self._compensated = False
+        return True
+
+    def sample_ticks(self):
+        # values() hands out a cached or pipelined conversion, not one made by the read
+        return self._sample_us if self._has_data else None
 
     def format_output(self):
         return "P:{} T:{} H:{}".format(*self.parse_raw())
 
     def _load_calibration(self):
-        # read calibration data
-        # < little-endian
-        # H unsigned short
-        # h signed short
-        self._T1 = self.to_unsigned_short(self.dev_read(BMX280_REGISTER_DIG_T1, 2))
-        self._T2 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_T2, 2))
-        self._T3 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_T3, 2))
-        self._P1 = self.to_unsigned_short(self.dev_read(BMX280_REGISTER_DIG_P1, 2))
-        self._P2 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P2, 2))
-        self._P3 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P3, 2))
-        self._P4 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P4, 2))
-        self._P5 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P5, 2))
-        self._P6 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P6, 2))
-        self._P7 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P7, 2))
-        self._P8 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P8, 2))
-        self._P9 = self.to_signed_short(self.dev_read(BMX280_REGISTER_DIG_P9, 2))
-
-        if self._chip_id == BMX280_BME_CHIP_ID:
-            self._H1 = self.to_signed_int(self.dev_read(BME280_REGISTER_DIG_H1, 1))
-            self._H2 = self.to_signed_short(self.dev_read(BME280_REGISTER_DIG_H2, 2))
-            self._H3 = self.to_signed_int(self.dev_read(BME280_REGISTER_DIG_H3, 1))
-            self._H6 = self.to_signed_int(self.dev_read(BME280_REGISTER_DIG_H7, 1))
-
-            h4 = self.to_signed_int(self.dev_read(BME280_REGISTER_DIG_H4, 1))
-            h4 = (h4 << 24) >> 20
-            self._H4 = h4 | (
-                    self.to_signed_int(self.dev_read(BME280_REGISTER_DIG_H5, 1)) & 0x0F)
-
-            h5 = self.to_signed_int(self.dev_read(BME280_REGISTER_DIG_H6, 1))
-            h5 = (h5 << 24) >> 20
-            self._H5 = h5 | (
-                    self.to_signed_int(self.dev_read(BME280_REGISTER_DIG_H5, 1)) >> 4 & 0x0F)
+        block = None
+        key = "{}:{}:{}".format(self._bus, hex(self._device), hex(self._chip_id))
+        if self._calibration_cache:
+            block = read_calibration_cache(self._calibration_cache).get(key)
+        if block is None:
+            # Two bursts: 0x88-0xA1 (T1-T3, P1-P9, H1) and 0xE1-0xE7 (H2-H6)
+            if self._chip_id == BMX280_BME_CHIP_ID:
+                block = self.dev_read(BMX280_REGISTER_DIG_T1, 26) + self.dev_read(BME280_REGISTER_DIG_H2, 7)
+            else:
+                block = self.dev_read(BMX280_REGISTER_DIG_T1, BMX280_CALIBRATION_SIZE)
+            if self._calibration_cache:
+                write_calibration_cache(self._calibration_cache, key, block)
+        self._unpack_calibration(bytes(block))
+
+    def _unpack_calibration(self, block):
+        self._cal = calibration_array(block)
+
+    def calibration(self) -> array:
+        """
+        Compensation coefficients for compensate_into, e.g. to replay raw logs.
+        """
+        return self._cal
 
     def parse_raw(self):
         return [self.pressure/100., self.temperature, self.humidity]
 
-    def _gauge(self):
-        now = time.ticks_ms()
-        if time.ticks_diff(now, self._last_read_ts) > self._new_read_ms:
-            self._last_read_ts = now
+    def values(self):
+        """
+        Returns the [hPa, C, %rH] array, overwritten by the next call (humidity 0 on a BMP280).
+        """
+        fixed = self.fixed_values()
+        out = self._values
+        out[0] = fixed[0] / 25600.
+        out[1] = fixed[1] / 100.
+        out[2] = fixed[2] / 1024.
+        return out
+
+    def raw_values(self):
+        """
+        Returns the device's raw [p, t, h] array, overwritten by the next conversion.
+        """
+        self._gauge()
+        return self._raw
 
-            if self._chip_id != BMX280_BMP_CHIP_ID:
-                self.dev_write(BMX280_REGISTER_HUMIDITY_CONTROL, self._h_os)
+    def scaled_values(self):
+        # Compensates the cached conversion, _gauge() does not read again this soon
+        return self.values()
 
-            r = self._t_os + (self._p_os << 3) + (1 << 6)
-            self.dev_write(BMX280_REGISTER_CONTROL, r)
+    def fixed_values(self):
+        """
+        Returns the compensated [p, t, h] in the datasheet's integer units (Pa * 256,
+        0.01 degC, %RH * 1024), overwritten by the next conversion.
+        """
+        self._gauge()
+        if not self._compensated:
+            compensate_into(self._cal, self._raw, self._fixed)
+            self._compensated = True
+        return self._fixed
 
-            time.sleep_ms(100)
+    def compensate_into(self, raw, out, n=1, offset=0):
+        """
+        Batch version of fixed_values() for n raw triples captured from this device.
+        """
+        return compensate_into(self._cal, raw, out, n, offset)
 
-            if self._chip_id == BMX280_BMP_CHIP_ID:
-                d = self.dev_read(BMX280_REGISTER_DATA, 6)
-                self._p_raw = (d[0] << 12) + (d[1] << 4) + (d[2] >> 4)
-                self._t_raw = (d[3] << 12) + (d[4] << 4) + (d[5] >> 4)
-            else:
-                d = self.dev_read(BMX280_REGISTER_DATA, 8)
-                self._p_raw = (d[0] << 12) + (d[1] << 4) + (d[2] >> 4)
-                self._t_raw = (d[3] << 12) + (d[4] << 4) + (d[5] >> 4)
-                self._h_raw = (d[6] << 8) + d[7]
-
-            self._t_fine = 0
-            self._t = 0
-            self._h = 0
-            self._p = 0
-
-    def _calc_t_fine(self):
-        # From datasheet page 22
-        self._gauge()
-        if self._t_fine == 0:
-            var1 = (((self._t_raw >> 3) - (self._T1 << 1)) * self._T2) >> 11
-            var2 = (((((self._t_raw >> 4) - self._T1) * ((self._t_raw >> 4) - self._T1)) >> 12) * self._T3) >> 14
-            self._t_fine = var1 + var2
-        return self._t_fine
+    def _gauge(self):
+        if self._has_data and time.ticks_diff(time.ticks_ms(), self._last_read_ts) <= self._new_read_ms:
+            return
+
+        if self._mode == BMX280_MODE_NORMAL:
+            if not self._has_data and not self.ready():
+                time.sleep_us(time.ticks_diff(self._ready_us, time.ticks_us()))
+            self.collect()
+        elif not self._has_data:
+            # Nothing to report yet, wait for the first conversion once and start the
+            # next right away, so every later call hands out a new conversion
+            if not self._pending:
+                self.trigger()
+            time.sleep_us(max(0, time.ticks_diff(self._ready_us, time.ticks_us())))
+            self.collect()
+            self.trigger()
+        elif not self._pending:
+            # Nothing in flight (reinit), keep the last conversion until the new one is in
+            self.trigger()
+        elif self.collect():
+            # Pipelined: hand out the conversion started by the previous call and start the next one
+            self.trigger()
 
     @property
     def humidity(self):
-        if self._chip_id == BMX280_BME_CHIP_ID and self._h == 0:
-            # OLD METHOD (NON_RELATIVE)
-            # var1 = self._calc_t_fine() - 76800
-            # var1 = (((((self._h_raw << 14) - (self._H5 << 20) - (self._H5 * var1)) +
-            #           16384) >> 15) * (((((((var1 * self._H6) >> 10) * (((var1 *
-            #                                                               self._H3) >> 11) + 32768)) >> 10) + 2097152) *
-            #                             self._H2 + 8192) >> 14))
-            # var1 = var1 - (((((var1 >> 15) * (var1 >> 15)) >> 7) * self._H1) >> 4)
-            # var1 = 0 if var1 < 0 else var1
-            # var1 = 419430400 if var1 > 419430400 else var1
-            # return var1 >> 12
-
-            res = self._calc_t_fine() - 76800
-            res = (self._h_raw - (self._H4 * 64.0 + self._H5 / 16384.0 * res)) * (
-                        self._H2 / 65536.0 * (
-                            1.0 + self._H6 / 67108864.0 * res * (1.0 + self._H3 / 67108864.0 * res)))
-            res = res * (1.0 - (self._H1 * res / 524288.0))
-            self._h = max(0.0, min(res, 100.0))
-        else:
+        if self._chip_id != BMX280_BME_CHIP_ID:
             print("This is a BMP not a BME, therefore it cannot measure humidity! :(")
-            self._h = 0
-        return self._h
+            return 0
+        return self.fixed_values()[2] / 1024.
 
     @property
     def temperature(self):
-        self._calc_t_fine()
-        if self._t == 0:
-            self._t = ((self._t_fine * 5 + 128) >> 8) / 100.
-        return self._t
+        return self.fixed_values()[1] / 100.
 
     @property
     def pressure(self):
-        # From datasheet page 22 (BMP) /25 (BME)
-        self._calc_t_fine()
-        if self._p == 0:
-            var1 = self._t_fine - 128000
-            var2 = var1 * var1 * self._P6
-            var2 = var2 + ((var1 * self._P5) << 17)
-            var2 = var2 + (self._P4 << 35)
-            var1 = ((var1 * var1 * self._P3) >> 8) + ((var1 * self._P2) << 12)
-            var1 = (((1 << 47) + var1) * self._P1) >> 33
-
-            if var1 == 0:
-                return 0
-
-            p = 1048576 - self._p_raw
-            p = int((((p << 31) - var2) * 3125) / var1)
-            var1 = (self._P9 * (p >> 13) * (p >> 13)) >> 25
-            var2 = (self._P8 * p) >> 19
-
-            p = ((p + var1 + var2) >> 8) + (self._P7 << 4)
-            self._p = p / 256.0
-        return self._p
+        return self.fixed_values()[0] / 256.
 
     @property
     def chip_id(self):
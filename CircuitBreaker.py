@@ -0,0 +1,54 @@
+import time
+
+
+class CircuitBreaker:
+    """
+    Quarantine for one failing sensor. threshold consecutive failures open the
+    breaker: the sensor is skipped, costing the bus nothing, until retry_due().
+    The owner then probes it and either calls half_open(), letting the next read
+    through as a trial that closes the breaker on success, or failure() again.
+    Every reopening doubles the wait, up to max_backoff_ms.
+    """
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+    def __init__(self, threshold=3, backoff_ms=1000, max_backoff_ms=60000):
+        self.threshold = threshold
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.skipped = 0
+        self._wait_ms = backoff_ms
+        self._retry_ms = 0
+
+    def success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._wait_ms = self.backoff_ms
+
+    def failure(self) -> bool:
+        """
+        Count a failed read or probe, True when it (re)opened the breaker.
+        """
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures < self.threshold:
+            return False
+        if self.state != self.OPEN:
+            self.trips += 1
+        self.state = self.OPEN
+        self._retry_ms = time.ticks_add(time.ticks_ms(), self._wait_ms)
+        self._wait_ms = min(2 * self._wait_ms, self.max_backoff_ms)
+        return True
+
+    def retry_due(self) -> bool:
+        return time.ticks_diff(time.ticks_ms(), self._retry_ms) >= 0
+
+    def half_open(self):
+        self.state = self.HALF_OPEN
+
+    def stats(self) -> dict:
+        return {"state": ("closed", "open", "half_open")[self.state], "failures": self.failures,
+                "trips": self.trips, "skipped": self.skipped}
@@ -0,0 +1,395 @@
+import _thread
+import errno
+import os
+import sys
+import time
+import ustruct
+from array import array
+from micropython import const
+import micropython
+
+from frame_helper import CRC16_TABLE, crc16
+
+# Log files are a sequence of BLOCK_SIZE blocks, all little-endian:
+#   0  magic    4s   BLOCK_MAGIC
+#   4  seq      u32  block sequence number, continues across files and reboots
+#   8  used     u16  payload bytes in use, the rest of the block is 0xFF padding
+#   10 crc      u16  CRC-16/CCITT-FALSE over the used payload
+#   12 records  each a record header followed by its samples:
+#        sensor  u8   (bus << 7) | I2C address
+#        flags   u8   bits 0-3 channel count, LOG_SCALED set for float32 values, int32 raw otherwise,
+#                     LOG_SUMMARY for Aggregator window summaries (mean, min, max, rms per channel,
+#                     then the sample count, all counted as channels)
+#        count   u16  samples in the record
+#        ticks   u32  ticks_us of the first sample when period_us is set
+#        period  u32  us between samples, 0 when a u32 ticks_us lane (count entries) precedes the values
+#        values  count * channels * 4 bytes, sample after sample
+BLOCK_MAGIC = b"\xd1LOG"
+BLOCK_HEADER = "<4sIHH"
+BLOCK_HEADER_SIZE = const(12)
+BLOCK_SIZE = const(4096)
+RECORD_HEADER = "<BBHII"
+RECORD_HEADER_SIZE = const(12)
+LOG_SCALED = const(0x10)
+LOG_SUMMARY = const(0x20)
+LOG_CHANNELS_MASK = const(0x0F)
+# Largest FIFO drain log_fifo handles, in values (the ADXL355 holds 96 entries)
+FIFO_VALUES = const(96)
+
+try:
+    @micropython.viper
+    def _crc16_viper(buf: ptr8, start: int, end: int, table: ptr16) -> int:
+        crc = 0xFFFF
+        i = start
+        while i < end:
+            crc = ((crc << 8) & 0xFF00) ^ table[((crc >> 8) ^ buf[i]) & 0xFF]
+            i += 1
+        return crc
+except NameError:
+    _crc16_viper = None
+
+
+def block_crc(buf, start, end) -> int:
+    if _crc16_viper is not None:
+        return _crc16_viper(buf, start, end, CRC16_TABLE)
+    return crc16(buf, start, end)
+
+
+class DataLogger:
+    """
+    Append-only sample log on the board's filesystem, for when nobody is reading
+    the USB output. Samples are packed into a RAM block and only whole blocks are
+    written, each followed by a flush so a reset loses at most the block being
+    filled (sync() bounds its age). Files are rotated every file_blocks blocks
+    and the oldest is deleted beyond max_files.
+
+    After a reset the newest file's last block is checked: if it is torn (size not
+    a multiple of BLOCK_SIZE or a bad CRC) logging continues in a new file, which
+    the host reader (host/logfile.py) handles by skipping bad blocks. Sequence
+    numbers continue from the newest valid block, in an older file when the newest
+    is empty (just rotated). Writing a block blocks the caller for the flash
+    program time, see stats(); a block that can not be written even after making
+    room is dropped.
+    The public methods hold a lock, so log_fifo may run on core 1 (DualCore) while
+    core 0 flushes and syncs.
+    """
+    SUFFIX = ".log"
+
+    def __init__(self, directory="log", file_blocks=64, max_files=4, max_age_ms=5000, wdt=None):
+        self.directory = directory
+        self.file_blocks = file_blocks
+        self.max_files = max_files
+        self.max_age_ms = max_age_ms
+        self._wdt = wdt
+        self._lock = _thread.allocate_lock()
+        self._block = bytearray(BLOCK_SIZE)
+        self._pad = memoryview(b"\xff" * BLOCK_SIZE)
+        self._pos = BLOCK_HEADER_SIZE
+        self._block_ms = 0
+        self._file = None
+        self._file_index = 0
+        self._file_written = 0
+        self._seq = 0
+        self._fifo_f = array('f', bytes(4 * FIFO_VALUES))
+        self._fifo_i = array('i', bytes(4 * FIFO_VALUES))
+        # Sample packing state for RingBuffer.drain, bound once
+        self._ts_pos = 0
+        self._val_pos = 0
+        self._fmt = "<f"
+        self._channels = 0
+        self._pack_sample_ref = self._pack_sample
+
+        self.blocks = 0
+        self.records = 0
+        self.samples = 0
+        self.write_errors = 0
+        self.blocks_dropped = 0
+        self.write_ms_max = 0
+        self.recovered = False
+        self._recover()
+
+    def _path(self, index) -> str:
+        return "{}/{:05d}{}".format(self.directory, index, self.SUFFIX)
+
+    def files(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return ["{}/{}".format(self.directory, name) for name in sorted(names) if name.endswith(self.SUFFIX)]
+
+    def _recover(self):
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass
+        files = self.files()
+        if not files:
+            self._open(0, 0)
+            return
+
+        path = files[-1]
+        index = int(path[len(self.directory) + 1:-len(self.SUFFIX)])
+        size = os.stat(path)[6]
+        blocks = size // BLOCK_SIZE
+        if size % BLOCK_SIZE:
+            self.recovered = True
+        seq = None
+        for path in reversed(files):
+            seq = self._last_seq(path, path == files[-1])
+            if seq is not None:
+                break
+        self._seq = 0 if seq is None else seq + 1
+        if self.recovered or blocks >= self.file_blocks:
+            self._open(index + 1, 0)
+        else:
+            self._open(index, blocks)
+
+    def _last_seq(self, path, newest):
+        """
+        Sequence number of the newest valid block in path, normally the very last
+        one, None when there is none. Invalid blocks after it in the newest file
+        mark the log as recovered.
+        """
+        seq = None
+        with open(path, "rb") as f:
+            for i in range(os.stat(path)[6] // BLOCK_SIZE - 1, -1, -1):
+                f.seek(i * BLOCK_SIZE)
+                f.readinto(self._block)
+                seq = self._check_block(self._block)
+                if seq is not None:
+                    break
+                if newest:
+                    self.recovered = True
+                if self._wdt:
+                    self._wdt.feed()
+        return seq
+
+    @staticmethod
+    def _check_block(buf):
+        """
+        Returns the block's sequence number, None when it is not a valid block.
+        """
+        magic, seq, used, crc = ustruct.unpack_from(BLOCK_HEADER, buf, 0)
+        if magic != BLOCK_MAGIC or used > BLOCK_SIZE - BLOCK_HEADER_SIZE:
+            return None
+        if block_crc(buf, BLOCK_HEADER_SIZE, BLOCK_HEADER_SIZE + used) != crc:
+            return None
+        return seq
+
+    def _open(self, index, written):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._file_index = index
+        self._file_written = written
+        self._file = open(self._path(index), "ab")
+        files = self.files()
+        for path in files[:max(0, len(files) - self.max_files)]:
+            os.remove(path)
+
+    def _write_block(self):
+        buf = self._block
+        pos = self._pos
+        used = pos - BLOCK_HEADER_SIZE
+        if pos < BLOCK_SIZE:
+            buf[pos:] = self._pad[pos:]
+        ustruct.pack_into(BLOCK_HEADER, buf, 0, BLOCK_MAGIC, self._seq, used,
+                          block_crc(buf, BLOCK_HEADER_SIZE, pos))
+        start = time.ticks_ms()
+        try:
+            if self._file is None:
+                raise OSError(errno.EBADF)
+            self._file.write(buf)
+            self._file.flush()
+        except OSError as e:
+            # Most likely a full filesystem: drop the oldest file and retry once in a new one
+            self.write_errors += 1
+            print("Log write failed - {}".format(e))
+            try:
+                files = self.files()
+                if len(files) > 1:
+                    os.remove(files[0])
+                self._open(self._file_index + 1, 0)
+                self._file.write(buf)
+                self._file.flush()
+            except OSError:
+                # Still failing: lose this block rather than raise out of flush() or sync()
+                self.write_errors += 1
+                self.blocks_dropped += 1
+                self._pos = BLOCK_HEADER_SIZE
+                return
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+        if elapsed > self.write_ms_max:
+            self.write_ms_max = elapsed
+        self._seq += 1
+        self.blocks += 1
+        self._pos = BLOCK_HEADER_SIZE
+        self._file_written += 1
+        if self._file_written >= self.file_blocks:
+            self._open(self._file_index + 1, 0)
+        if self._wdt:
+            self._wdt.feed()
+
+    def _reserve(self, nbytes) -> int:
+        """
+        Position of nbytes of room in the current block, writing it out first when full.
+        """
+        if self._pos + nbytes > BLOCK_SIZE:
+            self._write_block()
+        if self._pos == BLOCK_HEADER_SIZE:
+            self._block_ms = time.ticks_ms()
+        pos = self._pos
+        self._pos += nbytes
+        self.records += 1
+        return pos
+
+    def _pack_sample(self, ts, data, offset):
+        buf = self._block
+        ustruct.pack_into("<I", buf, self._ts_pos, ts & 0xFFFFFFFF)
+        self._ts_pos += 4
+        pos = self._val_pos
+        fmt = self._fmt
+        for i in range(offset, offset + self._channels):
+            ustruct.pack_into(fmt, buf, pos, data[i])
+            pos += 4
+        self._val_pos = pos
+
+    def append_store(self, sensor_id, store, limit=-1, summary=False) -> int:
+        """
+        Move up to limit samples (all by default) out of a RingBuffer into the log,
+        as records of timestamped samples, or of window summaries with summary.
+        Returns how many were logged.
+        """
+        with self._lock:
+            return self._append_store(sensor_id, store, limit, summary)
+
+    def _append_store(self, sensor_id, store, limit, summary=False) -> int:
+        channels = store.channels
+        per_sample = 4 + 4 * channels
+        scaled = store.typecode == 'f'
+        flags = channels | (LOG_SCALED if scaled else 0) | (LOG_SUMMARY if summary else 0)
+        self._fmt = "<f" if scaled else "<i"
+        self._channels = channels
+        n_total = 0
+        while len(store) and n_total != limit:
+            room = (BLOCK_SIZE - self._pos - RECORD_HEADER_SIZE) // per_sample
+            if room < 1:
+                self._write_block()
+                continue
+            n = min(len(store), room)
+            if limit >= 0:
+                n = min(n, limit - n_total)
+            pos = self._reserve(RECORD_HEADER_SIZE + n * per_sample)
+            ustruct.pack_into(RECORD_HEADER, self._block, pos, sensor_id & 0xFF, flags, n, 0, 0)
+            self._ts_pos = pos + RECORD_HEADER_SIZE
+            self._val_pos = self._ts_pos + 4 * n
+            n = store.drain(self._pack_sample_ref, n)
+            n_total += n
+        if not summary:
+            self.samples += n_total
+        return n_total
+
+    def log_summary(self, sensor_id, ticks, summary):
+        """
+        Log one Aggregator window summary (Aggregator.summary layout) taken at ticks.
+        """
+        with self._lock:
+            n = len(summary)
+            pos = self._reserve(RECORD_HEADER_SIZE + 4 + 4 * n)
+            buf = self._block
+            ustruct.pack_into(RECORD_HEADER, buf, pos, sensor_id & 0xFF, n | LOG_SCALED | LOG_SUMMARY, 1, 0, 0)
+            pos += RECORD_HEADER_SIZE
+            ustruct.pack_into("<I", buf, pos, ticks & 0xFFFFFFFF)
+            for i in range(n):
+                pos += 4
+                ustruct.pack_into("<f", buf, pos, summary[i])
+
+    def log_fifo(self, dev, scaled=False) -> int:
+        """
+        Drain dev's FIFO (read_fifo_into) straight into one record of evenly spaced
+        samples at dev.odr, the last one taken now. Returns the number of samples.
+        Samples are logged as raw counts unless scaled, which converts to floats.
+        """
+        with self._lock:
+            return self._log_fifo(dev, scaled)
+
+    def _log_fifo(self, dev, scaled) -> int:
+        out = self._fifo_f if scaled else self._fifo_i
+        n = dev.read_fifo_into(out, 0, scaled)
+        if not n:
+            return 0
+        now = time.ticks_us()
+        channels = len(dev.CHANNELS)
+        period_us = int(1000000 / dev.odr)
+        pos = self._reserve(RECORD_HEADER_SIZE + 4 * channels * n)
+        buf = self._block
+        ustruct.pack_into(RECORD_HEADER, buf, pos, dev.sensor_id & 0xFF, channels | (LOG_SCALED if scaled else 0),
+                          n, time.ticks_add(now, -(n - 1) * period_us) & 0xFFFFFFFF, period_us)
+        pos += RECORD_HEADER_SIZE
+        fmt = "<f" if scaled else "<i"
+        for i in range(n * channels):
+            ustruct.pack_into(fmt, buf, pos, out[i])
+            pos += 4
+        self.samples += n
+        return n
+
+    def sync(self, force=False):
+        """
+        Write the partially filled block once its first record is max_age_ms old
+        (or now with force), bounding what a reset can lose.
+        """
+        with self._lock:
+            self._sync(force)
+
+    def _sync(self, force):
+        if self._pos > BLOCK_HEADER_SIZE and \
+                (force or time.ticks_diff(time.ticks_ms(), self._block_ms) >= self.max_age_ms):
+            self._write_block()
+
+    def close(self):
+        with self._lock:
+            self._sync(True)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def dump(self, stream=None) -> int:
+        """
+        Write every log file, oldest first, to stream (USB serial by default) for
+        host/logfile.py. Returns the number of bytes written.
+        """
+        with self._lock:
+            self._sync(True)
+            if self._file is not None:
+                self._file.flush()
+            stream = stream if stream is not None else sys.stdout.buffer
+            buf = self._block
+            total = 0
+            for path in self.files():
+                with open(path, "rb") as f:
+                    while True:
+                        n = f.readinto(buf)
+                        if not n:
+                            break
+                        stream.write(buf if n == BLOCK_SIZE else memoryview(buf)[:n])
+                        total += n
+                        if self._wdt:
+                            self._wdt.feed()
+            return total
+
+    def erase(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            for path in self.files():
+                os.remove(path)
+            self._pos = BLOCK_HEADER_SIZE
+            self._open(self._file_index + 1, 0)
+
+    def stats(self) -> dict:
+        return {"blocks": self.blocks, "records": self.records, "samples": self.samples,
+                "seq": self._seq, "file": self._path(self._file_index), "files": len(self.files()),
+                "pending_bytes": self._pos - BLOCK_HEADER_SIZE, "write_ms_max": self.write_ms_max,
+                "write_errors": self.write_errors, "blocks_dropped": self.blocks_dropped, "recovered": self.recovered}
@@ -0,0 +1,68 @@
+import time
+from array import array
+
+
+class Deadband:
+    """
+    Change filter for one sensor's raw integer samples: a sample passes when any
+    channel moved more than its band away from the last sample that passed, or when
+    nothing passed for heartbeat_ms (0 disables the heartbeat). A band is absolute
+    raw counts plus relative times the reference value, both per channel or one for
+    all; bands are only recomputed when a sample passes, so a suppressed sample
+    costs a few integer compares.
+    """
+
+    def __init__(self, channels, absolute=0, relative=0.0, heartbeat_ms=60000):
+        self.channels = channels
+        self.heartbeat_ms = heartbeat_ms
+        self._absolute = self._per_channel(absolute, channels)
+        self._relative = self._per_channel(relative, channels)
+        self._last = array('i', bytes(4 * channels))
+        self._band = array('i', bytes(4 * channels))
+        self._sent_ms = 0
+        self._primed = False
+        self.passed = 0
+        self.suppressed = 0
+
+    @staticmethod
+    def _per_channel(value, channels) -> list:
+        if isinstance(value, (int, float)):
+            return [value] * channels
+        if len(value) != channels:
+            raise ValueError("Expected {} deadband values, got {}".format(channels, len(value)))
+        return list(value)
+
+    def check(self, raw, offset=0) -> bool:
+        """
+        True when raw[offset:offset + channels] is to be reported, it then becomes
+        the reference for the following samples.
+        """
+        last = self._last
+        band = self._band
+        changed = not self._primed
+        i = 0
+        while i < self.channels and not changed:
+            d = raw[offset + i] - last[i]
+            changed = d > band[i] or -d > band[i]
+            i += 1
+        now = time.ticks_ms()
+        if not changed and not (self.heartbeat_ms and time.ticks_diff(now, self._sent_ms) >= self.heartbeat_ms):
+            self.suppressed += 1
+            return False
+        for i in range(self.channels):
+            value = raw[offset + i]
+            last[i] = value
+            band[i] = int(self._absolute[i] + abs(value) * self._relative[i])
+        self._sent_ms = now
+        self._primed = True
+        self.passed += 1
+        return True
+
+    def reset(self):
+        """
+        Let the next sample through, e.g. after the output was switched.
+        """
+        self._primed = False
+
+    def stats(self) -> dict:
+        return {"passed": self.passed, "suppressed": self.suppressed}
@@ -0,0 +1,129 @@
+import _thread
+import time
+
+from Scheduler import RatePlanEntry, most_overdue
+
+
+class DualCore:
+    """
+    Runs the rate plan's sensor reads on the second RP2040 core (a plain thread on
+    CPython) while the first core formats, outputs and handles commands.
+
+    Samples reach core 0 through the pool's ring buffers, which are lock-free for
+    one producer and one consumer: core 1 only moves a buffer's head, core 0 only
+    its tail (SensorsPool.flush). While running, the pool's output is deferred
+    (SensorsPool.set_deferred) so no action formats or prints on core 1.
+
+    The rate plan is handed over under a lock and picked up by core 1 between
+    reads, so it never sees a half-built plan. While running, core 1 owns the
+    buses; core 0 must not read sensors directly. clear() returns once core 1 took
+    the empty plan, so no read is in progress any more, and stop() once core 1
+    exited; both raise RuntimeError when core 1 is still busy after timeout_ms.
+    Same rate plan API as Scheduler.
+    """
+    IDLE_US = 10000
+    TIMEOUT_MS = 1000
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._lock = _thread.allocate_lock()
+        self._entries = []
+        self._next_entries = None
+        # Plans handed over by core 0 and the last one core 1 picked up
+        self._handed = 0
+        self._taken = 0
+        self._running = False
+        self._stopped = True
+
+    def set_rate(self, sensor, hz, action=None) -> RatePlanEntry:
+        entry = RatePlanEntry(sensor, hz, action if action is not None else self._pool.sampler(sensor))
+        with self._lock:
+            entries = self._next_entries if self._next_entries is not None else self._entries
+            entries = [e for e in entries if e.sensor is not sensor]
+            if hz > 0:
+                entries.append(entry)
+            self._next_entries = entries
+            self._handed += 1
+        return entry
+
+    def set_rates(self, key: str, hz, action=None) -> int:
+        sensors = self._pool.get_sensors(key)
+        for sensor in sensors:
+            self.set_rate(sensor, hz, action)
+        return len(sensors)
+
+    def plan(self, entries):
+        self.clear()
+        for entry in entries:
+            self.set_rate(*entry)
+
+    def clear(self, timeout_ms=TIMEOUT_MS):
+        with self._lock:
+            self._next_entries = []
+            self._handed += 1
+            handed = self._handed
+        start = time.ticks_ms()
+        while not self._stopped and self._taken < handed:
+            if time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+                raise RuntimeError("Core 1 did not take the new rate plan within {}ms".format(timeout_ms))
+            time.sleep_ms(1)
+
+    def entries(self) -> list:
+        with self._lock:
+            return list(self._next_entries if self._next_entries is not None else self._entries)
+
+    def stats(self) -> list:
+        return [entry.stats() for entry in self.entries()]
+
+    @property
+    def running(self) -> bool:
+        return not self._stopped
+
+    def start(self):
+        if not self._stopped:
+            return
+        self._pool.set_deferred(True)
+        self._running = True
+        self._stopped = False
+        _thread.start_new_thread(self._core1, ())
+
+    def stop(self, timeout_ms=TIMEOUT_MS):
+        """
+        Stop core 1 and hand the buses back. If a read keeps it busy beyond timeout_ms
+        this raises RuntimeError and core 1 stops later; call again before touching the buses.
+        """
+        self._running = False
+        start = time.ticks_ms()
+        while not self._stopped:
+            if time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+                raise RuntimeError("Core 1 still busy after {}ms".format(timeout_ms))
+            time.sleep_ms(1)
+        self._pool.set_deferred(False)
+
+    def _core1(self):
+        try:
+            while self._running:
+                if self._next_entries is not None:
+                    with self._lock:
+                        self._entries = self._next_entries
+                        self._next_entries = None
+                        self._taken = self._handed
+                entries = self._entries
+                if not entries:
+                    time.sleep_us(self.IDLE_US)
+                    continue
+
+                entry, wait = most_overdue(entries, time.ticks_us())
+                if wait > 0:
+                    time.sleep_us(min(wait, self.IDLE_US))
+                    continue
+
+                try:
+                    entry.action()
+                except Exception as e:
+                    # No printing here, stats() shows it on core 0
+                    entry.errors += 1
+                    entry.last_error = e
+                entry.complete(-wait)
+        finally:
+            self._stopped = True
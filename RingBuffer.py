@@ -0,0 +1,87 @@
+from array import array
+
+
+class RingBuffer:
+    """
+    Fixed capacity store of samples with `channels` values each plus a ticks_us
+    timestamp lane, backed by preallocated arrays. A full buffer drops the new
+    sample and counts it in overflows, so the producer never moves the consumer's
+    position and one producer / one consumer need no lock.
+    """
+
+    def __init__(self, channels, capacity=128, typecode='i'):
+        self.channels = channels
+        self.capacity = capacity
+        self.typecode = typecode
+        self._data = array(typecode, bytes(array(typecode).itemsize * channels * capacity))
+        self._ts = array('i', bytes(4 * capacity))
+        # Positions run modulo 2 * capacity so a full buffer differs from an empty one
+        self._head = 0
+        self._tail = 0
+        self.overflows = 0
+        self.pushed = 0
+
+    def __len__(self):
+        return (self._head - self._tail) % (2 * self.capacity)
+
+    def free(self) -> int:
+        return self.capacity - len(self)
+
+    def push(self, ts, values, offset=0) -> bool:
+        """
+        Store values[offset:offset + channels] with timestamp ts, False when full.
+        """
+        head = self._head
+        if (head - self._tail) % (2 * self.capacity) >= self.capacity:
+            self.overflows += 1
+            return False
+        slot = head % self.capacity
+        self._ts[slot] = ts
+        slot_offset = slot * self.channels
+        data = self._data
+        for i in range(self.channels):
+            data[slot_offset + i] = values[offset + i]
+        self._head = (head + 1) % (2 * self.capacity)
+        self.pushed += 1
+        return True
+
+    def drain(self, fn, limit=-1) -> int:
+        """
+        Call fn(ts, data, offset) for up to limit of the oldest samples, where the
+        sample's values are data[offset:offset + channels]. Returns how many were drained.
+        """
+        n = 0
+        tail = self._tail
+        while tail != self._head and n != limit:
+            slot = tail % self.capacity
+            fn(self._ts[slot], self._data, slot * self.channels)
+            tail = (tail + 1) % (2 * self.capacity)
+            self._tail = tail
+            n += 1
+        return n
+
+    def drain_into(self, ts_out, values_out) -> int:
+        """
+        Copy the oldest samples into preallocated arrays, as many as ts_out holds.
+        """
+        n = 0
+        limit = min(len(ts_out), len(values_out) // self.channels)
+        tail = self._tail
+        channels = self.channels
+        data = self._data
+        while tail != self._head and n < limit:
+            slot = tail % self.capacity
+            ts_out[n] = self._ts[slot]
+            offset = slot * channels
+            for i in range(channels):
+                values_out[n * channels + i] = data[offset + i]
+            tail = (tail + 1) % (2 * self.capacity)
+            self._tail = tail
+            n += 1
+        return n
+
+    def clear(self):
+        self._tail = self._head
+
+    def stats(self) -> dict:
+        return {"size": len(self), "capacity": self.capacity, "pushed": self.pushed, "overflows": self.overflows}
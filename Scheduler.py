@@ -0,0 +1,183 @@
+import time
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+
+class RatePlanEntry:
+    def __init__(self, sensor, hz, action=None):
+        self.sensor = sensor
+        self.hz = hz
+        self.period_us = int(1000000 / hz)
+        self.action = action if action is not None else sensor.print
+        self.next_us = time.ticks_us()
+        self.samples = 0
+        self.misses = 0
+        self.errors = 0
+        self.last_error = None
+        self.late_max_us = 0
+        self.late_sum_us = 0
+
+    def complete(self, late):
+        """
+        Account for one run that started late us after its deadline and move to the
+        next slot, skipping (and counting as misses) slots that already passed.
+        """
+        self.samples += 1
+        self.late_sum_us += late
+        if late > self.late_max_us:
+            self.late_max_us = late
+
+        self.next_us = time.ticks_add(self.next_us, self.period_us)
+        behind = time.ticks_diff(time.ticks_us(), self.next_us)
+        if behind >= self.period_us:
+            skipped = behind // self.period_us
+            self.misses += skipped
+            self.next_us = time.ticks_add(self.next_us, skipped * self.period_us)
+
+    def stats(self) -> dict:
+        return {"name": getattr(self.sensor, "name", str(self.sensor)),
+                "bus": getattr(self.sensor, "_bus", 0),
+                "hz": self.hz,
+                "samples": self.samples,
+                "misses": self.misses,
+                "errors": self.errors,
+                "last_error": repr(self.last_error) if self.last_error is not None else None,
+                "jitter_max_us": self.late_max_us,
+                "jitter_mean_us": self.late_sum_us // self.samples if self.samples else 0}
+
+
+def most_overdue(entries, now):
+    """
+    Returns the entry whose deadline is earliest and the us until it (negative when late).
+    """
+    entry = entries[0]
+    wait = time.ticks_diff(entry.next_us, now)
+    for candidate in entries:
+        candidate_wait = time.ticks_diff(candidate.next_us, now)
+        if candidate_wait < wait:
+            entry, wait = candidate, candidate_wait
+    return entry, wait
+
+
+class BusGroup:
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.lock = asyncio.Lock()
+        self.entries = []
+        self.task = None
+
+
+class Scheduler:
+    """
+    Cooperative replacement for one machine.Timer per sensor. Every bus gets a single
+    dispatcher coroutine that runs the most overdue rate plan entry, so reads on a bus
+    never overlap, and a sensor that overruns skips its missed slots (counted as
+    misses) instead of queueing callbacks. Changing what is sampled is a rate plan
+    change, the dispatchers keep running.
+    """
+    IDLE_S = 0.05
+
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._groups = {}
+        self._running = False
+
+    def _group(self, sensor) -> BusGroup:
+        key = id(sensor._i2c)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = BusGroup(sensor._i2c)
+            if self._running:
+                group.task = asyncio.create_task(self._dispatch(group))
+        return group
+
+    def set_rate(self, sensor, hz, action=None) -> RatePlanEntry:
+        """
+        Sample sensor at hz (0 removes it), by default through the pool's sample().
+        """
+        if action is None and self._pool is not None:
+            action = self._pool.sampler(sensor)
+        group = self._group(sensor)
+        group.entries = [e for e in group.entries if e.sensor is not sensor]
+        entry = RatePlanEntry(sensor, hz, action)
+        if hz > 0:
+            group.entries.append(entry)
+        return entry
+
+    def set_rates(self, key: str, hz, action=None) -> int:
+        """
+        Sample every sensor the pool holds under key at hz, returns how many were planned.
+        """
+        sensors = self._pool.get_sensors(key) if self._pool else []
+        for sensor in sensors:
+            self.set_rate(sensor, hz, action)
+        return len(sensors)
+
+    def plan(self, entries):
+        """
+        Replace the whole rate plan with (sensor, hz) or (sensor, hz, action) tuples.
+        """
+        self.clear()
+        for entry in entries:
+            self.set_rate(*entry)
+
+    def clear(self):
+        for group in self._groups.values():
+            group.entries = []
+
+    def entries(self) -> list:
+        return sum([group.entries for group in self._groups.values()], [])
+
+    def lock(self, sensor):
+        """
+        Lock to hold around any other access to sensor's bus while the scheduler runs.
+        """
+        return self._group(sensor).lock
+
+    def stats(self) -> list:
+        return [entry.stats() for entry in self.entries()]
+
+    def start(self):
+        self._running = True
+        for group in self._groups.values():
+            if group.task is None:
+                group.task = asyncio.create_task(self._dispatch(group))
+
+    def stop(self):
+        self._running = False
+        for group in self._groups.values():
+            if group.task is not None:
+                group.task.cancel()
+                group.task = None
+
+    async def run(self):
+        self.start()
+        while self._running:
+            await asyncio.sleep(self.IDLE_S)
+
+    async def _dispatch(self, group: BusGroup):
+        while self._running:
+            entries = group.entries
+            if not entries:
+                await asyncio.sleep(self.IDLE_S)
+                continue
+
+            entry, wait = most_overdue(entries, time.ticks_us())
+            if wait > 0:
+                # Re-evaluate after sleeping, the plan may have changed meanwhile
+                await asyncio.sleep(min(wait, self.IDLE_S * 1000000) / 1000000)
+                continue
+
+            async with group.lock:
+                try:
+                    entry.action()
+                except Exception as e:
+                    entry.errors += 1
+                    entry.last_error = e
+                    print("Error on dev {} - {}".format(entry.sensor, e))
+
+            entry.complete(-wait)
+            await asyncio.sleep(0)
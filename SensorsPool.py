@@ -1,59 +1,342 @@
+import errno
 import machine
 import time
+import ujson
+from array import array
 
-from AT30TSE75x import AT30TSE75x
-from BME280 import BME280
-from ADXL355 import ADXL355
+from Aggregator import Aggregator, SUMMARY_STATS
+from CircuitBreaker import CircuitBreaker
+from Deadband import Deadband
+from frame_helper import FrameWriter
+from i2c_helper import clock_out_bus
+from RingBuffer import RingBuffer
+from Snapshot import Snapshot
 
 
 class SensorsPool:
 
+    # Built-in drivers by kind. Addresses the driver answers on; Module the driver
+    # module, imported on first use and holding the class of the same name (or Class);
+    # ChipID an optional (register, accepted values) probe to tell apart drivers
+    # sharing an address. Others are added with register_driver.
     SENSOR_DATA = {
         "Temperature": {
-            "Range": (0x48, 0x4F + 0x1),
+            "Addresses": range(0x48, 0x4F + 0x1),
             "Name": "Temperature (T:C)",
-            "Class": AT30TSE75x
+            "Module": "AT30TSE75x"
         },
         "Barometer": {
-            "Range": (0X76, 0X76 + 0x1),
+            "Addresses": (0X76,),
             "Name": "Barometer (P:hPa, t:C, H:%rH)",
-            "Class": BME280
+            "Module": "BME280",
+            "ChipID": (0xD0, (0x58, 0x60))
         },
         "Accelerometer": {
-            "Range": (0x1D, 0x1D + 0x1),
+            "Addresses": (0x1D,),
             "Name": "Accelerometer (x, y, z)",
-            "Class": ADXL355
+            "Module": "ADXL355",
+            "ChipID": (0x02, (0xED,))
         },
     }
+    # 7-bit address -> kinds (SENSOR_DATA keys) that may sit there, most recently registered first
+    _DRIVERS = [None] * 128
 
-    _i2c = machine.I2C(0)
-    _devices = []
-    _sensors = {}
+    # (SDA, SCL) pairs probed by discover_buses
+    BUS_PINS = ((4, 5), (8, 9))
+    # Bus clocks tried by negotiate_freq, fastest first; the last one is used for discovery
+    FREQ_CANDIDATES = (1000000, 400000, 100000)
+    # Chip ID reads per device that must all succeed before a clock is accepted
+    FREQ_VERIFY_READS = 8
+    # Layout version of the file written by discover_buses(topology=...), bump on changes
+    TOPOLOGY_VERSION = 2
+    # Consecutive failures that quarantine a sensor and the wait before its first re-probe (doubles per trip)
+    BREAKER_THRESHOLD = 3
+    BREAKER_BACKOFF_MS = 1000
+    # Minimum time between two recoveries of the same bus
+    RECOVER_INTERVAL_MS = 1000
+    # Quarantine and recovery messages held for flush() while output is deferred
+    EVENTS = 8
 
-    def __init__(self, *args, i2c: machine.I2C, led: machine.Pin = None, wdt=None, **kwargs):
-        self._i2c = i2c
-        self._devices = self._i2c.scan()
+    def __init__(self, *args, i2c: machine.I2C = None, led: machine.Pin = None, wdt=None, **kwargs):
+        # Either a single i2c or buses, a list of I2C objects or (I2C, scanned addresses[, recovery]) tuples
+        buses = kwargs.get("buses", None) or [i2c]
+        self._buses = []
+        self._bus_devices = []
+        self._bus_recovery = []
+        for bus in buses:
+            recovery = None
+            if isinstance(bus, tuple):
+                if len(bus) > 2:
+                    recovery = bus[2]
+                bus, devices = bus[0], bus[1]
+            else:
+                devices = bus.scan()
+            self._buses.append(bus)
+            self._bus_devices.append(devices)
+            self._bus_recovery.append(recovery)
+        self.bus_recoveries = [0] * len(self._buses)
+        self._recovered_ms = [0] * len(self._buses)
+        self._breakers = {}
+        self._i2c = self._buses[0]
+        self._devices = self._bus_devices[0]
+        self._sensors = {}
         self._led = led
         self._wdt = wdt
         self._led_timer = kwargs.get("led_timer", None)
+        self._calibration_cache = kwargs.get("calibration_cache", None)
+        self._frame_writer = None
+        self._stores = {}
+        self._drains = []
+        self._store_raw = False
+        self._deferred = False
+        self._summaries = {}
+        self._summary_drains = []
+        self._events = [None] * self.EVENTS
+        self._event_head = 0
+        self._event_tail = 0
+        self.events_dropped = 0
+        self._logger = None
+        self._snapshots = {}
+        self._record_seq = 0
         self.print_config()
 
         self.spool_sensors()
 
+    @staticmethod
+    def discover_buses(pins=BUS_PINS, freqs=FREQ_CANDIDATES, topology=None) -> list:
+        """
+        Probe every (SDA, SCL) pair and return (I2C, addresses, recovery) for each one
+        with devices, recovery being what recover_bus runs for it.
+        A pair gets the hardware controller its pins belong to (I2C0 on GP0/1, GP4/5,
+        GP8/9..., I2C1 on GP2/3, GP6/7...) unless another bus already claimed it or it
+        finds nothing, SoftI2C is the fallback. Discovery runs at the slowest of freqs,
+        then each bus is set to the fastest clock all its devices pass (negotiate_freq).
+        The result is saved to the topology file when given, for load_topology.
+        """
+        buses = []
+        config = []
+        claimed = []
+        for sda_number, scl_number in pins:
+            SDA, SCL = SensorsPool._bus_pins(sda_number, scl_number)
+            hw_id = (sda_number // 2) % 2
+            i2c_scan = []
+            if hw_id not in claimed:
+                i2c = machine.I2C(hw_id, scl=SCL, sda=SDA, freq=freqs[-1])
+                i2c_scan = i2c.scan()
+                if i2c_scan:
+                    claimed.append(hw_id)
+            if not i2c_scan:
+                hw_id = None
+                i2c = machine.SoftI2C(scl=SCL, sda=SDA, freq=freqs[-1])
+                i2c_scan = i2c.scan()
+            if i2c_scan:
+                kinds = [SensorsPool.resolve_driver(i2c, device) for device in i2c_scan]
+                i2c, freq = SensorsPool.negotiate_freq(SensorsPool._i2c_factory(hw_id, SCL, SDA), i2c_scan,
+                                                       kinds, freqs)
+                buses.append((i2c, i2c_scan, SensorsPool._bus_recovery_for(hw_id, sda_number, scl_number, freq)))
+                config.append({"sda": sda_number, "scl": scl_number, "hw": hw_id, "freq": freq,
+                               "devices": i2c_scan, "drivers": [kind or "" for kind in kinds]})
+        if topology and buses:
+            try:
+                with open(topology, "w") as f:
+                    ujson.dump({"version": SensorsPool.TOPOLOGY_VERSION, "buses": config}, f)
+            except OSError as e:
+                print("Topology not saved - {}".format(e))
+        return buses
+
+    @staticmethod
+    def load_topology(path, pins=BUS_PINS):
+        """
+        Rebuild the buses saved by discover_buses(topology=path), at their negotiated
+        clocks, checking each with a single scan. Returns the same list of buses,
+        or None when there is no saved topology or the hardware, pins or driver
+        mapping changed since, then discover_buses has to run again.
+        """
+        try:
+            with open(path) as f:
+                saved = ujson.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("version") != SensorsPool.TOPOLOGY_VERSION or not saved.get("buses"):
+            return None
+        buses = []
+        try:
+            for bus in saved["buses"]:
+                devices = bus["devices"]
+                if (bus["sda"], bus["scl"]) not in pins:
+                    return None
+                SDA, SCL = SensorsPool._bus_pins(bus["sda"], bus["scl"])
+                i2c = SensorsPool._i2c_factory(bus["hw"], SCL, SDA)(bus["freq"])
+                if sorted(i2c.scan()) != sorted(devices) or \
+                        bus["drivers"] != [SensorsPool.resolve_driver(i2c, device) or "" for device in devices]:
+                    print("I2C bus on GP{}/{} changed, rediscovering".format(bus["sda"], bus["scl"]))
+                    return None
+                buses.append((i2c, devices, SensorsPool._bus_recovery_for(bus["hw"], bus["sda"], bus["scl"],
+                                                                          bus["freq"])))
+        except (OSError, KeyError, TypeError) as e:
+            print("Saved topology unusable - {}".format(e))
+            return None
+        return buses
+
+    @staticmethod
+    def _bus_pins(sda_number, scl_number):
+        return (machine.Pin(sda_number, mode=machine.Pin.OPEN_DRAIN, pull=machine.Pin.PULL_UP),
+                machine.Pin(scl_number, mode=machine.Pin.OPEN_DRAIN, pull=machine.Pin.PULL_UP))
+
+    @staticmethod
+    def _bus_recovery_for(hw_id, sda_number, scl_number, freq):
+        def recover(i2c):
+            clock_out_bus(scl_number, sda_number)
+            SDA, SCL = SensorsPool._bus_pins(sda_number, scl_number)
+            try:
+                i2c.init(scl=SCL, sda=SDA, freq=freq)
+            except (AttributeError, OSError):
+                # rp2 hardware I2C has no init(), constructing it again sets up the same object
+                machine.I2C(hw_id, scl=SCL, sda=SDA, freq=freq)
+        return recover
+
+    @staticmethod
+    def _i2c_factory(hw_id, scl, sda):
+        if hw_id is None:
+            return lambda freq: machine.SoftI2C(scl=scl, sda=sda, freq=freq)
+        return lambda freq: machine.I2C(hw_id, scl=scl, sda=sda, freq=freq)
+
+    @staticmethod
+    def negotiate_freq(make_i2c, devices, kinds, freqs=FREQ_CANDIDATES):
+        """
+        Returns (make_i2c(freq), freq) for the fastest freq at which every device in
+        devices still answers a scan and every one whose kind (resolve_driver) has a
+        ChipID returns a valid ID FREQ_VERIFY_READS times in a row, stepping down
+        through freqs on any error. The slowest candidate is the fallback when none passes.
+        """
+        for freq in freqs:
+            i2c = make_i2c(freq)
+            error = SensorsPool._verify_bus(i2c, devices, kinds)
+            if error is None:
+                print("I2C bus at {}kHz".format(freq // 1000))
+                return i2c, freq
+            print("I2C bus failed at {}kHz - {}".format(freq // 1000, error))
+        return make_i2c(freqs[-1]), freqs[-1]
+
+    @staticmethod
+    def _verify_bus(i2c, devices, kinds):
+        """
+        None when every device checks out, else the reason one did not.
+        """
+        try:
+            found = i2c.scan()
+            for device in devices:
+                if device not in found:
+                    return "{} missing from scan".format(hex(device))
+            for device, kind in zip(devices, kinds):
+                probe = SensorsPool.SENSOR_DATA[kind].get("ChipID") if kind else None
+                if probe is None:
+                    continue
+                for _ in range(SensorsPool.FREQ_VERIFY_READS):
+                    chip_id = i2c.readfrom_mem(device, probe[0], 1)[0]
+                    if chip_id not in probe[1]:
+                        return "{} read chip ID {}".format(hex(device), hex(chip_id))
+        except OSError as e:
+            return "{}".format(e)
+        return None
+
+    @staticmethod
+    def register_driver(kind, name, addresses, module, cls=None, chip_id=None):
+        """
+        Add a driver without editing SENSOR_DATA, e.g. from boot.py:
+            SensorsPool.register_driver("Humidity", "Humidity (H:%rH, T:C)", (0x44, 0x45), "SHT3x")
+        module is imported when one of addresses is found; cls is the class, or its
+        name when not the module's. It takes precedence over drivers registered
+        before it on the same addresses, chip_id (register, accepted values) is
+        then needed to fall through to them. Replaces an existing kind.
+        """
+        if kind in SensorsPool.SENSOR_DATA:
+            SensorsPool._index_driver(kind, False)
+        sensor = {"Addresses": tuple(addresses), "Name": name, "Module": module}
+        if cls is not None:
+            sensor["Class"] = cls
+        if chip_id is not None:
+            sensor["ChipID"] = chip_id
+        SensorsPool.SENSOR_DATA[kind] = sensor
+        SensorsPool._index_driver(kind)
+
+    @staticmethod
+    def _index_driver(kind, add=True):
+        for address in SensorsPool.SENSOR_DATA[kind]["Addresses"]:
+            kinds = SensorsPool._DRIVERS[address & 0x7F] or []
+            if kind in kinds:
+                kinds.remove(kind)
+            if add:
+                kinds.insert(0, kind)
+            SensorsPool._DRIVERS[address & 0x7F] = kinds or None
+
+    @staticmethod
+    def resolve_driver(i2c, address):
+        """
+        Kind of the driver for the device at address, None when no driver claims it.
+        Candidates are only probed when several share the address, the first whose
+        ChipID matches (or that has none) wins.
+        """
+        kinds = SensorsPool._DRIVERS[address & 0x7F]
+        if not kinds:
+            return None
+        if len(kinds) == 1:
+            return kinds[0]
+        for kind in kinds:
+            probe = SensorsPool.SENSOR_DATA[kind].get("ChipID")
+            if probe is None:
+                return kind
+            try:
+                if i2c.readfrom_mem(address, probe[0], 1)[0] in probe[1]:
+                    return kind
+            except OSError:
+                pass
+        return None
+
+    @staticmethod
+    def driver_class(kind):
+        """
+        The driver class of kind, importing its module on first use.
+        """
+        sensor = SensorsPool.SENSOR_DATA[kind]
+        cls = sensor.get("Class", sensor["Module"])
+        if isinstance(cls, str):
+            cls = getattr(__import__(sensor["Module"]), cls)
+            sensor["Class"] = cls
+        return cls
+
     def spool_sensors(self):
-        for dev in self._devices:
-            for sensor in self.SENSOR_DATA.values():
-                if dev in range(*sensor["Range"]):
-                    if sensor["Name"] not in self._sensors:
-                        self._sensors[sensor["Name"]] = []
-                    self._sensors[sensor["Name"]].append(
-                        sensor["Class"](i2c=self._i2c, device=dev,
-                                        led=self._led, wdt=self._wdt,
-                                        name=sensor["Name"]))
-                    break
+        for bus_index, (i2c, devices) in enumerate(zip(self._buses, self._bus_devices)):
+            for dev in devices:
+                kind = self.resolve_driver(i2c, dev)
+                if kind is None:
+                    continue
+                sensor = self.SENSOR_DATA[kind]
+                if sensor["Name"] not in self._sensors:
+                    self._sensors[sensor["Name"]] = []
+                driver = self.driver_class(kind)(i2c=i2c, device=dev,
+                                                 led=self._led, wdt=self._wdt,
+                                                 name=sensor["Name"],
+                                                 bus=bus_index, sensor_id=(bus_index << 7) | dev,
+                                                 calibration_cache=self._calibration_cache)
+                self._sensors[sensor["Name"]].append(driver)
+                self._breakers[driver] = CircuitBreaker(self.BREAKER_THRESHOLD, self.BREAKER_BACKOFF_MS)
+
+        # Preallocated results for read_temperatures
+        self._temperatures = self.get_sensors(self.SENSOR_DATA["Temperature"]["Name"])
+        self._temperature_values = array('f', bytes(4 * len(self._temperatures)))
+        self._temperature_counts = array('i', bytes(4 * len(self._temperatures)))
+        self.temperature_ok = bytearray(len(self._temperatures))
 
         print("Completed populating sensors pool!")
 
+    @property
+    def buses(self) -> list:
+        return self._buses
+
+    def get_bus_sensors(self, bus_index) -> list:
+        return [dev for dev in self.get_sensors() if dev._i2c is self._buses[bus_index]]
+
     def read(self, key_only=None, name=False):
         for key, devs in self._sensors.items():
             if key_only is not None and key_only != key:
@@ -61,15 +344,592 @@ class SensorsPool:
             if name:
                 print("{}:".format(key))
             for dev in devs:
+                breaker = self._breakers[dev]
+                if breaker.state and not self._admit(dev, breaker):
+                    continue
                 try:
-                    print(dev.read())
+                    if dev.deadband is not None:
+                        dev.report()
+                    elif self._frame_writer is not None:
+                        dev.write_frame()
+                    else:
+                        print(dev.read())
                 except Exception as e:
                     if self._led:
                         self._led.on()
                     print("Error on dev {} - {}".format(dev, e))
+                    self._failed(dev, e)
+                    continue
+                if breaker.failures:
+                    breaker.success()
             if name:
                 print("-"*10)
 
+    @property
+    def binary(self) -> bool:
+        return self._frame_writer is not None
+
+    def set_binary(self, enabled=True, scaled=True, stream=None):
+        """
+        Switch every sensor between text lines and binary frames (see frame_helper).
+        Raw frames carry the unconverted integer readings instead of scaled floats.
+        """
+        self._frame_writer = FrameWriter(stream) if enabled else None
+        for dev in self.get_sensors():
+            dev.frame_writer = self._frame_writer
+            dev.frame_scaled = scaled
+            if dev.deadband is not None:
+                dev.deadband.reset()
+        self._bind_drains()
+
+    def set_deadband(self, key: str = "", absolute=0, relative=0.0, heartbeat_ms=60000):
+        """
+        Change-driven reporting for the sensors under key (all by default): a sample is
+        only output or stored when a raw channel moved more than absolute counts plus
+        relative times its last reported value, or heartbeat_ms after the last one.
+        absolute and relative are per channel sequences or one value for all.
+        Unchanged samples skip conversion, formatting and output (see Deadband).
+        """
+        for dev in self.get_sensors(key):
+            dev.deadband = Deadband(len(dev.CHANNELS), absolute, relative, heartbeat_ms)
+
+    def clear_deadband(self, key: str = ""):
+        for dev in self.get_sensors(key):
+            dev.deadband = None
+
+    @property
+    def deadband_enabled(self) -> bool:
+        return any(dev.deadband is not None for dev in self.get_sensors())
+
+    def deadband_stats(self) -> dict:
+        return {self.sensor_key(dev): dev.deadband.stats()
+                for dev in self.get_sensors() if dev.deadband is not None}
+
+    def enable_store(self, capacity=128, raw=False):
+        """
+        Give every sensor a ring buffer so sampling (sample) and output (flush) are
+        decoupled. raw keeps the unconverted integer readings instead of scaled values.
+        """
+        self._store_raw = raw
+        self._stores = {}
+        for dev in self.get_sensors():
+            self._stores[dev] = RingBuffer(len(dev.CHANNELS), capacity, 'i' if raw else 'f')
+            dev.store_scaled = not raw
+        self._bind_drains()
+
+    @property
+    def store_enabled(self) -> bool:
+        return bool(self._stores)
+
+    def disable_store(self):
+        if self._deferred:
+            raise RuntimeError("The sample store is needed while output is deferred")
+        self._stores = {}
+        self._bind_drains()
+
+    def _bind_drains(self):
+        # flush's output callbacks, bound once here so draining allocates nothing
+        self._drains = [(dev, store, dev.write_sample if self._frame_writer is not None else dev.print_sample)
+                        for dev, store in self._stores.items()]
+
+    @property
+    def deferred(self) -> bool:
+        return self._deferred
+
+    def set_deferred(self, enabled=True):
+        """
+        With deferred output the pool's rate plan actions (sampler, fifo_sampler,
+        aggregator, snapshotter) only fill ring buffers and flush() does all the
+        formatting and output, for DualCore running the reads on core 1. Enables
+        the sample store, which can not be disabled meanwhile. Quarantine and bus
+        recovery messages are held for flush() too, at most EVENTS of them.
+        """
+        if enabled and not self._stores:
+            self.enable_store()
+        self._deferred = enabled
+        if not enabled and self._event_tail != self._event_head:
+            self._print_events()
+
+    @property
+    def logger(self):
+        return self._logger
+
+    def set_logger(self, logger=None):
+        """
+        Send flushed samples to a DataLogger instead of the output (None switches
+        back), enabling the sample store if it is not yet.
+        """
+        self._logger = logger
+        if logger is not None and not self._stores:
+            self.enable_store()
+
+    def get_store(self, dev) -> RingBuffer:
+        return self._stores.get(dev, None)
+
+    def sample(self, dev):
+        """
+        Producer side: read dev into its ring buffer, or print straight away without one.
+        Failures are counted against dev's circuit breaker and raised, a quarantined
+        dev is skipped.
+        """
+        breaker = self._breakers[dev]
+        if breaker.state and not self._admit(dev, breaker):
+            return
+        store = self._stores.get(dev, None)
+        try:
+            if store is None:
+                if dev.deadband is not None:
+                    dev.report()
+                elif self._frame_writer is not None:
+                    dev.write_frame()
+                else:
+                    print(dev.read())
+                if self._wdt:
+                    self._wdt.feed()
+            elif dev.deadband is None:
+                store.push(time.ticks_us(), dev.raw_values() if self._store_raw else dev.values())
+            else:
+                raw = dev.raw_values()
+                if dev.deadband.check(raw):
+                    store.push(time.ticks_us(), raw if self._store_raw else dev.scaled_values())
+        except Exception as e:
+            self._failed(dev, e)
+            raise
+        if breaker.failures:
+            breaker.success()
+
+    def _admit(self, dev, breaker) -> bool:
+        """
+        False while dev is quarantined. Once its backoff elapsed it is probed with an
+        empty write and its configuration restored (reinit), the next read being the
+        trial that closes the breaker.
+        """
+        if breaker.state != CircuitBreaker.OPEN:
+            return True
+        if not breaker.retry_due():
+            breaker.skipped += 1
+            return False
+        try:
+            dev._i2c.writeto(dev._device, b"")
+            dev.reinit()
+        except OSError:
+            breaker.failure()
+            return False
+        breaker.half_open()
+        return True
+
+    def _failed(self, dev, e):
+        breaker = self._breakers[dev]
+        if breaker.failure():
+            self._event("{} quarantined after {} failures - {}", self.sensor_key(dev), breaker.failures, e)
+        # A stuck bus times out, or takes every device on it down at once
+        bus_index = dev._bus
+        if (isinstance(e, OSError) and e.args and e.args[0] == errno.ETIMEDOUT) or \
+                all(self._breakers[other].failures for other in self.get_bus_sensors(bus_index)):
+            self.recover_bus(bus_index)
+
+    def recover_bus(self, bus_index) -> bool:
+        """
+        Clock out a stuck bus and initialise its controller again, at most once per
+        RECOVER_INTERVAL_MS. False when skipped or not possible (no recovery for
+        buses not from discover_buses/load_topology).
+        """
+        recovery = self._bus_recovery[bus_index]
+        now = time.ticks_ms()
+        if recovery is None or (self.bus_recoveries[bus_index] and
+                                time.ticks_diff(now, self._recovered_ms[bus_index]) < self.RECOVER_INTERVAL_MS):
+            return False
+        self._recovered_ms[bus_index] = now
+        self.bus_recoveries[bus_index] += 1
+        self._event("Recovering I2C bus {}", self._buses[bus_index])
+        try:
+            recovery(self._buses[bus_index])
+        except OSError as e:
+            self._event("I2C bus recovery failed - {}", e)
+            return False
+        return True
+
+    def _event(self, message, *args):
+        """
+        Print message.format(*args), or with deferred output queue it for flush(),
+        the reader and writer sides being the two cores like a RingBuffer's.
+        """
+        if not self._deferred:
+            print(message.format(*args))
+            return
+        head = self._event_head
+        if (head - self._event_tail) % (2 * self.EVENTS) >= self.EVENTS:
+            self.events_dropped += 1
+            return
+        self._events[head % self.EVENTS] = (message, args)
+        self._event_head = (head + 1) % (2 * self.EVENTS)
+
+    def _print_events(self):
+        tail = self._event_tail
+        while tail != self._event_head:
+            slot = tail % self.EVENTS
+            message, args = self._events[slot]
+            self._events[slot] = None
+            print(message.format(*args))
+            tail = (tail + 1) % (2 * self.EVENTS)
+            self._event_tail = tail
+
+    def health(self) -> dict:
+        """
+        Circuit breaker state of every sensor, keyed like bus_stats.
+        """
+        return {self.sensor_key(dev): self._breakers[dev].stats() for dev in self.get_sensors()}
+
+    def read_temperatures(self, raw=False):
+        """
+        Read every temperature sensor back to back, with pointer-latched 2-byte reads
+        after the first round. Returns the pool's array of degrees (counts with raw)
+        in get_sensors(Temperature) order, overwritten by the next call. Sensors that
+        failed or are quarantined keep their last value and have temperature_ok cleared.
+        """
+        sensors = self._temperatures
+        ok = self.temperature_ok
+        out = self._temperature_counts if raw else self._temperature_values
+        for i in range(len(sensors)):
+            dev = sensors[i]
+            breaker = self._breakers[dev]
+            ok[i] = 0
+            if breaker.state and not self._admit(dev, breaker):
+                continue
+            try:
+                counts = dev.read_temp_counts()
+            except Exception as e:
+                self._failed(dev, e)
+                continue
+            if breaker.failures:
+                breaker.success()
+            out[i] = counts if raw else counts * dev.STEP_12BIT
+            ok[i] = 1
+        return out
+
+    def sample_temperatures(self, *args):
+        """
+        Rate plan action for all temperature sensors: read_temperatures into each
+        sensor's store under one timestamp, or output straight away. Counts are only
+        converted for the sensors that report (see set_deadband).
+        """
+        sensors = self._temperatures
+        if not sensors:
+            return
+        if self._stores:
+            raw = self._store_raw
+        else:
+            raw = self._frame_writer is not None and not sensors[0].frame_scaled
+        counts = self.read_temperatures(True)
+        values = counts if raw else self._temperature_values
+        ts = time.ticks_us()
+        for i in range(len(sensors)):
+            if not self.temperature_ok[i]:
+                continue
+            dev = sensors[i]
+            deadband = dev.deadband
+            if deadband is not None and not deadband.check(counts, i):
+                continue
+            if not raw:
+                values[i] = counts[i] * dev.STEP_12BIT
+            store = self._stores.get(dev, None)
+            if store is not None:
+                store.push(ts, values, i)
+            elif self._frame_writer is not None:
+                self._frame_writer.write(dev.sensor_id, values, not raw, ts, i, 1)
+            else:
+                print(dev.format_sample(ts, values, i))
+
+    def read_records(self, key: str = "", raw=False) -> list:
+        """
+        Read the sensors under key (all by default) in registry order, returned as
+        (sensor_id, seq, ticks_us, latency_us, values) records, see Snapshot.record.
+        """
+        snapshot = self._snapshot_for(key, raw, False)
+        self._capture(snapshot)
+        return snapshot.records()
+
+    def snapshot(self, key: str = "", raw=False) -> Snapshot:
+        """
+        Read the sensors under key (all by default) back to back, slowest reads at
+        the ends so the capture times lie as close together as possible, and return
+        the pool's Snapshot for them (skew_us the spread), overwritten by the next call.
+        Sensors converting on demand (I2C.prepare) start first and are read last,
+        the others being read around the middle of the longest conversion.
+        """
+        snapshot = self._snapshot_for(key, raw, True)
+        ready, middle = self._prepare(snapshot)
+        snapshot.arrange()
+        if middle is not None:
+            # Centre the other reads on the conversion, with the latencies of the last snapshot
+            span = 0
+            for i in range(len(snapshot)):
+                if not snapshot.converted[i]:
+                    span += snapshot.latency_us[i]
+            wait = time.ticks_diff(middle, time.ticks_us()) - span // 2
+            if wait > 0:
+                time.sleep_us(wait)
+        self._capture(snapshot, ready)
+        return snapshot
+
+    def _prepare(self, snapshot):
+        """
+        Start the conversions of snapshot's sensors that make them on demand, marking
+        them converted. Returns the ticks_us by which all are in and the middle of
+        the longest one, both None without any.
+        """
+        sensors = snapshot.sensors
+        converted = snapshot.converted
+        ready = middle = None
+        longest = -1
+        for i in range(len(sensors)):
+            dev = sensors[i]
+            converted[i] = 0
+            breaker = self._breakers[dev]
+            if breaker.state and not self._admit(dev, breaker):
+                continue
+            try:
+                delay = dev.prepare()
+            except Exception as e:
+                self._failed(dev, e)
+                continue
+            if delay is not None:
+                converted[i] = 1
+                due = time.ticks_add(time.ticks_us(), delay)
+                if ready is None or time.ticks_diff(due, ready) > 0:
+                    ready = due
+                if delay > longest:
+                    longest = delay
+                    middle = time.ticks_add(due, -(delay >> 1))
+        return ready, middle
+
+    def _snapshot_for(self, key, raw, aligned) -> Snapshot:
+        snapshot = self._snapshots.get((key, raw, aligned), None)
+        if snapshot is None:
+            snapshot = Snapshot(self.get_sensors(key), raw)
+            self._snapshots[(key, raw, aligned)] = snapshot
+        return snapshot
+
+    def _capture(self, snapshot, ready=None):
+        """
+        Read every sensor of snapshot in its order, timestamping each read halfway
+        through (or when the driver's conversion was made, see I2C.sample_ticks) and
+        numbering the successful ones, modulo 2**30 like ticks_us. Converted sensors
+        are not read before ready. Failures are counted against the sensor's circuit
+        breaker and leave its entry's ok cleared.
+        """
+        sensors = snapshot.sensors
+        ok = snapshot.ok
+        raw = snapshot.raw
+        converted = snapshot.converted
+        for i in snapshot.order:
+            dev = sensors[i]
+            breaker = self._breakers[dev]
+            ok[i] = 0
+            if breaker.state and not self._admit(dev, breaker):
+                continue
+            if ready is not None and converted[i]:
+                wait = time.ticks_diff(ready, time.ticks_us())
+                if wait > 0:
+                    time.sleep_us(wait)
+                ready = None
+            start = time.ticks_us()
+            try:
+                values = dev.raw_values() if raw else dev.values()
+            except Exception as e:
+                self._failed(dev, e)
+                continue
+            latency = time.ticks_diff(time.ticks_us(), start)
+            if breaker.failures:
+                breaker.success()
+            out = snapshot.values[i]
+            for c in range(len(out)):
+                out[c] = values[c]
+            captured = dev.sample_ticks()
+            snapshot.ticks[i] = time.ticks_add(start, latency // 2) if captured is None else captured
+            snapshot.latency_us[i] = latency
+            snapshot.seq[i] = self._record_seq
+            self._record_seq = (self._record_seq + 1) & 0x3FFFFFFF
+            ok[i] = 1
+        snapshot.finish()
+        if self._wdt:
+            self._wdt.feed()
+
+    def snapshotter(self, key: str = "", raw=False):
+        """
+        Rate plan action taking a snapshot of the sensors under key and outputting
+        every reading with its capture time, as frames in binary mode or text lines
+        followed by a "Snapshot:" line with the skew. With deferred output the
+        readings go to the sensors' stores instead (skew in Snapshot.stats).
+        """
+        def action(*args):
+            deferred = self._deferred
+            snapshot = self.snapshot(key, self._store_raw if deferred else raw)
+            writer = self._frame_writer
+            for i in snapshot.captured:
+                if not snapshot.ok[i]:
+                    continue
+                dev = snapshot.sensors[i]
+                if deferred:
+                    self._stores[dev].push(snapshot.ticks[i], snapshot.values[i])
+                elif writer is not None:
+                    writer.write(dev.sensor_id, snapshot.values[i], not raw, snapshot.ticks[i])
+                else:
+                    print(dev.format_sample(snapshot.ticks[i], snapshot.values[i]))
+            if writer is None and not deferred:
+                print("Snapshot:{} t:{} skew:{}us".format(snapshot.taken, snapshot.ticks_us, snapshot.skew_us))
+        return action
+
+    def sampler(self, dev):
+        return lambda *args: self.sample(dev)
+
+    def fifo_sampler(self, dev, scaled=False):
+        """
+        Rate plan action draining dev's FIFO (read_fifo_into). With deferred output
+        the samples go to dev's store, timestamped back from now at dev.odr; else
+        to the logger when one is set (DataLogger.log_fifo), printed otherwise.
+        The logger gets raw counts (host/decode.adxl355_g scales them) unless scaled,
+        the store keeps the format enable_store chose.
+        """
+        breaker = self._breakers[dev]
+        scaled_buf = array('f', bytes(4 * 96))
+        raw_buf = array('i', bytes(4 * 96))
+
+        def action(*args):
+            if not self._deferred:
+                if self._logger is not None:
+                    self._logger.log_fifo(dev, scaled)
+                else:
+                    dev.print_fifo()
+                return
+            if breaker.state and not self._admit(dev, breaker):
+                return
+            raw = self._store_raw
+            out = raw_buf if raw else scaled_buf
+            try:
+                n = dev.read_fifo_into(out, 0, not raw)
+            except Exception as e:
+                self._failed(dev, e)
+                raise
+            if breaker.failures:
+                breaker.success()
+            store = self._stores[dev]
+            channels = store.channels
+            period_us = int(1000000 / dev.odr)
+            ts = time.ticks_add(time.ticks_us(), -(n - 1) * period_us)
+            for i in range(n):
+                store.push(time.ticks_add(ts, i * period_us), out, i * channels)
+        return action
+
+    def aggregator(self, dev, window_ms=1000, window_samples=0):
+        """
+        Rate plan action feeding an Aggregator with dev's raw samples, the whole FIFO
+        (read_fifo_into) when dev has one, and outputting one summary per window
+        instead of the samples. Plan it often enough that the FIFO never fills.
+        With deferred output the summaries wait in a small ring buffer for flush().
+        They go to the logger when one is set (DataLogger.log_summary).
+        """
+        aggregator = Aggregator(len(dev.CHANNELS), window_samples, window_ms, getattr(dev, "factor", 1.0))
+        summaries = RingBuffer(len(aggregator.summary), 4, 'f')
+        self._summaries[dev] = (dev, summaries, lambda ts, data, offset: self._output_summary(dev, ts, data, offset))
+        self._summary_drains = list(self._summaries.values())
+
+        def on_window(agg):
+            if self._deferred:
+                summaries.push(agg.summary_ticks, agg.summary)
+            elif self._logger is not None:
+                self._logger.log_summary(dev.sensor_id, agg.summary_ticks, agg.summary)
+            else:
+                self._output_summary(dev, agg.summary_ticks, agg.summary)
+        aggregator.on_window = on_window
+        breaker = self._breakers[dev]
+        fifo = getattr(dev, "read_fifo_into", None)
+        buf = array('i', bytes(4 * 96)) if fifo is not None else None
+
+        def action(*args):
+            if breaker.state and not self._admit(dev, breaker):
+                return
+            try:
+                if fifo is not None:
+                    aggregator.add_into(buf, fifo(buf, 0, False))
+                else:
+                    aggregator.add(dev.raw_values())
+            except Exception as e:
+                self._failed(dev, e)
+                raise
+            if breaker.failures:
+                breaker.success()
+        return action
+
+    def _output_summary(self, dev, ts, summary, offset=0):
+        """
+        A window summary (Aggregator.summary layout) as a FRAME_SUMMARY frame in
+        binary mode, else a text line without Add: so host tools reading samples skip it.
+        """
+        stats = len(SUMMARY_STATS)
+        channels = len(dev.CHANNELS)
+        if self._frame_writer is not None:
+            self._frame_writer.write(dev.sensor_id, summary, True, ts, offset, stats * channels + 1, summary=True)
+        else:
+            print("Summary:{} t:{} n:{} ".format(dev.sensor_id, ts, int(summary[offset + stats * channels])) +
+                  " ".join(["{}:{}".format(name, "/".join(["{:.6g}".format(summary[offset + stats * c + i])
+                                                             for i in range(stats)]))
+                            for c, name in enumerate(dev.CHANNELS)]))
+        if self._wdt:
+            self._wdt.feed()
+
+    def flush(self, limit=-1) -> int:
+        """
+        Consumer side: emit up to limit buffered samples per sensor, to the logger
+        when one is set, else as frames in binary mode or text lines otherwise.
+        Returns how many samples were written.
+        """
+        if self._event_tail != self._event_head:
+            self._print_events()
+        n = 0
+        logger = self._logger
+        for dev, store, output in self._drains:
+            if logger is not None:
+                n += logger.append_store(dev.sensor_id, store, limit)
+            else:
+                n += store.drain(output, limit)
+        for dev, store, output in self._summary_drains:
+            if logger is not None:
+                n += logger.append_store(dev.sensor_id, store, limit, summary=True)
+            else:
+                n += store.drain(output, limit)
+        if logger is not None:
+            logger.sync()
+        if self._wdt and n:
+            self._wdt.feed()
+        return n
+
+    def store_stats(self) -> dict:
+        return {self.sensor_key(dev): store.stats() for dev, store in self._stores.items()}
+
+    @staticmethod
+    def sensor_key(dev) -> str:
+        """
+        "<name> <bus>:<address>", unique across buses like the sensor_id it spells out.
+        """
+        return "{} {}:{}".format(dev.name, dev.sensor_id >> 7, hex(dev.sensor_id & 0x7F))
+
+    def bus_stats(self) -> dict:
+        """
+        I2C instrumentation of every sensor, keyed by sensor_key.
+        """
+        return {self.sensor_key(dev): dev.stats for dev in self.get_sensors()}
+
+    def print_bus_stats(self):
+        health = self.health()
+        for key, stats in self.bus_stats().items():
+            print("{}: {} breaker:{}".format(key, stats.format(), health[key]))
+        print("Bus recoveries: {}".format(self.bus_recoveries))
+
+    def reset_bus_stats(self):
+        for dev in self.get_sensors():
+            dev.stats.reset()
+
     def timer_read(self, timer=None):
         self.read()
         self._led.off()
@@ -84,6 +944,10 @@ class SensorsPool:
             return sum(list(self._sensors.values()), [])
 
     def print_config(self):
-        print("I2C Configuration: " + str(self._i2c))
-        print("I2C Address      : " + ", ".join([hex(device).upper() for device in self._devices]))
+        for i2c, devices in zip(self._buses, self._bus_devices):
+            print("I2C Configuration: " + str(i2c))
+            print("I2C Address      : " + ", ".join([hex(device).upper() for device in devices]))
+
 
+for _kind in SensorsPool.SENSOR_DATA:
+    SensorsPool._index_driver(_kind)
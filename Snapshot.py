@@ -0,0 +1,104 @@
+import time
+from array import array
+
+
+class Snapshot:
+    """
+    Timestamped readings of a fixed set of sensors, filled by SensorsPool.snapshot()
+    and read_records() and overwritten by the next call. Entry i belongs to
+    sensors[i]: values[i] holds its readings (raw integers with raw), ticks[i] the
+    ticks_us they were measured at (halfway through the read unless the driver
+    converts in advance, see I2C.sample_ticks), latency_us[i] how long the read
+    took and seq[i] the pool-wide sequence number of the reading (wraps at 2**30). Entries whose read failed
+    or whose sensor is quarantined have ok[i] cleared and keep their last values.
+
+    order is the order the sensors were read in last and captured the order of
+    their capture times, which differ when converted[i] marks a sensor converting
+    ahead of its read (I2C.prepare). skew_us is the spread between the first and
+    the last capture time and ticks_us the middle of that spread.
+    """
+
+    def __init__(self, sensors, raw=False):
+        n = len(sensors)
+        self.sensors = sensors
+        self.raw = raw
+        typecode = 'i' if raw else 'f'
+        self.values = [array(typecode, bytes(4 * len(dev.CHANNELS))) for dev in sensors]
+        self.seq = array('I', bytes(4 * n))
+        self.ticks = array('i', bytes(4 * n))
+        self.latency_us = array('i', bytes(4 * n))
+        self.ok = bytearray(n)
+        self.converted = bytearray(n)
+        self.order = list(range(n))
+        self.captured = self.order
+        self.ticks_us = 0
+        self.skew_us = 0
+        self.taken = 0
+        self.skew_max_us = 0
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def arrange(self):
+        """
+        Read order minimising skew. Converted sensors were captured while the others
+        are read and go last, their reads waiting for the conversion. Captures stamped
+        by their read are taken halfway through it, so their spread is the sum of all
+        read times less half of the first and half of the last: with the latencies of
+        the last snapshot the two slowest reads go to the ends, the rest keep their
+        registry order in between.
+        """
+        converted = self.converted
+        stamped = [i for i in range(len(self.sensors)) if not converted[i]]
+        tail = [i for i in range(len(self.sensors)) if converted[i]]
+        n = len(stamped)
+        latency = self.latency_us
+        by_latency = sorted(stamped, key=lambda i: latency[i], reverse=True)
+        if n < 3 or latency[by_latency[0]] == latency[by_latency[-1]]:
+            self.order = stamped + tail
+            return
+        first, last = by_latency[0], by_latency[1]
+        self.order = [first] + [i for i in stamped if i != first and i != last] + [last] + tail
+
+    def finish(self):
+        """
+        Update ticks_us and skew_us from the entries read this time.
+        """
+        ticks = self.ticks
+        earliest = latest = None
+        for i in range(len(self.sensors)):
+            if not self.ok[i]:
+                continue
+            if earliest is None or time.ticks_diff(ticks[i], ticks[earliest]) < 0:
+                earliest = i
+            if latest is None or time.ticks_diff(ticks[i], ticks[latest]) > 0:
+                latest = i
+        if earliest is None:
+            self.skew_us = 0
+        else:
+            self.skew_us = time.ticks_diff(ticks[latest], ticks[earliest])
+            self.ticks_us = time.ticks_add(ticks[earliest], self.skew_us // 2)
+        if any(self.converted):
+            first = ticks[earliest] if earliest is not None else 0
+            self.captured = sorted(self.order, key=lambda i: time.ticks_diff(ticks[i], first))
+        else:
+            # Stamped by their reads, captured in read order
+            self.captured = self.order
+        if self.skew_us > self.skew_max_us:
+            self.skew_max_us = self.skew_us
+        self.taken += 1
+
+    def record(self, i) -> tuple:
+        """
+        Entry i as (sensor_id, seq, ticks_us, latency_us, values), values a copy.
+        """
+        return self.sensors[i].sensor_id, self.seq[i], self.ticks[i], self.latency_us[i], list(self.values[i])
+
+    def records(self) -> list:
+        """
+        record() of every entry read successfully, in capture order.
+        """
+        return [self.record(i) for i in self.captured if self.ok[i]]
+
+    def stats(self) -> dict:
+        return {"taken": self.taken, "skew_us": self.skew_us, "skew_max_us": self.skew_max_us}
@@ -0,0 +1,91 @@
+import sys
+import time
+import ustruct
+from array import array
+from micropython import const
+
+# Frame layout, all little-endian:
+#   0  sync     0xA5 0x5A
+#   2  sensor   u8   (bus << 7) | I2C address
+#   3  flags    u8   bits 0-3 value count, FRAME_SCALED set for float32 values, int32 raw otherwise,
+#                    FRAME_SUMMARY set for an Aggregator window summary instead of a sample
+#   4  seq      u16  per-writer sequence number
+#   6  ticks    u32  time.ticks_us() at capture
+#   10 values   n * 4 bytes
+#   .. crc      u16  CRC-16/CCITT-FALSE over sensor..values
+FRAME_SYNC0 = const(0xA5)
+FRAME_SYNC1 = const(0x5A)
+FRAME_HEADER = "<BBBBHI"
+FRAME_HEADER_SIZE = const(10)
+FRAME_CRC_SIZE = const(2)
+FRAME_MAX_VALUES = const(15)
+FRAME_SCALED = const(0x10)
+FRAME_SUMMARY = const(0x20)
+FRAME_COUNT_MASK = const(0x0F)
+
+
+def _crc16_table():
+    table = array('H', bytes(512))
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[i] = crc & 0xFFFF
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(buf, start, end, crc=0xFFFF) -> int:
+    table = CRC16_TABLE
+    for i in range(start, end):
+        crc = ((crc << 8) & 0xFF00) ^ table[((crc >> 8) ^ buf[i]) & 0xFF]
+    return crc
+
+
+def frame_size(n_values) -> int:
+    return FRAME_HEADER_SIZE + 4 * n_values + FRAME_CRC_SIZE
+
+
+class FrameWriter:
+    """
+    Packs sensor values into fixed layout binary frames in a preallocated buffer
+    and writes them to a byte stream (USB serial by default).
+    """
+
+    def __init__(self, stream=None):
+        self._stream = stream if stream is not None else sys.stdout.buffer
+        self._buf = bytearray(frame_size(FRAME_MAX_VALUES))
+        view = memoryview(self._buf)
+        self._views = [view[:frame_size(n)] for n in range(FRAME_MAX_VALUES + 1)]
+        self._seq = 0
+        self.frames = 0
+
+    def pack(self, sensor_id, values, scaled=True, ticks=None, offset=0, n=-1, summary=False):
+        """
+        Pack one frame from values[offset:offset + n] (all of values by default),
+        returns a memoryview valid until the next pack/write call.
+        """
+        if n < 0:
+            n = len(values) - offset
+        if n > FRAME_MAX_VALUES:
+            raise ValueError("At most {} values per frame".format(FRAME_MAX_VALUES))
+        buf = self._buf
+        if ticks is None:
+            ticks = time.ticks_us()
+        ustruct.pack_into(FRAME_HEADER, buf, 0, FRAME_SYNC0, FRAME_SYNC1, sensor_id & 0xFF,
+                          n | (FRAME_SCALED if scaled else 0) | (FRAME_SUMMARY if summary else 0), self._seq,
+                          ticks & 0xFFFFFFFF)
+        fmt = "<f" if scaled else "<i"
+        pos = FRAME_HEADER_SIZE
+        for i in range(offset, offset + n):
+            ustruct.pack_into(fmt, buf, pos, values[i])
+            pos += 4
+        ustruct.pack_into("<H", buf, pos, crc16(buf, 2, pos))
+        self._seq = (self._seq + 1) & 0xFFFF
+        return self._views[n]
+
+    def write(self, sensor_id, values, scaled=True, ticks=None, offset=0, n=-1, summary=False):
+        self._stream.write(self.pack(sensor_id, values, scaled, ticks, offset, n, summary))
+        self.frames += 1
@@ -0,0 +1,3 @@
+"""
+CPython-side tooling for data captured from the board.
+"""
@@ -0,0 +1,554 @@
+"""
+Streaming ingest of captured sensor output into memory-mapped columnar storage,
+and resampling of the stored series onto a common time base.
+
+    python -m host.analysis ingest capture.bin store/ [--calibration calibration.json] [--text | --log]
+    python -m host.analysis info store/
+    python -m host.analysis align store/ 100 aligned.npz [--mean]
+
+    from host.analysis import Store, align
+    t_us, columns = align(Store("store"), rate_hz=100)   # columns["ADXL355@0x1d.X"], ...
+
+The capture is read in chunks. Binary frames (frame_helper.FrameWriter) are
+located, CRC checked and unpacked with NumPy a chunk at a time, text lines from
+SensorsPool.flush ("X:.. Y:.. Z:.. Add:<sensor id> t:<ticks_us>") are parsed a
+line at a time, and DataLogger dumps go through host.logfile. Raw readings get the same conversions as the drivers (see
+host.decode), so the store always holds engineering units: g, hPa, degC, %RH.
+Each sensor is stored as two append-only files, int64 unwrapped microseconds and
+float32 rows of its channels, read back as np.memmap so captures larger than
+memory only page in the windows being used.
+"""
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from host import frames
+from host.decode import ADXL355_FACTOR_2G, bme280_calibration, bme280_compensate
+
+# MicroPython's ticks_us wraps at 2**30
+TICKS_PERIOD = 1 << 30
+CHUNK_SIZE = 1 << 20
+AT30TSE75X_STEP = 0.0625
+
+# Mirrors SensorsPool.SENSOR_DATA: (kind, first address, last address + 1, channels)
+SENSOR_TYPES = (
+    ("AT30TSE75x", 0x48, 0x50, ("T",)),
+    ("BME280", 0x76, 0x77, ("P", "T", "H")),
+    ("ADXL355", 0x1D, 0x1E, ("X", "Y", "Z")),
+)
+
+
+def sensor_kind(sensor_id):
+    """
+    (kind, channels) of the driver SensorsPool creates for sensor_id's address.
+    """
+    address = sensor_id & 0x7F
+    for kind, first, last, channels in SENSOR_TYPES:
+        if first <= address < last:
+            return kind, channels
+    return "unknown", ()
+
+
+def sensor_name(sensor_id) -> str:
+    return "{}@{:#04x}".format(sensor_kind(sensor_id)[0], sensor_id)
+
+
+class Converter:
+    """
+    Raw readings to engineering units, the NumPy counterpart of the drivers'
+    values(). BME280 readings need the calibration cache the board writes
+    (SensorsPool(calibration_cache=...)), raw ones are dropped without it.
+    """
+
+    def __init__(self, calibration=None, adxl355_factor=ADXL355_FACTOR_2G):
+        if isinstance(calibration, str):
+            with open(calibration) as f:
+                calibration = json.load(f)
+        self.calibration = calibration or {}
+        self.adxl355_factor = adxl355_factor
+        self._cal = {}
+
+    def bme280_calibration(self, sensor_id):
+        if sensor_id not in self._cal:
+            # Cache keys are "<bus>:<address>:<chip id>", see BME280._load_calibration
+            prefix = "{}:{}:".format(sensor_id >> 7, hex(sensor_id & 0x7F))
+            block = next((v for k, v in self.calibration.items() if k.startswith(prefix)), None)
+            self._cal[sensor_id] = None if block is None else bme280_calibration(block)
+        return self._cal[sensor_id]
+
+    def convert(self, sensor_id, raw):
+        """
+        Returns float64 rows in engineering units, or None when raw cannot be converted.
+        """
+        kind = sensor_kind(sensor_id)[0]
+        if kind == "AT30TSE75x":
+            return raw * AT30TSE75X_STEP
+        if kind == "ADXL355":
+            return raw * self.adxl355_factor
+        if kind == "BME280":
+            cal = self.bme280_calibration(sensor_id)
+            if cal is None:
+                return None
+            pressure, temperature, humidity = bme280_compensate(raw, cal)
+            return np.stack([pressure / 100.0, temperature, humidity], axis=1)
+        return None
+
+
+def _crc16_rows(rows):
+    """
+    CRC-16/CCITT-FALSE of every row of a uint8 matrix, one table lookup per column.
+    """
+    table = np.array(frames.CRC16_TABLE, dtype=np.uint16)
+    crc = np.full(len(rows), 0xFFFF, dtype=np.uint16)
+    for column in rows.T:
+        crc = (crc << 8) ^ table[(crc >> 8) ^ column]
+    return crc
+
+
+class Batch:
+    """
+    Readings of one sensor with the same scaled flag decoded from a chunk, in
+    stream order; order holds their positions in the chunk.
+    """
+
+    def __init__(self, sensor_id, scaled, ticks, values, order):
+        self.sensor_id = sensor_id
+        self.scaled = scaled
+        self.ticks = ticks
+        self.values = values
+        self.order = order
+
+
+def _group(sensor_ids, scaled, ticks, values, order) -> list:
+    batches = []
+    keys = sensor_ids.astype(np.int64) * 2 + scaled
+    for key in np.unique(keys):
+        mask = keys == key
+        batches.append(Batch(int(key) >> 1, bool(key & 1), ticks[mask], values[mask], order[mask]))
+    return batches
+
+
+class FrameChunkDecoder:
+    """
+    Vectorized counterpart of host.frames.FrameDecoder: every frame that a chunk
+    completes is found, CRC checked and unpacked with array operations, grouped
+    per value count. A candidate starting inside an already accepted frame is
+    dropped, and a partial frame at the end of a chunk is carried into the next.
+    Aggregator summary frames are counted but not returned, they are not samples.
+    """
+
+    def __init__(self):
+        self._carry = b""
+        self._last_seq = None
+        self.frames = 0
+        self.summaries = 0
+        self.crc_errors = 0
+        self.lost_frames = 0
+
+    def feed(self, data) -> list:
+        data = self._carry + bytes(data)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        size = len(buf)
+        header = frames.FRAME_HEADER.size
+        starts = np.flatnonzero((buf[:-1] == 0xA5) & (buf[1:] == 0x5A))
+        complete = starts + header <= size
+        counts = np.zeros(len(starts), dtype=np.uint8)
+        counts[complete] = buf[starts[complete] + 3] & frames.FRAME_COUNT_MASK
+        ends = starts + header + 4 * counts.astype(np.int64) + frames.FRAME_CRC.size
+        complete &= ends <= size
+        pending = starts[~complete]
+        starts, counts, ends = starts[complete], counts[complete], ends[complete]
+
+        valid = np.zeros(len(starts), dtype=bool)
+        for n in np.unique(counts):
+            group = np.flatnonzero(counts == n)
+            length = header + 4 * int(n) + frames.FRAME_CRC.size
+            rows = buf[starts[group, None] + np.arange(length)]
+            crc = rows[:, -2].astype(np.uint16) | (rows[:, -1].astype(np.uint16) << 8)
+            valid[group] = _crc16_rows(rows[:, 2:-2]) == crc
+        invalid = starts[~valid]
+        starts, counts, ends = starts[valid], counts[valid], ends[valid]
+        last_end = 0
+        if len(starts):
+            covered = np.concatenate(([0], np.maximum.accumulate(ends)[:-1]))
+            keep = starts >= covered
+            starts, counts, ends = starts[keep], counts[keep], ends[keep]
+            last_end = int(ends[-1])
+            # Sync words inside an accepted frame's payload are not CRC errors
+            inside = np.searchsorted(starts, invalid, side="right") - 1
+            invalid = invalid[(inside < 0) | (invalid >= ends[np.maximum(inside, 0)])]
+
+        # Carry the first frame this chunk cannot finish, or a trailing 0xA5, into the next
+        pending = pending[pending >= last_end]
+        if len(pending):
+            carry = int(pending[0])
+        elif size > last_end and buf[-1] == 0xA5:
+            carry = size - 1
+        else:
+            carry = size
+        self._carry = data[carry:]
+        # Candidates in the carry are checked again with the next chunk
+        self.crc_errors += int((invalid < carry).sum())
+        self._track_seq(buf, starts)
+
+        batches = []
+        summary = (buf[starts + 3] & frames.FRAME_SUMMARY) != 0
+        self.summaries += int(summary.sum())
+        for n in np.unique(counts):
+            group = starts[(counts == n) & ~summary]
+            if not len(group):
+                continue
+            rows = buf[group[:, None] + np.arange(header + 4 * int(n))]
+            sensor_ids = rows[:, 2]
+            scaled = (rows[:, 3] & frames.FRAME_SCALED) != 0
+            ticks = np.ascontiguousarray(rows[:, 6:10]).view("<u4")[:, 0]
+            payload = np.ascontiguousarray(rows[:, header:])
+            values = np.where(scaled[:, None], payload.view("<f4"), payload.view("<i4"))
+            batches += _group(sensor_ids, scaled, ticks, values, group)
+        self.frames += len(starts)
+        return batches
+
+    def _track_seq(self, buf, starts):
+        if not len(starts):
+            return
+        seq = buf[starts[:, None] + np.array([4, 5])].astype(np.int64)
+        seq = seq[:, 0] | (seq[:, 1] << 8)
+        if self._last_seq is not None:
+            seq = np.concatenate(([self._last_seq], seq))
+        self.lost_frames += int(((np.diff(seq) - 1) & 0xFFFF).sum())
+        self._last_seq = int(seq[-1])
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "summaries": self.summaries, "crc_errors": self.crc_errors,
+                "lost_frames": self.lost_frames}
+
+
+class TextChunkParser:
+    """
+    Parses the text lines written by SensorsPool.flush. Lines without a sensor id
+    and timestamp (prompts, direct driver prints) are counted in skipped_lines.
+    Values without a decimal point are taken as raw readings (enable_store(raw=True)).
+    """
+    FIELD = re.compile(r"(\w+):(\S+)")
+
+    def __init__(self):
+        self._carry = b""
+        self.lines = 0
+        self.skipped_lines = 0
+
+    def feed(self, data) -> list:
+        data = self._carry + bytes(data)
+        lines = data.split(b"\n")
+        self._carry = lines.pop()
+        rows = {}
+        for position, line in enumerate(lines):
+            fields = self.FIELD.findall(line.decode("ascii", "replace"))
+            try:
+                fields = dict(fields)
+                sensor_id = int(fields.pop("Add"))
+                ticks = int(fields.pop("t"))
+                scaled = any("." in v or "n" in v for v in fields.values())
+                values = [float(v) for v in fields.values()]
+            except (KeyError, ValueError):
+                self.skipped_lines += 1
+                continue
+            rows.setdefault((sensor_id, scaled), []).append([position, ticks] + values)
+        self.lines += len(lines)
+
+        batches = []
+        for (sensor_id, scaled), group in rows.items():
+            width = len(group[0])
+            group = np.array([row for row in group if len(row) == width], dtype=np.float64)
+            ticks = group[:, 1].astype(np.int64)
+            values = group[:, 2:] if scaled else group[:, 2:].astype(np.int64)
+            batches.append(Batch(sensor_id, scaled, ticks, values, group[:, 0].astype(np.int64)))
+        return batches
+
+    def stats(self) -> dict:
+        return {"lines": self.lines, "skipped_lines": self.skipped_lines}
+
+
+class Store:
+    """
+    Directory of per-sensor append-only series: <id>.t (int64 us) and <id>.v
+    (float32 rows of the sensor's channels), described by meta.json.
+    """
+    META = "meta.json"
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(os.path.join(path, self.META)) as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            self.meta = {"sensors": {}}
+
+    def _file(self, sensor_id, lane) -> str:
+        return os.path.join(self.path, "{:03x}.{}".format(sensor_id, lane))
+
+    def sensors(self) -> list:
+        return sorted(int(k) for k in self.meta["sensors"])
+
+    def channels(self, sensor_id) -> list:
+        return self.meta["sensors"][str(sensor_id)]["channels"]
+
+    def __len__(self):
+        return sum(s["rows"] for s in self.meta["sensors"].values())
+
+    def append(self, sensor_id, t_us, values):
+        info = self.meta["sensors"].setdefault(str(sensor_id), {
+            "name": sensor_name(sensor_id),
+            "channels": list(sensor_kind(sensor_id)[1]) or ["V{}".format(i) for i in range(values.shape[1])],
+            "rows": 0})
+        if values.shape[1] != len(info["channels"]):
+            raise ValueError("{} has {} channels, got {}".format(info["name"], len(info["channels"]),
+                                                                 values.shape[1]))
+        with open(self._file(sensor_id, "t"), "ab") as f:
+            f.write(np.ascontiguousarray(t_us, dtype="<i8").tobytes())
+        with open(self._file(sensor_id, "v"), "ab") as f:
+            f.write(np.ascontiguousarray(values, dtype="<f4").tobytes())
+        info["rows"] += len(t_us)
+
+    def last_time(self, sensor_id):
+        info = self.meta["sensors"].get(str(sensor_id))
+        if not info or not info["rows"]:
+            return None
+        return int(self.times(sensor_id)[-1])
+
+    def flush(self):
+        with open(os.path.join(self.path, self.META), "w") as f:
+            json.dump(self.meta, f, indent=1)
+
+    def times(self, sensor_id) -> np.ndarray:
+        rows = self.meta["sensors"][str(sensor_id)]["rows"]
+        return np.memmap(self._file(sensor_id, "t"), dtype="<i8", mode="r", shape=(rows,))
+
+    def values(self, sensor_id) -> np.ndarray:
+        info = self.meta["sensors"][str(sensor_id)]
+        return np.memmap(self._file(sensor_id, "v"), dtype="<f4", mode="r",
+                         shape=(info["rows"], len(info["channels"])))
+
+    def window(self, sensor_id, start_us=None, stop_us=None):
+        """
+        (times, values) memmap slices of sensor_id with start_us <= t < stop_us.
+        """
+        t = self.times(sensor_id)
+        lo = 0 if start_us is None else int(np.searchsorted(t, start_us))
+        hi = len(t) if stop_us is None else int(np.searchsorted(t, stop_us))
+        return t[lo:hi], self.values(sensor_id)[lo:hi]
+
+    def span(self):
+        """
+        (first, last) timestamp over all sensors, None for an empty store.
+        """
+        spans = [(int(self.times(s)[0]), int(self.times(s)[-1])) for s in self.sensors()
+                 if self.meta["sensors"][str(s)]["rows"]]
+        if not spans:
+            return None
+        return min(s[0] for s in spans), max(s[1] for s in spans)
+
+
+def unwrap_ticks(ticks, reference=None, period=TICKS_PERIOD) -> np.ndarray:
+    """
+    Wrapping ticks of one sensor, in capture order, to monotonic int64 us. The first
+    one is placed nearest to reference (the previous unwrapped time), so consecutive
+    readings must be less than half a period (about 9 minutes) apart.
+    """
+    ticks = np.asarray(ticks, dtype=np.int64) % period
+    if not len(ticks):
+        return ticks
+    first = int(ticks[0])
+    if reference is not None:
+        first = reference + (first - reference + period // 2) % period - period // 2
+    return first + np.concatenate(([0], np.cumsum(np.diff(ticks) % period)))
+
+
+class Ingest:
+    """
+    Feeds capture chunks through a decoder into a Store: converts raw readings,
+    unwraps timestamps per sensor and appends. Readings that cannot be converted
+    are counted in dropped.
+    """
+
+    def __init__(self, store: Store, converter: Converter = None, text=False, decoder=None):
+        self.store = store
+        self.converter = converter if converter is not None else Converter()
+        if decoder is None:
+            decoder = TextChunkParser() if text else FrameChunkDecoder()
+        self.decoder = decoder
+        self.dropped = 0
+        self._last = {}
+        for sensor_id in store.sensors():
+            last = store.last_time(sensor_id)
+            if last is not None:
+                self._last[sensor_id] = last
+
+    def feed(self, chunk) -> int:
+        parts = {}
+        for batch in self.decoder.feed(chunk):
+            values = batch.values
+            if not batch.scaled:
+                values = self.converter.convert(batch.sensor_id, values)
+                if values is None:
+                    self.dropped += len(batch.ticks)
+                    continue
+            parts.setdefault(batch.sensor_id, []).append((batch.order, batch.ticks, values))
+
+        n = 0
+        for sensor_id, part in parts.items():
+            # Scaled and raw readings of a sensor come in separate batches, restore stream order
+            order = np.argsort(np.concatenate([p[0] for p in part]), kind="stable")
+            ticks = np.concatenate([p[1] for p in part]).astype(np.int64)[order]
+            values = np.concatenate([p[2] for p in part])[order]
+            reference = self._last.get(sensor_id)
+            if reference is None and self._last:
+                reference = max(self._last.values())
+            t_us = unwrap_ticks(ticks, reference)
+            self.store.append(sensor_id, t_us, values)
+            self._last[sensor_id] = int(t_us[-1])
+            n += len(t_us)
+        return n
+
+    def feed_stream(self, stream, chunk_size=CHUNK_SIZE) -> int:
+        n = 0
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            n += self.feed(chunk)
+        self.store.flush()
+        return n
+
+    def stats(self) -> dict:
+        stats = self.decoder.stats()
+        stats["dropped"] = self.dropped
+        stats["rows"] = len(self.store)
+        return stats
+
+
+def resample(t, values, grid, max_gap_us=None, mean=False) -> np.ndarray:
+    """
+    Resample one sensor's (t, values) rows onto grid (int64 us). Linear interpolation
+    by default, with mean=True the average of the readings in [grid[i], grid[i + 1])
+    instead (the right choice when decimating the accelerometer). Grid points further
+    than max_gap_us from any reading, or bins without readings, are NaN.
+    """
+    t = np.asarray(t)
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full((len(grid), values.shape[1]), np.nan)
+    if not len(t):
+        return out
+    if mean:
+        step = grid[1] - grid[0] if len(grid) > 1 else 1
+        edges = np.searchsorted(t, np.append(grid, grid[-1] + step))
+        sums = np.concatenate((np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)))
+        counts = np.diff(edges)
+        nonempty = counts > 0
+        out[nonempty] = (sums[edges[1:]] - sums[edges[:-1]])[nonempty] / counts[nonempty, None]
+        return out
+    for i in range(values.shape[1]):
+        out[:, i] = np.interp(grid, t, values[:, i], left=np.nan, right=np.nan)
+    if max_gap_us is not None:
+        right = np.clip(np.searchsorted(t, grid), 0, len(t) - 1)
+        left = np.clip(right - 1, 0, len(t) - 1)
+        gap = np.minimum(np.abs(t[right] - grid), np.abs(grid - t[left]))
+        out[gap > max_gap_us] = np.nan
+    return out
+
+
+def align(store: Store, rate_hz, start_us=None, stop_us=None, sensors=None, max_gap_us=None, mean=False,
+          out_dir=None, block=1 << 20):
+    """
+    Resample the chosen sensors (all by default) onto one grid at rate_hz covering
+    [start_us, stop_us), the store's whole span by default. Returns the grid and a
+    dict of columns named "<kind>@<id>.<channel>". Work is done block grid points at
+    a time from memmap windows; with out_dir the grid and columns are written there
+    as .npy files and returned memory-mapped, so the result can exceed memory too.
+    """
+    span = store.span()
+    if span is None:
+        return np.zeros(0, dtype=np.int64), {}
+    start_us = span[0] if start_us is None else start_us
+    stop_us = span[1] + 1 if stop_us is None else stop_us
+    period_us = 1e6 / rate_hz
+    count = max(0, int(np.ceil((stop_us - start_us) / period_us)))
+    sensors = store.sensors() if sensors is None else sensors
+
+    def column(name, dtype):
+        if out_dir is None:
+            return np.empty(count, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(out_dir, name + ".npy"), mode="w+", dtype=dtype,
+                                         shape=(count,))
+
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+    grid = column("t_us", np.int64)
+    columns = {}
+    for sensor_id in sensors:
+        for channel in store.channels(sensor_id):
+            columns["{}.{}".format(sensor_name(sensor_id), channel)] = column(
+                "{}.{}".format(sensor_name(sensor_id), channel), np.float64)
+
+    for lo in range(0, count, block):
+        hi = min(count, lo + block)
+        part = start_us + np.round(np.arange(lo, hi) * period_us).astype(np.int64)
+        grid[lo:hi] = part
+        # Readings just outside the block are needed to interpolate its edges
+        margin = int(period_us) + (max_gap_us or 0)
+        for sensor_id in sensors:
+            t, values = store.window(sensor_id, part[0] - margin, part[-1] + margin + 1)
+            rows = resample(t, values, part, max_gap_us, mean)
+            for i, channel in enumerate(store.channels(sensor_id)):
+                columns["{}.{}".format(sensor_name(sensor_id), channel)][lo:hi] = rows[:, i]
+    return grid, columns
+
+
+# Positional arguments each command needs
+COMMAND_ARGS = {"ingest": 2, "info": 1, "align": 3}
+
+
+def main(argv) -> int:
+    command, args = (argv[0], argv[1:]) if argv else (None, [])
+    calibration = None
+    if "--calibration" in args:
+        i = args.index("--calibration")
+        calibration = args[i + 1] if i + 1 < len(args) else None
+        args = args[:i] + args[i + 2:]
+    positional = [arg for arg in args if not arg.startswith("--")]
+    if command not in COMMAND_ARGS or len(positional) != COMMAND_ARGS[command] or \
+            ("--calibration" in argv and calibration is None):
+        print(__doc__.strip().split("\n\n")[1])
+        return 2
+    args = positional + [arg for arg in args if arg.startswith("--")]
+    if command == "ingest":
+        source, store = args[0], Store(args[1])
+        decoder = None
+        if "--log" in args:
+            # DataLogger dumps, imported here as host.logfile builds on this module
+            from host.logfile import LogBlockDecoder
+            decoder = LogBlockDecoder()
+        ingest = Ingest(store, Converter(calibration), text="--text" in args, decoder=decoder)
+        with open(source, "rb") if source != "-" else sys.stdin.buffer as stream:
+            ingest.feed_stream(stream)
+        print(ingest.stats())
+    elif command == "info":
+        store = Store(args[0])
+        for sensor_id in store.sensors():
+            t = store.times(sensor_id)
+            duration = (t[-1] - t[0]) / 1e6 if len(t) else 0
+            print("{} {}: {} rows over {:.1f}s ({:.1f} Hz)".format(
+                sensor_name(sensor_id), ",".join(store.channels(sensor_id)), len(t), duration,
+                (len(t) - 1) / duration if duration else 0))
+    else:
+        grid, columns = align(Store(args[0]), float(args[1]), mean="--mean" in args)
+        np.savez(args[2], t_us=grid, **columns)
+        print("{} rows x {} columns written to {}".format(len(grid), len(columns), args[2]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
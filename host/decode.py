@@ -0,0 +1,131 @@
+"""
+Vectorized decoding of raw sensor register dumps with NumPy.
+
+    from host.decode import adxl355_counts, adxl355_g, adxl355_fifo
+    counts = adxl355_counts(raw)             # (n, 3) int32, n 9-byte XDATA3..ZDATA1 samples
+    g = adxl355_g(raw, ADXL355_FACTOR_2G)    # (n, 3) float64
+    counts, dropped = adxl355_fifo(raw)      # FIFO_DATA dump, realigned on the X marker
+
+    cal = bme280_calibration(json.load(open("calibration.json"))["0:0x76:0x60"])
+    p, t, h = bme280_compensate(raw_pth, cal)  # (n, 3) raw triples to Pa, degC, %RH
+
+The bit layouts and integer formulas mirror ADXL355.decode_raw_into /
+read_fifo_into and BME280.compensate_into; keep them in sync.
+"""
+import struct
+
+import numpy as np
+
+# g per count for each measurement range (ADXL355.setrange)
+ADXL355_FACTOR_2G = 2.048 * 2 / 2 ** 20
+ADXL355_FACTOR_4G = 4.096 * 2 / 2 ** 20
+ADXL355_FACTOR_8G = 8.192 * 2 / 2 ** 20
+
+ADXL355_FIFO_X_MARKER = 0x01
+ADXL355_FIFO_EMPTY = 0x02
+
+
+def _adxl355_entries(data) -> np.ndarray:
+    """
+    Signed 20-bit values of every complete 3-byte entry in data.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    entries = raw[:len(raw) - len(raw) % 3].reshape(-1, 3).astype(np.int32)
+    values = (entries[:, 0] << 12) | (entries[:, 1] << 4) | (entries[:, 2] >> 4)
+    return values - ((values & 0x80000) << 1)
+
+
+def adxl355_counts(data) -> np.ndarray:
+    """
+    Decode consecutive 9-byte X/Y/Z samples into an (n, 3) int32 array of counts.
+    A trailing partial sample is ignored.
+    """
+    values = _adxl355_entries(data)
+    return values[:len(values) - len(values) % 3].reshape(-1, 3)
+
+
+def adxl355_g(data, factor=ADXL355_FACTOR_2G) -> np.ndarray:
+    return adxl355_counts(data) * factor
+
+
+def adxl355_fifo(data):
+    """
+    Decode a REG_FIFO_DATA dump, keeping only entries that form a full X/Y/Z
+    triplet (X marker on the first entry, no marker or empty flag on the next two).
+    Returns the (n, 3) int32 counts and the number of entries dropped.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    n_entries = len(raw) // 3
+    if n_entries < 3:
+        return np.zeros((0, 3), dtype=np.int32), n_entries
+    flags = raw[2:3 * n_entries:3] & (ADXL355_FIFO_X_MARKER | ADXL355_FIFO_EMPTY)
+    # Triplet starts can not overlap, the two entries after a start carry no X marker
+    starts = np.flatnonzero((flags[:-2] == ADXL355_FIFO_X_MARKER) & (flags[1:-1] == 0) & (flags[2:] == 0))
+    values = _adxl355_entries(data)
+    counts = values[starts[:, None] + np.arange(3)]
+    return counts, n_entries - 3 * len(starts)
+
+
+BME280_CALIBRATION = struct.Struct("<HhhHhhhhhhhhxBhBbBbb")
+BMP280_CALIBRATION = struct.Struct("<HhhHhhhhhhhh")
+
+
+def bme280_calibration(block) -> np.ndarray:
+    """
+    T1-T3, P1-P9[, H1-H6] as int64 from a calibration block, e.g. an entry of the
+    board's calibration cache.
+    """
+    block = bytes(block)
+    if len(block) == BME280_CALIBRATION.size:
+        cal = BME280_CALIBRATION.unpack(block)
+        e4, e5, e6 = cal[15:18]
+        cal = cal[:15] + ((e4 << 4) | (e5 & 0x0F), (e6 << 4) | (e5 >> 4), cal[18])
+    else:
+        cal = BMP280_CALIBRATION.unpack(block[:BMP280_CALIBRATION.size])
+    return np.array(cal, dtype=np.int64)
+
+
+def bme280_compensate_fixed(raw, cal):
+    """
+    The datasheet integer compensation over an (n, 3) array of raw (p, t, h).
+    Returns int64 arrays of Pa * 256, 0.01 degC and %RH * 1024, bit-exact with
+    BME280.compensate_into (humidity is 0 without H coefficients).
+    """
+    raw = np.asarray(raw, dtype=np.int64).reshape(-1, 3)
+    adc_p, adc_t, adc_h = raw[:, 0], raw[:, 1], raw[:, 2]
+    t1, t2, t3 = cal[0:3]
+    p1, p2, p3, p4, p5, p6, p7, p8, p9 = cal[3:12]
+
+    var1 = (((adc_t >> 3) - (t1 << 1)) * t2) >> 11
+    var2 = (((((adc_t >> 4) - t1) * ((adc_t >> 4) - t1)) >> 12) * t3) >> 14
+    t_fine = var1 + var2
+    temperature = (t_fine * 5 + 128) >> 8
+
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * p6 + ((var1 * p5) << 17) + (p4 << 35)
+    var1 = ((var1 * var1 * p3) >> 8) + ((var1 * p2) << 12)
+    var1 = (((1 << 47) + var1) * p1) >> 33
+    valid = var1 != 0
+    p = 1048576 - adc_p
+    p = (((p << 31) - var2) * 3125) // np.where(valid, var1, 1)
+    var1 = (p9 * (p >> 13) * (p >> 13)) >> 25
+    var2 = (p8 * p) >> 19
+    pressure = np.where(valid, ((p + var1 + var2) >> 8) + (p7 << 4), 0)
+
+    if len(cal) < 18:
+        return pressure, temperature, np.zeros_like(pressure)
+    h1, h2, h3, h4, h5, h6 = cal[12:18]
+    v = t_fine - 76800
+    v = ((((adc_h << 14) - (h4 << 20) - (h5 * v)) + 16384) >> 15) * \
+        (((((((v * h6) >> 10) * (((v * h3) >> 11) + 32768)) >> 10) + 2097152) * h2 + 8192) >> 14)
+    v = v - (((((v >> 15) * (v >> 15)) >> 7) * h1) >> 4)
+    humidity = np.clip(v, 0, 419430400) >> 12
+    return pressure, temperature, humidity
+
+
+def bme280_compensate(raw, cal):
+    """
+    Pressure in Pa, temperature in degC and relative humidity in % as float arrays.
+    """
+    pressure, temperature, humidity = bme280_compensate_fixed(raw, cal)
+    return pressure / 256.0, temperature / 100.0, humidity / 1024.0
@@ -0,0 +1,125 @@
+"""
+Decoder for the binary frames produced by frame_helper.FrameWriter.
+
+    python -m host.frames capture.bin
+
+The layout is duplicated here (rather than imported) so the host side does not
+need the MicroPython stand-ins; keep it in sync with frame_helper.py.
+"""
+import struct
+import sys
+from collections import namedtuple
+
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_HEADER = struct.Struct("<BBBBHI")
+FRAME_CRC = struct.Struct("<H")
+FRAME_SCALED = 0x10
+FRAME_SUMMARY = 0x20
+FRAME_COUNT_MASK = 0x0F
+
+# summary frames hold an Aggregator window: mean, min, max, rms per channel, then the sample count
+Frame = namedtuple("Frame", "sensor_id seq ticks_us scaled values summary", defaults=(False,))
+
+
+def _crc16_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, crc=0xFFFF) -> int:
+    table = CRC16_TABLE
+    for b in data:
+        crc = ((crc << 8) & 0xFF00) ^ table[((crc >> 8) ^ b) & 0xFF]
+    return crc
+
+
+class FrameDecoder:
+    """
+    Incremental decoder: feed() arbitrary chunks of the serial stream and get back
+    the complete frames they finish. Bytes that do not start a valid frame (text
+    output, line noise, a frame with a bad CRC) are skipped one at a time until the
+    next sync word, so a corrupted frame costs only itself.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._last_seq = None
+        self.frames = 0
+        self.crc_errors = 0
+        self.skipped_bytes = 0
+        self.lost_frames = 0
+
+    def feed(self, data) -> list:
+        buf = self._buf
+        buf += data
+        frames = []
+        pos = 0
+        while True:
+            start = buf.find(FRAME_SYNC, pos)
+            if start < 0:
+                # Keep a trailing 0xA5, it may be the first half of a sync word
+                keep = 1 if buf.endswith(FRAME_SYNC[:1]) else 0
+                self.skipped_bytes += len(buf) - pos - keep
+                pos = len(buf) - keep
+                break
+            self.skipped_bytes += start - pos
+            if len(buf) - start < FRAME_HEADER.size:
+                pos = start
+                break
+            _, _, sensor_id, flags, seq, ticks = FRAME_HEADER.unpack_from(buf, start)
+            n = flags & FRAME_COUNT_MASK
+            end = start + FRAME_HEADER.size + 4 * n
+            if len(buf) < end + FRAME_CRC.size:
+                pos = start
+                break
+            if crc16(memoryview(buf)[start + 2:end]) != FRAME_CRC.unpack_from(buf, end)[0]:
+                self.crc_errors += 1
+                self.skipped_bytes += 1
+                pos = start + 1
+                continue
+            scaled = bool(flags & FRAME_SCALED)
+            values = struct.unpack_from(("<%df" if scaled else "<%di") % n, buf, start + FRAME_HEADER.size)
+            frames.append(Frame(sensor_id, seq, ticks, scaled, values, bool(flags & FRAME_SUMMARY)))
+            self._track_seq(seq)
+            pos = end + FRAME_CRC.size
+        del buf[:pos]
+        self.frames += len(frames)
+        return frames
+
+    def _track_seq(self, seq):
+        if self._last_seq is not None:
+            self.lost_frames += (seq - self._last_seq - 1) & 0xFFFF
+        self._last_seq = seq
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "crc_errors": self.crc_errors,
+                "skipped_bytes": self.skipped_bytes, "lost_frames": self.lost_frames}
+
+
+def iter_frames(stream, chunk_size=65536):
+    decoder = FrameDecoder()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield from decoder.feed(chunk)
+
+
+def main(argv):
+    with open(argv[0], "rb") if argv else sys.stdin.buffer as stream:
+        for frame in iter_frames(stream):
+            print("{:#04x} seq:{} t:{}us {}{}".format(frame.sensor_id, frame.seq, frame.ticks_us,
+                                                       "summary " if frame.summary else "",
+                                                       " ".join(str(v) for v in frame.values)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
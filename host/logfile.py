@@ -0,0 +1,136 @@
+"""
+Reader for the flash logs written by DataLogger, as dumped by main.py's 'u'
+command or copied off the board (mpremote cp :log/00000.log .).
+
+    python -m host.logfile dump.bin                  # print the samples
+    python -m host.analysis ingest dump.bin store/ --log
+
+Blocks are located by their magic and CRC, so text around a dump, torn blocks
+left by a reset and files concatenated in any order are all fine; blocks are
+returned in sequence number order. The layout is duplicated from DataLogger.py
+(see the comment there); keep them in sync.
+"""
+import struct
+import sys
+
+import numpy as np
+
+from host import frames
+from host.analysis import TICKS_PERIOD, Batch
+
+BLOCK_MAGIC = b"\xd1LOG"
+BLOCK_HEADER = struct.Struct("<4sIHH")
+BLOCK_SIZE = 4096
+RECORD_HEADER = struct.Struct("<BBHII")
+LOG_SCALED = 0x10
+LOG_SUMMARY = 0x20
+LOG_CHANNELS_MASK = 0x0F
+
+
+def scan_blocks(data):
+    """
+    Returns the valid blocks of data as (seq, payload) in the order found, the
+    number of bad blocks skipped, and where an unfinished block (or a partial
+    magic) at the end of data starts.
+    """
+    raw = bytes(data)
+    view = memoryview(raw)
+    blocks = []
+    bad = 0
+    pos = raw.find(BLOCK_MAGIC)
+    while 0 <= pos and pos + BLOCK_SIZE <= len(raw):
+        _, seq, used, crc = BLOCK_HEADER.unpack_from(raw, pos)
+        payload = view[pos + BLOCK_HEADER.size:pos + BLOCK_HEADER.size + used]
+        if used <= BLOCK_SIZE - BLOCK_HEADER.size and frames.crc16(payload) == crc:
+            blocks.append((seq, payload))
+            pos = raw.find(BLOCK_MAGIC, pos + BLOCK_SIZE)
+        else:
+            bad += 1
+            pos = raw.find(BLOCK_MAGIC, pos + 1)
+    if pos < 0:
+        pos = max(0, len(raw) - len(BLOCK_MAGIC) + 1)
+    return blocks, bad, pos
+
+
+def iter_records(payload):
+    """
+    Yields (sensor_id, scaled, ticks, values, summary) per record of a block
+    payload, ticks an int64 array of ticks_us and values an (n, channels) array.
+    Summary records hold Aggregator windows, laid out like summary frames.
+    """
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(payload):
+        sensor_id, flags, count, ticks0, period_us = RECORD_HEADER.unpack_from(payload, pos)
+        pos += RECORD_HEADER.size
+        channels = flags & LOG_CHANNELS_MASK
+        scaled = bool(flags & LOG_SCALED)
+        if period_us:
+            ticks = (ticks0 + period_us * np.arange(count, dtype=np.int64)) % TICKS_PERIOD
+        else:
+            ticks = np.frombuffer(payload, dtype="<u4", count=count, offset=pos).astype(np.int64)
+            pos += 4 * count
+        values = np.frombuffer(payload, dtype="<f4" if scaled else "<i4", count=count * channels,
+                               offset=pos).reshape(count, channels)
+        pos += 4 * count * channels
+        yield sensor_id, scaled, ticks, values, bool(flags & LOG_SUMMARY)
+
+
+def read_blocks(data) -> list:
+    """
+    Valid blocks of data as (seq, payload), sorted by seq with duplicates dropped.
+    """
+    found, _, _ = scan_blocks(data)
+    blocks = dict(found)
+    return [(seq, blocks[seq]) for seq in sorted(blocks)]
+
+
+class LogBlockDecoder:
+    """
+    Chunked decoder with the FrameChunkDecoder interface, for host.analysis.Ingest.
+    Blocks are taken in the order they arrive; dumps are oldest first. Aggregator
+    summary records are counted but not returned, they are not samples.
+    """
+
+    def __init__(self):
+        self._carry = b""
+        self._order = 0
+        self.blocks = 0
+        self.records = 0
+        self.summaries = 0
+        self.bad_blocks = 0
+
+    def feed(self, data) -> list:
+        data = self._carry + bytes(data)
+        blocks, bad, tail = scan_blocks(data)
+        self._carry = data[tail:]
+        self.bad_blocks += bad
+        batches = []
+        for seq, payload in blocks:
+            self.blocks += 1
+            for sensor_id, scaled, ticks, values, summary in iter_records(payload):
+                if summary:
+                    self.summaries += len(ticks)
+                    continue
+                order = self._order + np.arange(len(ticks))
+                self._order += len(ticks)
+                batches.append(Batch(sensor_id, scaled, ticks, values, order))
+                self.records += 1
+        return batches
+
+    def stats(self) -> dict:
+        return {"blocks": self.blocks, "records": self.records, "summaries": self.summaries,
+                "bad_blocks": self.bad_blocks}
+
+
+def main(argv):
+    with open(argv[0], "rb") if argv else sys.stdin.buffer as stream:
+        data = stream.read()
+    for seq, payload in read_blocks(data):
+        for sensor_id, scaled, ticks, values, summary in iter_records(payload):
+            for t, row in zip(ticks, values):
+                print("{:#04x} block:{} t:{}us {}{}".format(sensor_id, seq, t, "summary " if summary else "",
+                                                            " ".join(str(v) for v in row)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,17 +1,147 @@
 import machine
 import time
 import ustruct
+from array import array
 from micropython import const
 
 
+def clock_out_bus(scl, sda, pulses=9):
+    """
+    Free a bus held low by a device stuck mid-byte (e.g. reset during a read):
+    clock SCL until the device has shifted its byte out and releases SDA, then
+    generate a STOP. scl and sda are pin numbers; they are left as open-drain GPIOs,
+    so the I2C peripheral has to be initialised again afterwards.
+    Returns whether SDA reads high at the end.
+    """
+    scl = machine.Pin(scl, mode=machine.Pin.OPEN_DRAIN, pull=machine.Pin.PULL_UP, value=1)
+    sda = machine.Pin(sda, mode=machine.Pin.OPEN_DRAIN, pull=machine.Pin.PULL_UP, value=1)
+    # Always the full 9 clocks, SDA may read high while the device is between bits
+    for _ in range(pulses):
+        scl.value(0)
+        time.sleep_us(5)
+        scl.value(1)
+        time.sleep_us(5)
+    # STOP: SDA rises while SCL is high
+    sda.value(0)
+    time.sleep_us(5)
+    sda.value(1)
+    time.sleep_us(5)
+    return sda.value() == 1
+
+
+# All multiples of 4 so a latency's bucket is one lookup, _BUCKET_OF[(latency + 3) >> 2]
+LATENCY_BUCKETS_US = (100, 200, 500, 1000, 2000, 5000, 10000)
+_BUCKET_OF = bytes([sum([1 for bound in LATENCY_BUCKETS_US if 4 * q > bound])
+                    for q in range(LATENCY_BUCKETS_US[-1] // 4 + 1)])
+_LATENCY_NONE = const(0x3FFFFFFF)
+
+
+class I2CStats:
+    """
+    Per-device transaction counters and ticks_us latencies, cheap enough to stay
+    on in production: a successful transfer costs two ticks_us calls and a few
+    integer updates.
+    """
+    # Upper bounds of the latency histogram buckets in us, the last bucket is open ended
+    BUCKETS_US = LATENCY_BUCKETS_US
+    BUCKET_OF = _BUCKET_OF
+
+    def __init__(self):
+        self.histogram = array('I', bytes(4 * (len(self.BUCKETS_US) + 1)))
+        self.reset()
+
+    def reset(self):
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.errors = {}
+        self._latency_min_us = _LATENCY_NONE
+        self.latency_max_us = 0
+        self._latency_sum_us = 0
+        self._latency_count = 0
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+
+    def record(self, start_us, nread, nwritten):
+        latency = time.ticks_diff(time.ticks_us(), start_us)
+        if nread:
+            self.reads += 1
+        else:
+            self.writes += 1
+        self.bytes_read += nread
+        self.bytes_written += nwritten
+        if latency < self._latency_min_us:
+            self._latency_min_us = latency
+        if latency > self.latency_max_us:
+            self.latency_max_us = latency
+        # Halve both terms before the sum leaves small int range, the mean stays put
+        if self._latency_sum_us > 0x1FFFFFFF:
+            self._latency_sum_us >>= 1
+            self._latency_count >>= 1
+        self._latency_sum_us += latency
+        self._latency_count += 1
+        q = (latency + 3) >> 2
+        bucket_of = self.BUCKET_OF
+        self.histogram[bucket_of[q] if q < len(bucket_of) else len(self.BUCKETS_US)] += 1
+
+    def error(self, e):
+        key = "{}({})".format(type(e).__name__, e.args[0] if e.args else "")
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    @property
+    def transactions(self) -> int:
+        return self.reads + self.writes
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+    @property
+    def latency_min_us(self) -> int:
+        return self._latency_min_us if self._latency_count else 0
+
+    @property
+    def latency_mean_us(self) -> int:
+        return self._latency_sum_us // self._latency_count if self._latency_count else 0
+
+    def as_dict(self) -> dict:
+        return {"transactions": self.transactions, "reads": self.reads, "writes": self.writes,
+                "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                "errors": dict(self.errors), "latency_min_us": self.latency_min_us,
+                "latency_max_us": self.latency_max_us, "latency_mean_us": self.latency_mean_us,
+                "histogram": list(self.histogram)}
+
+    def format(self) -> str:
+        buckets = ["<={}:{}".format(bound, n) for bound, n in zip(self.BUCKETS_US, self.histogram)]
+        buckets.append(">{}:{}".format(self.BUCKETS_US[-1], self.histogram[-1]))
+        return "txn:{} rd:{}B wr:{}B err:{} lat min/mean/max:{}/{}/{}us [{}]".format(
+            self.transactions, self.bytes_read, self.bytes_written, self.errors or 0,
+            self.latency_min_us, self.latency_mean_us, self.latency_max_us, " ".join(buckets))
+
+
 class I2C:
     DEFAULT_ADDRESS = const(0x00)
+    # Names of the values returned by values()/raw_values()
+    CHANNELS = ()
+    # Size of the per-device receive buffer used by dev_read_into, drivers size it to their largest burst
+    BUFFER_SIZE = 2
+    # Extra attempts for a failed transfer, all within the budget so one bad device can't stall the cadence
+    RETRIES = 2
+    RETRY_BUDGET_US = 2000
 
     _device = const(0x00)
     _devices = []
     led = None
     led_timer = None
     wdt = None
+    # When set (see frame_helper.FrameWriter) print() emits binary frames instead of text
+    frame_writer = None
+    frame_scaled = True
+    # When set (see Deadband) print() and SensorsPool only report samples whose raw values changed
+    deadband = None
+    # Whether the samples handed to write_sample are scaled values, set along with the sample store
+    store_scaled = True
 
     def __init__(self, *args, i2c: machine.I2C, wdt, **kwargs):
         self._i2c = i2c
@@ -20,6 +150,17 @@ class I2C:
         self.led = kwargs.get("led", None)
         self.wdt = wdt
         self.name = kwargs.get("name", "undefined")
+        self._bus = kwargs.get("bus", 0)
+        self.sensor_id = kwargs.get("sensor_id", self._device)
+        self.stats = I2CStats()
+        self._alloc_buffers(self.BUFFER_SIZE)
+        self._wbuf = bytearray(1)
+
+    def _alloc_buffers(self, size):
+        # One view per length so dev_read_into never slices (and allocates) on the hot path
+        self._rbuf = bytearray(size)
+        rview = memoryview(self._rbuf)
+        self._rviews = [rview[:n] for n in range(size + 1)]
 
     def format_output(self):
         return "Add:{}".format(self._device)
@@ -27,21 +168,118 @@ class I2C:
     def read(self, *args):
         return self.format_output()
 
+    def values(self):
+        """
+        Scaled measurement values, in the order format_output prints them.
+        """
+        return ()
+
+    def raw_values(self):
+        """
+        Unconverted integer readings behind values().
+        """
+        return ()
+
+    def scaled_values(self):
+        """
+        values() of the reading last returned by raw_values(), without another read.
+        Drivers that can convert on their own override it.
+        """
+        return self.values()
+
+    def sample_ticks(self):
+        """
+        ticks_us the values last read were measured at, None when the read itself is
+        the measurement. Drivers handing out conversions made in advance override it.
+        """
+        return None
+
+    def prepare(self):
+        """
+        Start a conversion for the next read when the driver converts on demand,
+        returning the microseconds until it is in (the read must not come sooner).
+        None when reads need no preparation.
+        """
+        return None
+
+    def format_sample(self, ts, data, offset=0) -> str:
+        return " ".join(["{}:{}".format(name, data[offset + i]) for i, name in enumerate(self.CHANNELS)]) + \
+            " Add:{} t:{}".format(self.sensor_id, ts)
+
+    def print_sample(self, ts, data, offset=0):
+        print(self.format_sample(ts, data, offset))
+
+    def write_sample(self, ts, data, offset=0):
+        self.frame_writer.write(self.sensor_id, data, self.store_scaled, ts, offset, len(self.CHANNELS))
+
+    def write_frame(self):
+        if self.frame_scaled:
+            self.frame_writer.write(self.sensor_id, self.values(), True)
+        else:
+            self.frame_writer.write(self.sensor_id, self.raw_values(), False)
+
+    def report(self) -> bool:
+        """
+        Deadband output: read raw_values() and only when deadband passes them convert
+        and emit a frame or a timestamped text line. Returns whether it emitted.
+        """
+        raw = self.raw_values()
+        if not self.deadband.check(raw):
+            return False
+        if self.frame_writer is not None:
+            if self.frame_scaled:
+                self.frame_writer.write(self.sensor_id, self.scaled_values(), True)
+            else:
+                self.frame_writer.write(self.sensor_id, raw, False)
+        else:
+            print(self.format_sample(time.ticks_us(), self.scaled_values()))
+        return True
+
     def print(self, *args):
         try:
-            print(self.read())
+            if self.deadband is not None:
+                self.report()
+            elif self.frame_writer is not None:
+                self.write_frame()
+            else:
+                print(self.read())
             self.wdt.feed()
         except Exception as e:
             print(e)
             self.led.on()
 
+    def _retry(self, start_us, attempt, e) -> bool:
+        """
+        Account a failed transfer, True when attempt (counting from 1) may be retried.
+        """
+        self.stats.error(e)
+        return attempt <= self.RETRIES and time.ticks_diff(time.ticks_us(), start_us) < self.RETRY_BUDGET_US
+
     def reg_read(self, add, reg, nbytes=1) -> bytes:
-        try:
-            return self.i2c_read(self._i2c, add, reg, nbytes)
-        except Exception as e:
-            print("DEBUG: Name {} Add {} Reg {} Bytes {}".format(self.name, hex(add).upper(), hex(reg).upper(), nbytes))
-            print(e)
-            time.sleep(0.005)
+        start = time.ticks_us()
+        attempt = 0
+        while True:
+            try:
+                data = self.i2c_read(self._i2c, add, reg, nbytes)
+                self.stats.record(start, nbytes, 1)
+                return data
+            except OSError as e:
+                attempt += 1
+                if not self._retry(start, attempt, e):
+                    raise
+
+    def reg_read_into(self, add, reg, buf):
+        start = time.ticks_us()
+        attempt = 0
+        while True:
+            try:
+                self.i2c_read_into(self._i2c, add, reg, buf)
+                self.stats.record(start, len(buf), 1)
+                return buf
+            except OSError as e:
+                attempt += 1
+                if not self._retry(start, attempt, e):
+                    raise
 
     def dev_read_hex(self, *args):
         return hex(ord(self.dev_read(*args)))
@@ -52,12 +290,57 @@ class I2C:
     def dev_read_int(self, reg, nbytes=1) -> int:
         return self.to_int(self.dev_read(reg, nbytes))
 
+    def dev_read_into(self, reg, nbytes=1):
+        """
+        Read into the device's preallocated buffer. The returned memoryview is only
+        valid until the next dev_read_into call on the same device.
+        """
+        if nbytes >= len(self._rviews):
+            self._alloc_buffers(nbytes)
+        return self.reg_read_into(self._device, reg, self._rviews[nbytes])
+
     def dev_write(self, reg, data):
         self.reg_write(self._device, reg, data)
 
+    def dev_write_from(self, reg, data):
+        """
+        Write a single byte value or a buffer without building a new message.
+        """
+        if isinstance(data, int):
+            self._wbuf[0] = data
+            data = self._wbuf
+        start = time.ticks_us()
+        attempt = 0
+        while True:
+            try:
+                self._i2c.writeto_mem(self._device, reg, data)
+                break
+            except OSError as e:
+                attempt += 1
+                if not self._retry(start, attempt, e):
+                    raise
+        self.stats.record(start, 0, 1 + len(data))
+
     def reg_write(self, addr, reg, data):
         # raise RuntimeError("Writing to the registers is purposefully not implemented.")
-        self.i2c_write(self._i2c, addr, reg, data)
+        start = time.ticks_us()
+        attempt = 0
+        while True:
+            try:
+                self.i2c_write(self._i2c, addr, reg, data)
+                break
+            except OSError as e:
+                attempt += 1
+                if not self._retry(start, attempt, e):
+                    raise
+        self.stats.record(start, 0, 2)
+
+    def reinit(self):
+        """
+        Restore the chip's configuration after it lost power or was reset, e.g. when
+        SensorsPool brings it back from quarantine. Drivers with settings override it.
+        """
+        pass
 
     @staticmethod
     def i2c_write(i2c, addr, reg, data):
@@ -88,6 +371,14 @@ class I2C:
 
         return data
 
+    @staticmethod
+    def i2c_read_into(i2c, addr: int, reg: int, buf):
+        """
+        Fill buf from consecutive registers starting at reg.
+        """
+        if len(buf):
+            i2c.readfrom_mem_into(addr, reg, buf)
+
     @staticmethod
     def to_int(bytes_data) -> int:
         return int.from_bytes(bytes_data, "big")
@@ -1,30 +1,24 @@
 from sys import stdin
 
 import machine
+import select
 import time
+import uasyncio as asyncio
 from SensorsPool import SensorsPool
+from Scheduler import Scheduler
+from DualCore import DualCore
+from DataLogger import DataLogger
 
 led = machine.Pin(25, machine.Pin.OUT)
+# GPIO wired to the ADXL355 INT1 output, None when not connected
+ACC_INT1_PIN = None
 timer_led = machine.Timer()
 
 
-class Timer:
-    timers = []
-
-    def add(self, **kwargs):
-        self.timers.append(machine.Timer())
-        self.timers[-1].init(**kwargs)
-
-    def clear(self):
-        [tm.deinit() for tm in self.timers]
-        self.timers.clear()
-
-
 class InfRun:
     status = True
 
 
-timers = Timer()
 inf_run = InfRun()
 
 
@@ -41,124 +35,306 @@ def c():
 
 
 # Init
+# Buses found on the first boot, reused after resets until a scan no longer matches; delete to rediscover
+TOPOLOGY_FILE = "topology.json"
+boot_ms = time.ticks_ms()
 timer_led.init(freq=60, mode=machine.Timer.PERIODIC, callback=led_toggle)
-for sda_number in [4, 8]:
-    SDA = machine.Pin(sda_number, mode=machine.Pin.OPEN_DRAIN, pull=machine.Pin.PULL_UP)
-    SCL = machine.Pin(sda_number + 1, mode=machine.Pin.OPEN_DRAIN, pull=machine.Pin.PULL_UP)
-
-    # Init I2C first and check for devices
-    i2c = machine.I2C(0, scl=SCL, sda=SDA)
-    i2c_scan = i2c.scan()
-    # When no devices found, try SoftI2C for the same pins
-    if not i2c_scan:
-        time.sleep(1)
-        # Init SoftI2C and check for devices
-        i2c = machine.SoftI2C(scl=SCL, sda=SDA)
-        i2c_scan = i2c.scan()
-        # When no devices found for SoftI2C then try next pins
-        if i2c_scan:
-            break
-        else:
-            time.sleep(1)
-    else:
-        break
-if not i2c_scan:
+buses = SensorsPool.load_topology(TOPOLOGY_FILE)
+fast_boot = buses is not None
+if not fast_boot:
+    buses = SensorsPool.discover_buses(topology=TOPOLOGY_FILE)
+if not buses:
     # machine.WDT()
     timer_led.deinit()
     timer_led.init(freq=8, mode=machine.Timer.PERIODIC, callback=led_toggle)
     time.sleep(10)
     raise Exception("No I2C device found")
 
-time.sleep(2)
-
-timer_led.init(freq=30, mode=machine.Timer.PERIODIC, callback=led_toggle)
-time.sleep(1)
+if not fast_boot:
+    time.sleep(2)
+    timer_led.init(freq=30, mode=machine.Timer.PERIODIC, callback=led_toggle)
+    time.sleep(1)
 
 timer_led.init(freq=2, mode=machine.Timer.PERIODIC, callback=led_toggle)
 wdt = machine.WDT(timeout=8300)
-rpi = SensorsPool(i2c=i2c, led=led, led_timer=timer_led, wdt=wdt)
-time.sleep(5)
-wdt.feed()
-time.sleep(5)
+rpi = SensorsPool(buses=buses, led=led, led_timer=timer_led, wdt=wdt, calibration_cache="calibration.json")
+if not fast_boot:
+    time.sleep(5)
+    wdt.feed()
+    time.sleep(5)
 timer_led.deinit()
 wdt.feed()
+print("{} boot in {}ms".format("Fast" if fast_boot else "Full", time.ticks_diff(time.ticks_ms(), boot_ms)))
+
+
+scheduler = Scheduler(rpi)
+dual_core = DualCore(rpi)
+
+
+class Sampling:
+    # Scheduler (core 0, uasyncio) or DualCore (reads on core 1), both take the same rate plans
+    engine = scheduler
+
+
+sampling = Sampling()
+
+
+def stop_sampling():
+    sampling.engine.clear()
+    for acc in rpi.get_sensors(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"]):
+        acc.stop_irq()
 
 
 def func_quit():
     inf_run.status = False
     c()
-    timers.clear()
+    stop_sampling()
     print("Bringing up python interface...")
 
 
 def func_acc():
-    timers.clear()
+    stop_sampling()
+    inf_run.status = True
+    if not sampling.engine.set_rates(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"], 10):
+        print("No Accelerometer found.")
+
+
+def func_acc_fifo():
+    stop_sampling()
     inf_run.status = True
-    acc_key = SensorsPool.SENSOR_DATA["Accelerometer"]["Name"]
-    if acc_key:
-        timers.add(freq=10, mode=machine.Timer.PERIODIC, callback=rpi.get_sensors(acc_key)[0].print)
+    acc = rpi.get_sensors(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"])
+    if acc:
+        # 32 samples fit in the FIFO, drain well before it fills at 4kHz ODR
+        sampling.engine.set_rate(acc[0], 200, rpi.fifo_sampler(acc[0]))
     else:
         print("No Accelerometer found.")
 
 
-def func_press():
-    timers.clear()
+def func_acc_summary():
+    stop_sampling()
     inf_run.status = True
-    bar_key = SensorsPool.SENSOR_DATA["Barometer"]["Name"]
-    if bar_key:
-        timers.add(freq=1, mode=machine.Timer.PERIODIC, callback=rpi.get_sensors(bar_key)[0].print)
+    acc = rpi.get_sensors(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"])
+    if acc:
+        # 1kHz into the FIFO, drained every 10 samples, one mean/min/max/rms summary per second
+        acc[0].set_odr(1000)
+        sampling.engine.set_rate(acc[0], 100, rpi.aggregator(acc[0], window_ms=1000))
+    else:
+        print("No Accelerometer found.")
+
+
+def func_acc_irq():
+    stop_sampling()
+    inf_run.status = True
+    acc = rpi.get_sensors(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"])
+    if not acc:
+        print("No Accelerometer found.")
+    elif ACC_INT1_PIN is None:
+        print("No Accelerometer interrupt pin configured.")
     else:
+        import ADXL355
+        # Drain the FIFO whenever it holds 30 samples (90 entries), paced by the chip's ODR
+        acc[0].set_interrupts(int1=ADXL355.INT_FULL)
+        acc[0].start_irq(machine.Pin(ACC_INT1_PIN), watermark=True, callback=rpi.fifo_sampler(acc[0]), samples=90)
+
+
+def func_press():
+    stop_sampling()
+    inf_run.status = True
+    if not sampling.engine.set_rates(SensorsPool.SENSOR_DATA["Barometer"]["Name"], 1):
         print("No Barometer found.")
 
 
+def set_temperature_rate(hz) -> bool:
+    # All temperature sensors in one batch read (sample_temperatures), planned on the first one
+    temps = rpi.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])
+    if temps:
+        sampling.engine.set_rate(temps[0], hz, rpi.sample_temperatures)
+    return bool(temps)
+
+
 def func_temp():
-    timers.clear()
+    stop_sampling()
     inf_run.status = True
-    temp_key = SensorsPool.SENSOR_DATA["Temperature"]["Name"]
-    if temp_key:
-        [timers.add(freq=1, mode=machine.Timer.PERIODIC, callback=sens.print) for sens in rpi.get_sensors(temp_key)]
-    else:
+    if not set_temperature_rate(1):
         print("No Temperature sensor found.")
 
 
 def func_all():
     inf_run.status = True
-    timers.clear()
+    stop_sampling()
+    sampling.engine.set_rates(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"], 5)
+    sampling.engine.set_rates(SensorsPool.SENSOR_DATA["Barometer"]["Name"], 1)
+    set_temperature_rate(1)
 
-    acc_key = rpi.get_sensors(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"])
-    if acc_key:
-        timers.add(freq=5, mode=machine.Timer.PERIODIC, callback=acc_key[0].print)
 
-    bar_key = rpi.get_sensors(SensorsPool.SENSOR_DATA["Barometer"]["Name"])
-    if bar_key:
-        timers.add(freq=1, mode=machine.Timer.PERIODIC, callback=bar_key[0].print)
+def func_snapshot():
+    stop_sampling()
+    inf_run.status = True
+    sensors = rpi.get_sensors()
+    if sensors:
+        # Every sensor read back to back once a second, each line stamped with its capture time
+        sampling.engine.set_rate(sensors[0], 1, rpi.snapshotter())
+
+
+def func_stats():
+    for entry in sampling.engine.stats():
+        print("{name} bus {bus}: {hz}Hz samples:{samples} misses:{misses} errors:{errors} "
+              "jitter max:{jitter_max_us}us mean:{jitter_mean_us}us last error:{last_error}".format(**entry))
+
+
+def func_dual():
+    entries = sampling.engine.entries()
+    if sampling.engine is dual_core:
+        try:
+            dual_core.stop()
+        except RuntimeError as e:
+            # Core 1 may still be on the bus, keep it in charge and let the next 'd' try again
+            print("Staying on core 1 - {}".format(e))
+            return
+        dual_core.clear()
+        sampling.engine = scheduler
+        print("Sampling on core 0.")
+    else:
+        sampling.engine.clear()
+        sampling.engine = dual_core
+        dual_core.start()
+        print("Sampling on core 1.")
+    for entry in entries:
+        sampling.engine.set_rate(entry.sensor, entry.hz, entry.action)
+
+
+def func_binary():
+    rpi.set_binary(not rpi.binary)
+
+
+def func_store():
+    if rpi.deferred:
+        print("Sample store needed while sampling on core 1.")
+    elif rpi.store_enabled:
+        rpi.flush()
+        rpi.disable_store()
+        print("Sample store disabled.")
+    else:
+        rpi.enable_store()
+        print("Sample store enabled.")
+
+
+def func_deadband():
+    if rpi.deadband_enabled:
+        print("Change-driven reporting off: {}".format(rpi.deadband_stats()))
+        rpi.clear_deadband()
+    else:
+        # Bands in raw counts: 1 LSB (0.0625C) of temperature, exact repeats elsewhere
+        rpi.set_deadband()
+        rpi.set_deadband(SensorsPool.SENSOR_DATA["Temperature"]["Name"], absolute=1)
+        print("Change-driven reporting on.")
 
-    temp_key = rpi.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])
-    if temp_key:
-        [timers.add(freq=1, mode=machine.Timer.PERIODIC, callback=sens.print) for sens in temp_key]
+
+class Logging:
+    logger = None
+
+
+logging = Logging()
+
+
+def get_logger() -> DataLogger:
+    if logging.logger is None:
+        logging.logger = DataLogger(wdt=wdt)
+        if logging.logger.recovered:
+            print("Log recovered after an unclean stop.")
+    return logging.logger
+
+
+def func_log():
+    if rpi.logger is not None:
+        rpi.flush()
+        rpi.set_logger(None)
+        get_logger().sync(True)
+        print("Logging stopped: {}".format(get_logger().stats()))
+    else:
+        rpi.set_logger(get_logger())
+        print("Logging to flash.")
+
+
+def func_dump():
+    rpi.flush()
+    print("Log dump: {} bytes".format(get_logger().dump()))
 
 
 FSM_STATES = {
     "q": func_quit,
     "a": func_acc,
+    "f": func_acc_fifo,
+    "w": func_acc_irq,
+    "g": func_acc_summary,
     "t": func_temp,
     "p": func_press,
     "z": func_all,
+    "n": func_snapshot,
+    "j": func_stats,
+    "b": func_binary,
+    "d": func_dual,
+    "m": func_store,
+    "c": func_deadband,
+    "l": func_log,
+    "u": func_dump,
+    "s": rpi.print_bus_stats,
     "r": reset
 }
 
-try:
-    func_all()
-    while inf_run.status:
-        input_read = stdin.readline().strip()
+
+def command(input_read):
+    try:
         if input_read.isdigit():
             freq = int(input_read)
             print("Setting LED to {}Hz".format(freq))
             timer_led.init(freq=freq, mode=machine.Timer.PERIODIC, callback=led_toggle)
         elif input_read in FSM_STATES.keys():
             FSM_STATES[input_read]()
-        time.sleep(0.05)
-    timers.clear()
+    except RuntimeError as e:
+        # e.g. core 1 did not let go of the buses, the command did not touch them
+        print("Command {} failed - {}".format(input_read, e))
+
+
+async def command_loop():
+    poller = select.poll()
+    poller.register(stdin, select.POLLIN)
+    line = ""
+    while inf_run.status:
+        # Only take what has arrived, a partial line must not block the loop until its newline
+        while inf_run.status and poller.poll(0):
+            char = stdin.read(1)
+            if not char:
+                break
+            if char != "\n" and char != "\r":
+                line += char
+                continue
+            command(line.strip())
+            line = ""
+        await asyncio.sleep(0.05)
+
+
+async def output_loop():
+    # Drains the sample store (when enabled) in batches, away from the sampling cadence
+    while inf_run.status:
+        rpi.flush()
+        await asyncio.sleep(0.1)
+
+
+async def app():
+    func_all()
+    scheduler.start()
+    output = asyncio.create_task(output_loop())
+    try:
+        await command_loop()
+    finally:
+        output.cancel()
+        scheduler.stop()
+        dual_core.stop()
+
+
+try:
+    asyncio.run(app())
 except Exception as e:
     print("Exception: {}".format(e))
 finally:
@@ -0,0 +1,48 @@
+"""
+CPython stand-ins for the MicroPython runtime used by the drivers.
+
+    import sim
+    sim.install()              # default board: AT30TSE75x, BME280 and ADXL355 on GP4/GP5
+    from SensorsPool import SensorsPool
+
+install() registers machine, micropython, ustruct, uasyncio, utime and friends in
+sys.modules and adds the MicroPython tick helpers to time, so the device code in
+the repository root runs unmodified on Linux.
+"""
+import sys
+
+from sim.board import Board, default_board
+from sim.bus import SimBus
+from sim import devices
+
+_board = None
+
+
+def install(board: Board = None) -> Board:
+    global _board
+    import json
+    import os
+    import struct
+    import time
+    import asyncio
+
+    from sim import clock, machine, micropython
+
+    _board = board if board is not None else default_board()
+    machine.set_board(_board)
+
+    for name in ("ticks_ms", "ticks_us", "ticks_cpu", "ticks_diff", "ticks_add", "sleep_ms", "sleep_us"):
+        setattr(time, name, getattr(clock, name))
+
+    sys.modules["machine"] = machine
+    sys.modules["micropython"] = micropython
+    sys.modules["ustruct"] = struct
+    sys.modules["uasyncio"] = asyncio
+    sys.modules["utime"] = time
+    sys.modules["ujson"] = json
+    sys.modules["uos"] = os
+    return _board
+
+
+def board() -> Board:
+    return _board
@@ -0,0 +1,24 @@
+"""
+Run a device script (main.py by default) against the simulated board:
+
+    python -m sim [script.py] [--realtime]
+"""
+import os
+import runpy
+import sys
+
+import sim
+from sim.board import default_board
+
+
+def main(argv):
+    realtime = "--realtime" in argv
+    args = [a for a in argv if not a.startswith("--")]
+    script = args[0] if args else "main.py"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    sim.install(default_board(realtime=realtime))
+    runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,205 @@
+"""
+Per-sample cost of the driver read paths against the simulated bus:
+
+    python -m sim.bench               # compare against sim/bench_baseline.json
+    python -m sim.bench --update      # record a new baseline
+    python -m sim.bench --json        # machine readable output
+
+For every case and rate it reports bus transactions, bytes on the wire (address,
+register pointer and payload), modeled bus time at the bus frequency, host CPU
+time outside the simulator (median) and the peak transient heap use of one read
+(tracemalloc, with the bus replaying recorded responses so only driver code
+counts). Simulated time is frozen and advanced by the sampling period between
+samples, so rate limits, forced mode conversions and the ADXL355 FIFO behave as
+they would at that rate.
+
+Transactions, bytes and bus time are deterministic and may not grow at all;
+heap use is compared with a tolerance. Heap figures are CPython's, useful to
+catch new allocations on a read path rather than as absolute numbers. CPU time
+is the median over REPEATS runs and only reported against the baseline: it
+depends on the host's load too much to fail on.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from array import array
+
+import sim
+from sim import clock
+from sim.board import default_board
+from sim.devices import sine
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+FREQ = 400000
+SAMPLES = 200
+REPEATS = 5
+# Relative and absolute slack for the noisy metrics, those in REPORT_ONLY never fail the run
+TOLERANCE = {"cpu_us": (0.5, 2), "alloc_peak_bytes": (0.1, 16)}
+EXACT = ("transactions", "bytes", "bus_us")
+REPORT_ONLY = ("cpu_us",)
+
+
+def _cases():
+    # Imported here, sim.install() has to run first
+    import machine
+    from AT30TSE75x import AT30TSE75x
+    from BME280 import BME280
+    from ADXL355 import ADXL355
+
+    def driver(cls, address, **kwargs):
+        return cls(i2c=machine.I2C(0, freq=FREQ), device=address, wdt=machine.WDT(), led=machine.Pin(25),
+                   name=cls.__name__, **kwargs)
+
+    temp = driver(AT30TSE75x, 0x48)
+    baro = driver(BME280, 0x76)
+    acc = driver(ADXL355, 0x1D)
+    baro.parse_raw()
+    fifo_out = array('f', bytes(4 * 96))
+
+    # name, callable, rates in Hz
+    return [
+        ("AT30TSE75x.read_temp", temp.read_temp, (1, 10)),
+        ("BME280.parse_raw", baro.parse_raw, (1, 10)),
+        ("BME280.raw_values", baro.raw_values, (1, 10)),
+        ("BME280.fixed_values", baro.fixed_values, (1, 10)),
+        ("ADXL355.get3V", acc.get3V, (5, 10, 100)),
+        ("ADXL355.read_fifo", acc.read_fifo, (200,)),
+        ("ADXL355.read_fifo_into", lambda: acc.read_fifo_into(fifo_out), (200,)),
+    ]
+
+
+def _measure(bus, fn, rate, samples) -> dict:
+    period_us = 1000000 / rate
+    # Settle rate limits and pipelines at this rate before counting
+    for _ in range(3):
+        clock.advance(period_us)
+        fn()
+
+    bus.reset_counters()
+    cpu_ns = []
+    for _ in range(samples):
+        clock.advance(period_us)
+        sim_ns = bus.sim_ns
+        start = time.perf_counter_ns()
+        fn()
+        cpu_ns.append(time.perf_counter_ns() - start - (bus.sim_ns - sim_ns))
+    counters = bus.stats()
+
+    bus.replay()
+    tracemalloc.start()
+    peak = 0
+    for _ in range(samples):
+        clock.advance(period_us)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    bus.replay(False)
+
+    per_sample = {
+        "transactions": counters["transactions"] / samples,
+        "bytes": (counters["bytes_read"] + counters["bytes_written"] + counters["transactions"]) / samples,
+        "bus_us": counters["busy_us"] / samples,
+        "cpu_us": sorted(cpu_ns)[samples // 2] / 1000,
+        "alloc_peak_bytes": peak,
+    }
+    per_sample = {k: round(v, 2) for k, v in per_sample.items()}
+    per_second = {k: round(per_sample[k] * rate, 2) for k in ("transactions", "bytes", "bus_us", "cpu_us")}
+    per_second["bus_load_pct"] = round(per_sample["bus_us"] * rate / 10000, 3)
+    return {"rate": rate, "per_sample": per_sample, "per_second": per_second}
+
+
+def run(samples=SAMPLES, repeats=REPEATS) -> dict:
+    """
+    Results of the first run, with cpu_us the median over repeats runs.
+    """
+    runs = [_run_once(samples) for _ in range(repeats)]
+    results = runs[0]
+    for key, result in results.items():
+        cpu = sorted(r[key]["per_sample"]["cpu_us"] for r in runs)[repeats // 2]
+        result["per_sample"]["cpu_us"] = cpu
+        result["per_second"]["cpu_us"] = round(cpu * result["rate"], 2)
+    return results
+
+
+def _run_once(samples) -> dict:
+    board = default_board()
+    board.device(0x1D).signal = sine()
+    sim.install(board)
+    clock.freeze()
+    bus = board.bus_for(0)
+    results = {}
+    for name, fn, rates in _cases():
+        for rate in rates:
+            results["{}@{}Hz".format(name, rate)] = _measure(bus, fn, rate, samples)
+    return results
+
+
+def compare(results, baseline):
+    """
+    Returns the regressions and, for the REPORT_ONLY metrics, the notes.
+    """
+    regressions = []
+    notes = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric, value in result["per_sample"].items():
+            ref = base["per_sample"].get(metric)
+            if ref is None:
+                continue
+            if metric in EXACT:
+                limit = ref
+            else:
+                limit = ref * (1 + TOLERANCE[metric][0]) + TOLERANCE[metric][1]
+            if value > limit:
+                message = "{} {}: {} > baseline {}".format(key, metric, value, ref)
+                (notes if metric in REPORT_ONLY else regressions).append(message)
+    return regressions, notes
+
+
+def print_table(results):
+    print("{:32} {:>8} {:>8} {:>9} {:>9} {:>9} {:>10} {:>8}".format(
+        "case", "txn", "bytes", "bus us", "cpu us", "heap B", "bus us/s", "bus %"))
+    for key, result in results.items():
+        s, ps = result["per_sample"], result["per_second"]
+        print("{:32} {:>8} {:>8} {:>9} {:>9} {:>9} {:>10} {:>8}".format(
+            key, s["transactions"], s["bytes"], s["bus_us"], s["cpu_us"], s["alloc_peak_bytes"],
+            ps["bus_us"], ps["bus_load_pct"]))
+
+
+def main(argv) -> int:
+    baseline_path = BASELINE
+    if "--baseline" in argv:
+        baseline_path = argv[argv.index("--baseline") + 1]
+    results = run()
+
+    if "--json" in argv:
+        print(json.dumps(results, indent=1))
+    else:
+        print_table(results)
+
+    if "--update" in argv:
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print("Baseline written to {}".format(baseline_path))
+        return 0
+    if not os.path.exists(baseline_path):
+        print("No baseline at {}, run with --update".format(baseline_path))
+        return 0
+    with open(baseline_path) as f:
+        regressions, notes = compare(results, json.load(f))
+    for note in notes:
+        print("SLOWER (not gated): " + note)
+    for regression in regressions:
+        print("REGRESSION: " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,49 @@
+"""
+Pin-level wiring of simulated buses, so machine.I2C/SoftI2C find the devices
+behind the pins main.py probes.
+"""
+from sim.bus import SimBus
+from sim.devices import AT30TSE75xModel, BME280Model, ADXL355Model
+
+
+class Board:
+    # Default SDA pin of each hardware controller
+    DEFAULT_SDA = {0: 4, 1: 6}
+
+    def __init__(self, buses=()):
+        self.buses = {}
+        for bus in buses:
+            self.add_bus(bus)
+
+    def add_bus(self, bus: SimBus) -> SimBus:
+        self.buses[bus.sda] = bus
+        return bus
+
+    def bus_for(self, i2c_id=None, sda=None) -> SimBus:
+        if sda is None:
+            sda = self.DEFAULT_SDA.get(i2c_id, 4)
+        bus = self.buses.get(sda)
+        if bus is None:
+            bus = self.add_bus(SimBus(sda=sda, scl=sda + 1))
+        return bus
+
+    def bus_for_scl(self, scl):
+        for bus in self.buses.values():
+            if bus.scl == scl:
+                return bus
+        return None
+
+    def device(self, address, sda=None):
+        for bus in self.buses.values():
+            if (sda is None or bus.sda == sda) and address in bus.devices:
+                return bus.devices[address]
+        return None
+
+
+def default_board(realtime=False, latency_us=20) -> Board:
+    """Two AT30TSE75x, a BME280 and an ADXL355 on GP4/GP5, nothing on GP8/GP9"""
+    return Board([
+        SimBus([AT30TSE75xModel(0x48, 21.5), AT30TSE75xModel(0x49, 23.25), BME280Model(0x76), ADXL355Model(0x1D)],
+               sda=4, scl=5, realtime=realtime, latency_us=latency_us),
+        SimBus(sda=8, scl=9, realtime=realtime, latency_us=latency_us),
+    ])
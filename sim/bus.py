@@ -0,0 +1,172 @@
+"""
+Simulated I2C bus with per-transaction timing and traffic counters.
+"""
+import threading
+import time
+
+from sim import clock
+
+EIO = 5
+ETIMEDOUT = 110
+
+
+class SimBus:
+    """
+    Devices hang off the bus by 7-bit address. Every transfer is costed as
+    latency_us plus 9 clocks per byte on the wire (address, register pointer and
+    payload) plus start/stop overhead at the controller frequency. With realtime
+    set the calling thread is held for that long, otherwise the cost is only
+    accumulated in busy_us.
+    """
+
+    def __init__(self, devices=(), latency_us=20, max_freq=1000000, realtime=False, sda=None, scl=None):
+        self.devices = {}
+        self.latency_us = latency_us
+        self.max_freq = max_freq
+        self.realtime = realtime
+        self.sda = sda
+        self.scl = scl
+        self.stuck = False
+        self._scl_edges = 0
+        self._faults = {}
+        self._recorded = {}
+        self._lock = threading.Lock()
+        for dev in devices:
+            self.attach(dev)
+        self.reset_counters()
+
+    def attach(self, device):
+        self.devices[device.address] = device
+        return device
+
+    def detach(self, address):
+        return self.devices.pop(address, None)
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.busy_us = 0.0
+        self.sim_ns = 0
+        self.per_device = {}
+
+    def stats(self) -> dict:
+        return {"transactions": self.transactions, "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written, "errors": self.errors, "busy_us": self.busy_us}
+
+    # Fault injection
+    def inject_fault(self, address, count=1, errno=EIO):
+        self._faults[address] = [count, errno]
+
+    def hold_sda_low(self):
+        self.stuck = True
+        self._scl_edges = 0
+
+    def clock_scl(self):
+        # Called by machine.Pin when the SCL pin is toggled in GPIO mode
+        if self.stuck:
+            self._scl_edges += 1
+            if self._scl_edges >= 18:
+                self.stuck = False
+
+    # Transfers
+    def _cost_us(self, freq, nbytes) -> float:
+        return self.latency_us + (nbytes * 9 + 3) * 1e6 / freq
+
+    def _transfer(self, freq, address, out_bytes, in_bytes):
+        with self._lock:
+            cost = self._cost_us(freq, 1 + out_bytes + in_bytes + (1 if in_bytes and out_bytes else 0))
+            self.transactions += 1
+            self.busy_us += cost
+            counters = self.per_device.setdefault(address, [0, 0, 0])
+            counters[0] += 1
+            if self.realtime:
+                clock.sleep_us(int(cost))
+
+            if self.stuck:
+                self.errors += 1
+                raise OSError(ETIMEDOUT)
+            device = self.devices.get(address)
+            fault = self._faults.get(address)
+            if fault:
+                fault[0] -= 1
+                if fault[0] <= 0:
+                    del self._faults[address]
+                self.errors += 1
+                raise OSError(fault[1])
+            if device is None or freq > min(self.max_freq, device.max_freq):
+                self.errors += 1
+                raise OSError(EIO)
+            self.bytes_written += out_bytes
+            self.bytes_read += in_bytes
+            counters[1] += in_bytes
+            counters[2] += out_bytes
+            return device
+
+    def scan(self, freq) -> list:
+        found = []
+        for address in range(0x08, 0x78):
+            with self._lock:
+                self.busy_us += self._cost_us(freq, 1)
+            if self.stuck:
+                continue
+            device = self.devices.get(address)
+            if device is not None and freq <= min(self.max_freq, device.max_freq):
+                found.append(address)
+        return found
+
+    def replay(self, enabled=True):
+        """
+        Answer every read with the last response recorded for the same request and
+        ignore writes, without touching the devices. Benchmarks use it to keep the
+        simulator's own allocations out of heap measurements.
+        """
+        self._replay = self._recorded if enabled else None
+
+    _replay = None
+    _recorded = {}
+
+    # sim_ns accumulates the host time spent inside the simulator, so benchmarks can leave it out
+    def read_mem(self, freq, address, reg, nbytes) -> bytes:
+        if self._replay is not None:
+            return self._replay[(address, reg, nbytes)]
+        start = time.perf_counter_ns()
+        try:
+            data = self._transfer(freq, address, 1, nbytes).read(reg, nbytes)
+            self._recorded[(address, reg, nbytes)] = data
+            return data
+        finally:
+            self.sim_ns += time.perf_counter_ns() - start
+
+    def write_mem(self, freq, address, reg, data):
+        if self._replay is not None:
+            return
+        start = time.perf_counter_ns()
+        try:
+            self._transfer(freq, address, 1 + len(data), 0).write(reg, bytes(data))
+        finally:
+            self.sim_ns += time.perf_counter_ns() - start
+
+    def read(self, freq, address, nbytes) -> bytes:
+        if self._replay is not None:
+            return self._replay[(address, None, nbytes)]
+        start = time.perf_counter_ns()
+        try:
+            data = self._transfer(freq, address, 0, nbytes).read_current(nbytes)
+            self._recorded[(address, None, nbytes)] = data
+            return data
+        finally:
+            self.sim_ns += time.perf_counter_ns() - start
+
+    def write(self, freq, address, data):
+        if self._replay is not None:
+            return
+        start = time.perf_counter_ns()
+        try:
+            data = bytes(data)
+            device = self._transfer(freq, address, len(data), 0)
+            if data:
+                device.write(data[0], data[1:])
+        finally:
+            self.sim_ns += time.perf_counter_ns() - start
@@ -0,0 +1,79 @@
+"""
+MicroPython time helpers backed by the host monotonic clock.
+Ticks wrap like on the RP2040 port (30 bit period) so wraparound bugs show up here as well.
+"""
+import time
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+_t0 = time.perf_counter_ns()
+_offset_ns = 0
+_frozen_ns = None
+
+
+def now_us() -> int:
+    now = _frozen_ns if _frozen_ns is not None else time.perf_counter_ns() - _t0
+    return (now + _offset_ns) // 1000
+
+
+def advance(us):
+    """Move simulated time forward without waiting, e.g. to replay a sampling rate quickly"""
+    global _offset_ns
+    _offset_ns += int(us * 1000)
+
+
+def freeze():
+    """Stop simulated time from following the host clock, only advance() and sleeps move it"""
+    global _frozen_ns
+    if _frozen_ns is None:
+        _frozen_ns = time.perf_counter_ns() - _t0
+
+
+def unfreeze():
+    global _frozen_ns, _offset_ns
+    if _frozen_ns is not None:
+        _offset_ns += _frozen_ns - (time.perf_counter_ns() - _t0)
+        _frozen_ns = None
+
+
+def ticks_us() -> int:
+    return now_us() & TICKS_MAX
+
+
+def ticks_ms() -> int:
+    return (now_us() // 1000) & TICKS_MAX
+
+
+def ticks_cpu() -> int:
+    return ticks_us()
+
+
+def ticks_diff(ticks1, ticks2) -> int:
+    diff = (ticks1 - ticks2) & TICKS_MAX
+    if diff >= TICKS_HALFPERIOD:
+        diff -= TICKS_PERIOD
+    return diff
+
+
+def ticks_add(ticks, delta) -> int:
+    return (ticks + delta) & TICKS_MAX
+
+
+def sleep_ms(ms):
+    if _frozen_ns is not None:
+        advance(ms * 1000)
+        return
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    if _frozen_ns is not None:
+        advance(us)
+        return
+    end = time.perf_counter_ns() + us * 1000
+    if us > 2000:
+        time.sleep((us - 1000) / 1e6)
+    while time.perf_counter_ns() < end:
+        pass
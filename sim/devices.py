@@ -0,0 +1,347 @@
+"""
+Register-map models of the sensors supported by SensorsPool.
+"""
+import math
+import struct
+import threading
+
+from sim import clock
+
+
+class Device:
+    """
+    256 byte register file with an auto-incrementing pointer. Subclasses refresh
+    registers in _before_read and react to configuration in _after_write.
+    """
+    max_freq = 1000000
+
+    def __init__(self, address):
+        self.address = address
+        self.regs = bytearray(256)
+        self.pointer = 0
+        self.lock = threading.RLock()
+
+    def _before_read(self, reg, nbytes):
+        pass
+
+    def _after_write(self, reg, data):
+        pass
+
+    def _increment(self, reg) -> int:
+        return (reg + 1) & 0xFF
+
+    def read(self, reg, nbytes) -> bytes:
+        with self.lock:
+            self.pointer = reg
+            return self.read_current(nbytes)
+
+    def read_current(self, nbytes) -> bytes:
+        with self.lock:
+            return self._read_current(nbytes)
+
+    def _read_current(self, nbytes) -> bytes:
+        self._before_read(self.pointer, nbytes)
+        out = bytearray(nbytes)
+        reg = self.pointer
+        for i in range(nbytes):
+            out[i] = self._read_byte(reg)
+            reg = self._increment(reg)
+        return bytes(out)
+
+    def _read_byte(self, reg) -> int:
+        return self.regs[reg]
+
+    def write(self, reg, data):
+        with self.lock:
+            self.pointer = reg
+            r = reg
+            for b in data:
+                self.regs[r] = b
+                r = self._increment(r)
+            self._after_write(reg, data)
+
+
+class AT30TSE75xModel(Device):
+    """
+    Temperature sensor subdevice: four 16-bit registers behind a latched pointer
+    (0x00 temperature, 0x01 config, 0x02 T_low, 0x03 T_high). Reads without a
+    pointer write (readfrom) return the register the pointer was last set to.
+    """
+    max_freq = 400000
+
+    def __init__(self, address=0x48, temperature=21.5):
+        super().__init__(address)
+        self.temperature = temperature
+        self.words = {0x00: 0, 0x01: 0x0000, 0x02: 0x4B00, 0x03: 0x5000}
+
+    def _temperature_word(self) -> int:
+        t = self.temperature() if callable(self.temperature) else self.temperature
+        return (int(round(t / 0.0625)) & 0xFFF) << 4
+
+    def read_current(self, nbytes) -> bytes:
+        if self.pointer not in self.words:
+            return b"\xff" * nbytes
+        word = self._temperature_word() if self.pointer == 0x00 else self.words[self.pointer]
+        data = bytes([word >> 8, word & 0xFF])
+        return (data * (nbytes // 2 + 1))[:nbytes]
+
+    def write(self, reg, data):
+        self.pointer = reg
+        if reg in (0x01, 0x02, 0x03) and data:
+            word = data[0] << 8 | (data[1] if len(data) > 1 else 0)
+            self.words[reg] = word
+
+
+# Example trimming values from the Bosch BME280/BMP280 datasheets
+BME280_CALIBRATION = {
+    "T": (27504, 26435, -1000),
+    "P": (36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000),
+    "H": (75, 362, 0, 324, 50, 30),
+}
+
+
+class BME280Model(Device):
+    """
+    Calibration block at 0x88-0xA1 / 0xE1-0xE7, chip ID at 0xD0 and the 0xF2-0xFE
+    control and data block. Forced mode conversions take the datasheet maximum
+    measurement time for the configured oversampling; until then the status
+    register reports measuring and the data registers hold the previous result.
+    Normal mode refreshes the data registers every t_standby.
+    """
+    max_freq = 1000000
+    STANDBY_MS = (0.5, 62.5, 125, 250, 500, 1000, 10, 20)
+
+    def __init__(self, address=0x76, chip_id=0x60, raw=(415148, 519888, 30000), calibration=BME280_CALIBRATION):
+        super().__init__(address)
+        self.raw = raw
+        self.regs[0xD0] = chip_id
+        self._done_us = 0
+        self._pending = False
+        self._next_normal_us = 0
+        t, p, h = calibration["T"], calibration["P"], calibration["H"]
+        self.regs[0x88:0xA0] = struct.pack("<Hhh" + "H" + "h" * 8, *(t + p))
+        if chip_id == 0x60:
+            h1, h2, h3, h4, h5, h6 = h
+            self.regs[0xA1] = h1
+            self.regs[0xE1:0xE3] = struct.pack("<h", h2)
+            self.regs[0xE3] = h3
+            self.regs[0xE4] = (h4 >> 4) & 0xFF
+            self.regs[0xE5] = (h4 & 0x0F) | ((h5 & 0x0F) << 4)
+            self.regs[0xE6] = (h5 >> 4) & 0xFF
+            self.regs[0xE7] = h6 & 0xFF
+
+    def measurement_us(self) -> int:
+        def count(os):
+            return 0 if os == 0 else 1 << (os - 1)
+        ctrl = self.regs[0xF4]
+        t_os, p_os, h_os = (ctrl >> 5) & 0x7, (ctrl >> 2) & 0x7, self.regs[0xF2] & 0x7
+        ms = 1.25 + 2.3 * count(t_os)
+        ms += (2.3 * count(p_os) + 0.575) if p_os else 0
+        ms += (2.3 * count(h_os) + 0.575) if h_os else 0
+        return int(ms * 1000)
+
+    def _latch(self):
+        p, t, h = self.raw() if callable(self.raw) else self.raw
+        self.regs[0xF7:0xFA] = bytes([(p >> 12) & 0xFF, (p >> 4) & 0xFF, (p & 0xF) << 4])
+        self.regs[0xFA:0xFD] = bytes([(t >> 12) & 0xFF, (t >> 4) & 0xFF, (t & 0xF) << 4])
+        self.regs[0xFD:0xFF] = bytes([(h >> 8) & 0xFF, h & 0xFF])
+
+    def _before_read(self, reg, nbytes):
+        now = clock.now_us()
+        mode = self.regs[0xF4] & 0x3
+        if self._pending and now >= self._done_us:
+            self._pending = False
+            self._latch()
+            self.regs[0xF4] &= 0xFC
+        elif mode == 0x3 and now >= self._next_normal_us:
+            self._latch()
+            standby = self.STANDBY_MS[(self.regs[0xF5] >> 5) & 0x7]
+            self._next_normal_us = now + self.measurement_us() + int(standby * 1000)
+        self.regs[0xF3] = 0x08 if self._pending else 0x00
+
+    def _after_write(self, reg, data):
+        if reg <= 0xF4 < reg + len(data):
+            mode = self.regs[0xF4] & 0x3
+            if mode in (0x1, 0x2):
+                self._pending = True
+                self._done_us = clock.now_us() + self.measurement_us()
+            elif mode == 0x3:
+                self._next_normal_us = clock.now_us() + self.measurement_us()
+        if reg == 0xE0 and data and data[0] == 0xB6:
+            self.regs[0xF2:0xF6] = bytes(4)
+
+
+class ADXL355Model(Device):
+    """
+    Accelerometer with a 96 entry FIFO. While POWER_CTL.standby is clear samples
+    are produced at the ODR selected in REG_FILTER; each one updates the data
+    registers and pushes an X/Y/Z triplet into the FIFO, setting FIFO_OVR when it
+    is full. Reading REG_FIFO_DATA pops entries without advancing the pointer.
+    signal(t_seconds) returns the acceleration in g for each axis.
+    """
+    max_freq = 1000000
+    ODR = (4000, 2000, 1000, 500, 250, 125, 62.5, 31.25, 15.625, 7.813, 3.906)
+    FIFO_DEPTH = 96
+
+    def __init__(self, address=0x1D, signal=None):
+        super().__init__(address)
+        self.signal = signal or (lambda t: (0.0, 0.0, 1.0))
+        self.fifo = []
+        self.overflows = 0
+        self.regs[0x00:0x04] = bytes([0xAD, 0x1D, 0xED, 0x01])
+        self.regs[0x06] = 0x07
+        self.regs[0x07] = 0x3C
+        self.regs[0x29] = 0x60
+        self.regs[0x2C] = 0x81
+        self.regs[0x2D] = 0x01
+        self._t_sample_us = None
+        self.lines = {}
+        self._pulses = []
+        self._ticker = None
+
+    def odr(self) -> float:
+        return self.ODR[min(self.regs[0x28] & 0x0F, len(self.ODR) - 1)]
+
+    def scale(self) -> float:
+        return {1: 2.048, 2: 4.096, 3: 8.192}.get(self.regs[0x2C] & 0x3, 2.048) * 2 / 2 ** 20
+
+    def _encode(self, g, flags=0) -> bytes:
+        raw = int(round(g / self.scale()))
+        raw = max(-(1 << 19), min(raw, (1 << 19) - 1)) & 0xFFFFF
+        return bytes([(raw >> 12) & 0xFF, (raw >> 4) & 0xFF, ((raw & 0xF) << 4) | flags])
+
+    def _measuring(self) -> bool:
+        return not self.regs[0x2D] & 0x01
+
+    def connect(self, pin, line="DRDY"):
+        """Wire the DRDY, INT1 or INT2 output to a machine.Pin"""
+        self.lines[line] = pin
+
+    def _signal(self, source, count=1):
+        int_map = self.regs[0x2A]
+        targets = []
+        if "DRDY" in self.lines and source == 0x01 and not self.regs[0x2D] & 0x04:
+            targets.append(self.lines["DRDY"])
+        if "INT1" in self.lines and int_map & source:
+            targets.append(self.lines["INT1"])
+        if "INT2" in self.lines and int_map & (source << 4):
+            targets.append(self.lines["INT2"])
+        for pin in targets:
+            self._pulses.extend([pin] * count)
+
+    def _fire(self):
+        pulses, self._pulses = self._pulses, []
+        for pin in pulses:
+            pin.pulse()
+
+    def tick(self):
+        """Produce due samples and deliver the interrupt edges they raise"""
+        with self.lock:
+            self.advance()
+        self._fire()
+
+    def start_clock(self, interval_us=500):
+        """Keep producing samples (and interrupts) without bus traffic, as the real part does"""
+        self.stop_clock()
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval_us / 1e6):
+                self.tick()
+
+        self._ticker = (stop, threading.Thread(target=run, daemon=True))
+        self._ticker[1].start()
+
+    def stop_clock(self):
+        if self._ticker is not None:
+            self._ticker[0].set()
+            self._ticker[1].join()
+            self._ticker = None
+
+    def advance(self, now_us=None) -> int:
+        """Produce every sample due up to now, returns the number produced"""
+        now = clock.now_us() if now_us is None else now_us
+        if not self._measuring():
+            self._t_sample_us = None
+            return 0
+        period = 1e6 / self.odr()
+        if self._t_sample_us is None:
+            self._t_sample_us = now
+            return 0
+        due = int((now - self._t_sample_us) // period)
+        if due <= 0:
+            return 0
+        # Only the newest FIFO_DEPTH / 3 samples can survive in the FIFO anyway
+        skip = max(0, due - self.FIFO_DEPTH // 3 - 1)
+        if skip:
+            self.overflows += 1
+            self.regs[0x04] |= 0x04
+        for k in range(skip, due):
+            t = (self._t_sample_us + (k + 1) * period) / 1e6
+            x, y, z = self.signal(t)
+            entries = (self._encode(x, 0x01), self._encode(y), self._encode(z))
+            self.regs[0x08:0x11] = b"".join(entries)
+            below_watermark = len(self.fifo) < self.regs[0x29]
+            if len(self.fifo) + 3 > self.FIFO_DEPTH:
+                self.overflows += 1
+                self.regs[0x04] |= 0x04
+            else:
+                self.fifo.extend(entries)
+            if below_watermark and len(self.fifo) >= self.regs[0x29]:
+                self._signal(0x02)
+        self._t_sample_us += due * period
+        self.regs[0x04] |= 0x01
+        self._signal(0x01, min(due - skip, 4))
+        if len(self.fifo) >= self.regs[0x29]:
+            self.regs[0x04] |= 0x02
+        return due
+
+    def _before_read(self, reg, nbytes):
+        self.advance()
+        self.regs[0x05] = len(self.fifo)
+
+    def _increment(self, reg) -> int:
+        return reg if reg == 0x11 else (reg + 1) & 0xFF
+
+    def _read_byte(self, reg) -> int:
+        value = self.regs[reg]
+        if reg == 0x04:
+            # Status flags clear on read
+            self.regs[0x04] &= ~0x07 & 0xFF
+        elif reg == 0x11:
+            if not self._fifo_byte:
+                self._fifo_byte = list(self.fifo.pop(0)) if self.fifo else [0, 0, 0x02]
+            value = self._fifo_byte.pop(0)
+        return value
+
+    _fifo_byte = None
+
+    def _read_current(self, nbytes) -> bytes:
+        self._fifo_byte = []
+        return super()._read_current(nbytes)
+
+    def read(self, reg, nbytes) -> bytes:
+        try:
+            return super().read(reg, nbytes)
+        finally:
+            self._fire()
+
+    def write(self, reg, data):
+        try:
+            super().write(reg, data)
+        finally:
+            self._fire()
+
+    def _after_write(self, reg, data):
+        if reg == 0x2F and data and data[0] == 0x52:
+            self.__init__(self.address, self.signal)
+        if reg <= 0x28 < reg + len(data) or reg <= 0x2D < reg + len(data):
+            self.advance()
+
+
+def sine(amplitude=0.5, freq=50.0, offset=(0.0, 0.0, 1.0)):
+    """Vibration signal for ADXL355Model"""
+    def signal(t):
+        s = amplitude * math.sin(2 * math.pi * freq * t)
+        return offset[0] + s, offset[1] + s / 2, offset[2] + s / 4
+    return signal
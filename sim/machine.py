@@ -0,0 +1,235 @@
+"""
+Stand-in for the rp2 machine module backed by a sim.board.Board.
+"""
+import threading
+
+from sim import clock
+
+_board = None
+
+
+def set_board(board):
+    global _board
+    _board = board
+
+
+def freq(*args):
+    return 125000000
+
+
+def unique_id() -> bytes:
+    return b"\xe6\x61\x38\x52\x83\x2d\x4a\x21"
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def soft_reset():
+    raise SystemExit("machine.soft_reset()")
+
+
+PWRON_RESET = 1
+WDT_RESET = 3
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
+
+
+class _Mem:
+    def __init__(self):
+        self._words = {}
+
+    def __getitem__(self, addr):
+        return self._words.get(addr, 0)
+
+    def __setitem__(self, addr, value):
+        self._words[addr] = value & 0xFFFFFFFF
+
+
+mem8 = _Mem()
+mem16 = _Mem()
+mem32 = _Mem()
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.id = id
+        self._value = 1 if pull == self.PULL_UP else 0
+        self._handler = None
+        self._trigger = 0
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None, **kwargs):
+        if mode != -1:
+            self.mode = mode
+        if pull != -1:
+            self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        value = 1 if value else 0
+        if value != self._value and _board is not None:
+            bus = _board.bus_for_scl(self.id)
+            if bus is not None:
+                bus.clock_scl()
+        edge = self.IRQ_RISING if value > self._value else self.IRQ_FALLING if value < self._value else 0
+        self._value = value
+        if edge & self._trigger and self._handler:
+            self._handler(self)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(not self._value)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._handler = handler
+        self._trigger = trigger if handler else 0
+
+    def pulse(self):
+        """Simulation helper: drive an edge into the pin as an external device would"""
+        self.value(not self._value)
+        self.value(not self._value)
+
+    def __repr__(self):
+        return "Pin({})".format(self.id)
+
+
+def _pin_id(pin):
+    return pin.id if isinstance(pin, Pin) else pin
+
+
+class I2C:
+    def __init__(self, id=0, *, scl=None, sda=None, freq=400000, timeout=50000):
+        self._id = id
+        self._scl = scl
+        self._sda = sda
+        self.init(freq=freq)
+
+    def init(self, *, scl=None, sda=None, freq=400000, timeout=50000):
+        if scl is not None:
+            self._scl = scl
+        if sda is not None:
+            self._sda = sda
+        self._freq = freq
+        sda_id = _pin_id(self._sda)
+        self._bus = _board.bus_for(getattr(self, "_id", None), sda_id)
+        self._sda_id = self._bus.sda
+        self._scl_id = self._bus.scl
+
+    @property
+    def bus(self):
+        return self._bus
+
+    def scan(self) -> list:
+        return self._bus.scan(self._freq)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8) -> bytes:
+        return self._bus.read_mem(self._freq, addr, memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        buf[:] = self._bus.read_mem(self._freq, addr, memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        self._bus.write_mem(self._freq, addr, memaddr, buf)
+
+    def readfrom(self, addr, nbytes, stop=True) -> bytes:
+        return self._bus.read(self._freq, addr, nbytes)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        buf[:] = self._bus.read(self._freq, addr, len(buf))
+
+    def writeto(self, addr, buf, stop=True) -> int:
+        self._bus.write(self._freq, addr, buf)
+        return len(buf)
+
+    def __repr__(self):
+        return "I2C({}, freq={}, scl={}, sda={}, timeout=50000)".format(self._id, self._freq, self._scl_id, self._sda_id)
+
+
+class SoftI2C(I2C):
+    def __init__(self, scl, sda, *, freq=400000, timeout=50000):
+        self._id = -1
+        super().__init__(-1, scl=scl, sda=sda, freq=freq)
+
+    def __repr__(self):
+        return "SoftI2C(scl={}, sda={}, freq={})".format(self._scl_id, self._sda_id, self._freq)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self._thread = None
+        self._stop = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, *, mode=PERIODIC, freq=-1, period=-1, callback=None, tick_hz=1000):
+        self.deinit()
+        if freq > 0:
+            period_s = 1 / freq
+        else:
+            period_s = period / tick_hz
+        stop = self._stop = threading.Event()
+
+        def run():
+            deadline = clock.now_us() + period_s * 1e6
+            while not stop.wait(max(0.0, (deadline - clock.now_us()) / 1e6)):
+                if callback:
+                    callback(self)
+                if mode == self.ONE_SHOT:
+                    break
+                deadline += period_s * 1e6
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def deinit(self):
+        if self._stop is not None:
+            self._stop.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._stop = None
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.last_feed_us = clock.now_us()
+
+    def feed(self):
+        self.last_feed_us = clock.now_us()
+
+    def expired(self) -> bool:
+        return clock.now_us() - self.last_feed_us > self.timeout * 1000
@@ -0,0 +1,55 @@
+"""
+Stand-in for the micropython module.
+"""
+import queue
+import threading
+
+
+def const(expr):
+    return expr
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+_SCHEDULE_DEPTH = 32
+_pending = queue.Queue(maxsize=_SCHEDULE_DEPTH)
+_worker = None
+
+
+def _run_scheduled():
+    while True:
+        func, arg = _pending.get()
+        try:
+            func(arg)
+        except Exception as e:
+            print("Uncaught exception in scheduled function: {}".format(e))
+
+
+def schedule(func, arg):
+    """Queue func(arg) like the firmware does, RuntimeError when the queue is full"""
+    global _worker
+    if _worker is None:
+        _worker = threading.Thread(target=_run_scheduled, daemon=True)
+        _worker.start()
+    try:
+        _pending.put_nowait((func, arg))
+    except queue.Full:
+        raise RuntimeError("schedule queue full")
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(*args):
+    print("mem: simulated")
+
+
+def opt_level(*args):
+    return 0
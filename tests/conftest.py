@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim  # noqa: E402
+from sim import clock  # noqa: E402
+
+# The device modules import machine, micropython and the ticks helpers at import time
+sim.install()
+
+
+@pytest.fixture
+def frozen_clock():
+    """sim.clock stopped for the test, moved only by advance() and sleeps"""
+    clock.freeze()
+    yield clock
+    clock.unfreeze()
@@ -0,0 +1,49 @@
+import math
+from array import array
+
+from Aggregator import Aggregator, SUMMARY_STATS
+
+
+def summary_of(agg, channel) -> dict:
+    stats = len(SUMMARY_STATS)
+    return dict(zip(SUMMARY_STATS, agg.summary[stats * channel:stats * (channel + 1)]))
+
+
+def test_sample_windows_match_direct_stats():
+    windows = []
+    agg = Aggregator(channels=2, window_samples=4, factor=0.5)
+    agg.on_window = lambda a: windows.append([summary_of(a, c) for c in range(a.channels)])
+    data = array('i', (3, -100, 7, 100, -2, 50, 8, 0, 1, 1))
+    assert agg.add_into(data, 5) == 1
+    assert agg.pending == 1
+    assert agg.summary[-1] == 4
+
+    for c, column in enumerate(((3, 7, -2, 8), (-100, 100, 50, 0))):
+        summary = windows[0][c]
+        assert math.isclose(summary["mean"], 0.5 * sum(column) / 4, rel_tol=1e-6)
+        assert summary["min"] == 0.5 * min(column)
+        assert summary["max"] == 0.5 * max(column)
+        assert math.isclose(summary["rms"], 0.5 * math.sqrt(sum(x * x for x in column) / 4), rel_tol=1e-5)
+
+
+def test_add_with_offset_and_reset():
+    agg = Aggregator(channels=3, window_samples=2)
+    assert not agg.add([9, 9, 9, 1, 2, 3], 1)
+    agg.reset()
+    assert agg.pending == 0
+    assert not agg.add([1, 2, 3])
+    assert agg.add([3, 2, 1])
+    assert summary_of(agg, 0)["mean"] == 2.0
+    assert summary_of(agg, 1)["min"] == summary_of(agg, 1)["max"] == 2
+    assert agg.windows == 1
+
+
+def test_time_windows(frozen_clock):
+    agg = Aggregator(channels=1, window_ms=1000)
+    for _ in range(10):
+        assert not agg.add([5])
+        frozen_clock.advance(99000)
+    frozen_clock.advance(10000)
+    assert agg.add([5])
+    assert agg.summary[-1] == 11
+    assert agg.summary_ticks == frozen_clock.ticks_us()
@@ -0,0 +1,48 @@
+from CircuitBreaker import CircuitBreaker
+
+
+def test_opens_after_threshold(frozen_clock):
+    breaker = CircuitBreaker(threshold=3, backoff_ms=1000)
+    assert not breaker.failure()
+    breaker.success()
+    assert not breaker.failure()
+    assert not breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats() == {"state": "open", "failures": 3, "trips": 1, "skipped": 0}
+
+
+def test_backoff_doubles_up_to_max(frozen_clock):
+    breaker = CircuitBreaker(threshold=1, backoff_ms=1000, max_backoff_ms=3000)
+    waits = []
+    assert breaker.failure()
+    for _ in range(4):
+        waited = 0
+        while not breaker.retry_due():
+            frozen_clock.advance(100000)
+            waited += 100
+        waits.append(waited)
+        breaker.half_open()
+        # A failed trial reopens the breaker, another trip
+        assert breaker.failure()
+    assert waits == [1000, 2000, 3000, 3000]
+    assert breaker.trips == 5
+
+
+def test_trial_success_closes_and_resets_backoff(frozen_clock):
+    breaker = CircuitBreaker(threshold=2, backoff_ms=500)
+    breaker.failure()
+    breaker.failure()
+    frozen_clock.advance(500000)
+    assert breaker.retry_due()
+    breaker.half_open()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+    breaker.failure()
+    assert breaker.failure()
+    frozen_clock.advance(499000)
+    assert not breaker.retry_due()
+    frozen_clock.advance(1000)
+    assert breaker.retry_due()
+    assert breaker.trips == 2
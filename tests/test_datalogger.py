@@ -0,0 +1,101 @@
+import DataLogger
+from DataLogger import DataLogger as Logger
+from RingBuffer import RingBuffer
+from host.logfile import LogBlockDecoder, read_blocks, iter_records
+
+
+def log_blocks(logger, first, count):
+    store = RingBuffer(1, 4)
+    for i in range(first, first + count):
+        store.push(i * 1000, [i])
+        logger.append_store(0x48, store)
+        logger.sync(True)
+
+
+def dumped(logger) -> bytes:
+    data = b""
+    for path in logger.files():
+        with open(path, "rb") as f:
+            data += f.read()
+    return data
+
+
+def test_seq_continues_after_rotation(tmp_path):
+    directory = str(tmp_path / "log")
+    logger = Logger(directory, file_blocks=2, max_files=8)
+    log_blocks(logger, 0, 4)
+    logger.close()
+    # The last rotation left an empty newest file behind
+    assert len(logger.files()) == 3
+
+    logger = Logger(directory, file_blocks=2, max_files=8)
+    assert not logger.recovered
+    assert logger.stats()["seq"] == 4
+    log_blocks(logger, 4, 3)
+    logger.close()
+
+    blocks = read_blocks(dumped(logger))
+    assert [seq for seq, payload in blocks] == list(range(7))
+    values = [int(values[0][0]) for seq, payload in blocks for _, _, _, values, _ in iter_records(payload)]
+    assert values == list(range(7))
+
+
+def test_torn_tail_starts_new_file(tmp_path):
+    directory = str(tmp_path / "log")
+    logger = Logger(directory, file_blocks=8)
+    log_blocks(logger, 0, 2)
+    logger.close()
+    with open(logger.files()[-1], "ab") as f:
+        f.write(b"\xd1LOG torn")
+
+    logger = Logger(directory, file_blocks=8)
+    assert logger.recovered
+    assert logger.stats()["seq"] == 2
+    assert len(logger.files()) == 2
+
+
+def test_failed_retry_drops_block(tmp_path, monkeypatch):
+    logger = Logger(str(tmp_path / "log"))
+
+    class FullFile:
+        def write(self, buf):
+            raise OSError(28)
+
+        def close(self):
+            pass
+
+    def full(path, mode):
+        raise OSError(28)
+    logger._file = FullFile()
+    monkeypatch.setattr(DataLogger, "open", full, raising=False)
+    log_blocks(logger, 0, 2)
+    stats = logger.stats()
+    assert stats["blocks_dropped"] == 2
+    assert stats["blocks"] == 0
+    assert stats["pending_bytes"] == 0
+
+    monkeypatch.undo()
+    log_blocks(logger, 2, 1)
+    assert logger.stats()["blocks"] == 1
+
+
+def test_summaries_logged_apart_from_samples(tmp_path):
+    logger = Logger(str(tmp_path / "log"))
+    log_blocks(logger, 0, 1)
+    summary = [0.5, -1.0, 2.0, 1.25, 100]
+    logger.log_summary(0x1D, 7000, summary)
+    store = RingBuffer(len(summary), 4, 'f')
+    store.push(8000, summary)
+    assert logger.append_store(0x1D, store, summary=True) == 1
+    logger.close()
+    assert logger.stats()["samples"] == 1
+
+    records = [record for _, payload in read_blocks(dumped(logger)) for record in iter_records(payload)]
+    summaries = [(sensor_id, int(ticks[0]), list(values[0])) for sensor_id, scaled, ticks, values, summary in records
+                 if summary]
+    assert summaries == [(0x1D, 7000, summary), (0x1D, 8000, summary)]
+
+    decoder = LogBlockDecoder()
+    batches = decoder.feed(dumped(logger))
+    assert [batch.sensor_id for batch in batches] == [0x48]
+    assert decoder.stats()["summaries"] == 2
@@ -0,0 +1,41 @@
+from array import array
+
+import pytest
+from Deadband import Deadband
+
+
+def test_passes_changes_beyond_band(frozen_clock):
+    band = Deadband(2, absolute=10, heartbeat_ms=0)
+    assert band.check([100, 200])
+    assert not band.check([110, 190])
+    assert band.check([111, 200])
+    # The band is around the last sample that passed, not the last one checked
+    assert not band.check([101, 200])
+    assert band.check([100, 200])
+    assert band.stats() == {"passed": 3, "suppressed": 2}
+
+
+def test_relative_band_and_offset(frozen_clock):
+    band = Deadband(3, absolute=(0, 0, 5), relative=0.01, heartbeat_ms=0)
+    data = array('i', (1, 2, 3, 1000, -2000, 0))
+    assert band.check(data, 3)
+    assert not band.check([1010, -2020, 5])
+    assert band.check([1011, -2000, 0])
+    assert band.check([1011, -2000, 6])
+
+
+def test_heartbeat_and_reset(frozen_clock):
+    band = Deadband(1, absolute=100, heartbeat_ms=1000)
+    assert band.check([0])
+    frozen_clock.advance(999000)
+    assert not band.check([0])
+    frozen_clock.advance(1000)
+    assert band.check([0])
+    assert not band.check([0])
+    band.reset()
+    assert band.check([0])
+
+
+def test_band_count_must_match_channels():
+    with pytest.raises(ValueError):
+        Deadband(3, absolute=(1, 2))
@@ -0,0 +1,91 @@
+from array import array
+
+import machine
+import numpy as np
+import sim
+from sim.board import default_board
+from sim.devices import BME280Model
+from ADXL355 import ADXL355, SET_HPF_1_5545
+from BME280 import calibration_array, compensate_into
+from host.decode import bme280_calibration, bme280_compensate_fixed
+
+
+def test_adxl355_keeps_running_odr():
+    sim.install(default_board())
+    i2c = machine.I2C(0, freq=400000)
+    acc = ADXL355(i2c=i2c, wdt=machine.WDT(), device=0x1D)
+    assert (acc.odr, acc._hpf) == (4000, 0)
+    acc.set_odr(250, SET_HPF_1_5545)
+
+    # As after a WDT reset: the device keeps its filter settings
+    acc = ADXL355(i2c=i2c, wdt=machine.WDT(), device=0x1D)
+    assert (acc.odr, acc._hpf) == (250, SET_HPF_1_5545)
+    acc.reinit()
+    assert acc.odr == 250
+
+
+def datasheet_compensate(cal, adc_p, adc_t, adc_h):
+    """
+    The BME280 datasheet's reference code (4.2.3), 32-bit temperature and humidity
+    and 64-bit pressure, with C's truncating division.
+    """
+    t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9, h1, h2, h3, h4, h5, h6 = cal
+    var1 = (((adc_t >> 3) - (t1 << 1)) * t2) >> 11
+    var2 = (((((adc_t >> 4) - t1) * ((adc_t >> 4) - t1)) >> 12) * t3) >> 14
+    t_fine = var1 + var2
+    t = (t_fine * 5 + 128) >> 8
+
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * p6
+    var2 = var2 + ((var1 * p5) << 17)
+    var2 = var2 + (p4 << 35)
+    var1 = ((var1 * var1 * p3) >> 8) + ((var1 * p2) << 12)
+    var1 = (((1 << 47) + var1) * p1) >> 33
+    if var1 == 0:
+        p = 0
+    else:
+        p = 1048576 - adc_p
+        num = ((p << 31) - var2) * 3125
+        p = abs(num) // abs(var1) * (1 if (num < 0) == (var1 < 0) else -1)
+        var1 = (p9 * (p >> 13) * (p >> 13)) >> 25
+        var2 = (p8 * p) >> 19
+        p = ((p + var1 + var2) >> 8) + (p7 << 4)
+
+    v = t_fine - 76800
+    v = (((((adc_h << 14) - (h4 << 20) - (h5 * v)) + 16384) >> 15) *
+         (((((((v * h6) >> 10) * (((v * h3) >> 11) + 32768)) >> 10) + 2097152) * h2 + 8192) >> 14))
+    v = v - (((((v >> 15) * (v >> 15)) >> 7) * h1) >> 4)
+    v = min(max(v, 0), 419430400)
+    return p, t, v >> 12
+
+
+def bme280_block() -> bytes:
+    regs = BME280Model(0x76).regs
+    return bytes(regs[0x88:0xA2]) + bytes(regs[0xE1:0xE8])
+
+
+def test_bme280_compensation_matches_datasheet():
+    cal = calibration_array(bme280_block())
+    assert list(cal) == list(bme280_calibration(bme280_block()))
+    # The datasheet's worked example: 25.08 degC and, in floating point, 100653.27 Pa
+    p, t, h = compensate_into(cal, array('i', (415148, 519888, 30000)), array('i', (0, 0, 0)))
+    assert t == 2508
+    assert abs(p / 256 - 100653.27) < 0.1
+    assert (p, t, h) == datasheet_compensate(list(cal), 415148, 519888, 30000)
+
+    for adc_p in range(200000, 700000, 49999):
+        for adc_t in range(400000, 650000, 24999):
+            for adc_h in range(10000, 60000, 9999):
+                out = compensate_into(cal, array('i', (adc_p, adc_t, adc_h)), array('i', (0, 0, 0)))
+                assert tuple(out) == datasheet_compensate(list(cal), adc_p, adc_t, adc_h)
+
+
+def test_bme280_host_decode_bit_exact():
+    block = bme280_block()
+    cal = calibration_array(block)
+    rng = np.random.default_rng(1)
+    raw = np.stack([rng.integers(200000, 700000, 500), rng.integers(400000, 650000, 500),
+                    rng.integers(0, 65536, 500)], axis=1)
+    out = compensate_into(cal, array('i', raw.ravel().tolist()), array('i', bytes(4 * raw.size)), len(raw))
+    host = np.stack(bme280_compensate_fixed(raw, bme280_calibration(block)), axis=1)
+    assert host.ravel().tolist() == list(out)
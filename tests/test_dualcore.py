@@ -0,0 +1,115 @@
+import builtins
+import threading
+import time
+
+import machine
+import pytest
+import sim
+from sim.board import default_board
+from DualCore import DualCore
+from SensorsPool import SensorsPool
+
+
+def make_pool() -> SensorsPool:
+    sim.install(default_board())
+    return SensorsPool(i2c=machine.I2C(0, freq=400000), wdt=machine.WDT())
+
+
+def test_reads_on_core1_output_on_core0(monkeypatch):
+    pool = make_pool()
+    dual = DualCore(pool)
+    core0 = threading.get_ident()
+    off_core0 = []
+    builtin_print = builtins.print
+
+    def checked_print(*args, **kwargs):
+        if threading.get_ident() != core0:
+            off_core0.append(args)
+        builtin_print(*args, **kwargs)
+    monkeypatch.setattr(builtins, "print", checked_print)
+
+    temps = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])
+    dual.start()
+    try:
+        assert pool.deferred
+        dual.set_rate(temps[0], 50)
+        dual.set_rate(temps[1], 5, pool.snapshotter())
+        time.sleep(0.3)
+        dual.clear()
+        assert pool.flush() > 0
+    finally:
+        dual.stop()
+    assert not pool.deferred
+    assert not off_core0
+
+
+def test_clear_waits_for_running_read():
+    pool = make_pool()
+    dual = DualCore(pool)
+    temp = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])[0]
+    busy = []
+
+    def slow():
+        busy.append(True)
+        time.sleep(0.2)
+        busy.pop()
+    dual.start()
+    try:
+        dual.set_rate(temp, 10, slow)
+        time.sleep(0.05)
+        dual.clear()
+        assert not busy
+    finally:
+        dual.stop()
+
+
+def test_busy_core1_refuses_stop_and_keeps_last_error():
+    pool = make_pool()
+    dual = DualCore(pool)
+    temps = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])
+
+    def failing():
+        raise OSError(5)
+    dual.start()
+    dual.set_rate(temps[0], 50, failing)
+    time.sleep(0.1)
+    entry = dual.stats()[0]
+    assert entry["errors"] > 0
+    assert entry["last_error"] == repr(OSError(5))
+
+    dual.set_rate(temps[1], 10, lambda: time.sleep(0.5))
+    time.sleep(0.05)
+    with pytest.raises(RuntimeError):
+        dual.stop(timeout_ms=100)
+    assert pool.deferred
+    time.sleep(0.5)
+    dual.stop()
+    assert not dual.running
+
+
+def test_faults_on_core1_reported_on_core0(monkeypatch):
+    board = default_board()
+    sim.install(board)
+    pool = SensorsPool(i2c=machine.I2C(0, freq=400000), wdt=machine.WDT())
+    dual = DualCore(pool)
+    core0 = threading.get_ident()
+    printed = []
+
+    def checked_print(*args, **kwargs):
+        printed.append((threading.get_ident() == core0, args))
+    monkeypatch.setattr(builtins, "print", checked_print)
+
+    temp = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])[0]
+    dual.start()
+    try:
+        board.bus_for(sda=4).inject_fault(temp._device, count=1000)
+        dual.set_rate(temp, 50)
+        time.sleep(0.2)
+        dual.clear()
+        assert not printed
+        pool.flush()
+    finally:
+        dual.stop()
+    assert printed
+    assert all(on_core0 for on_core0, args in printed)
+    assert any("quarantined" in args[0] for on_core0, args in printed)
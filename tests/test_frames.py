@@ -0,0 +1,60 @@
+import io
+
+from frame_helper import FrameWriter
+from host.analysis import FrameChunkDecoder
+from host.frames import FrameDecoder
+
+
+def write_stream():
+    stream = io.BytesIO()
+    writer = FrameWriter(stream)
+    stream.write(b"Completed populating sensors pool!\r\n")
+    writer.write(0x48, [21.5], True, 1000)
+    # 0x5AA5 puts a sync word inside the payload
+    writer.write(0x1D, [0x5AA5, -2, 3], False, 2000)
+    writer.write(0x1D, [0.5, -1.0, 2.0, 1.25] * 3 + [100], True, 3000, summary=True)
+    corrupt = stream.tell() + 12
+    writer.write(0x49, [23.25], True, 4000)
+    stream.write(b"\xa5")
+    writer.write(0xF6, [415148, 519888, 30000], False, 5000)
+    data = bytearray(stream.getvalue())
+    data[corrupt] ^= 0x01
+    return bytes(data)
+
+
+def feed_chunks(decoder, data, size) -> list:
+    out = []
+    for i in range(0, len(data), size):
+        out += decoder.feed(data[i:i + size])
+    return out
+
+
+def test_frame_round_trip():
+    stream = io.BytesIO()
+    writer = FrameWriter(stream)
+    writer.write(0x48, [21.5], True, 0xFFFFFFFF)
+    writer.write(0x1D, [-524288, 0, 524287], False, 7)
+    frames = FrameDecoder().feed(stream.getvalue())
+    assert [(f.sensor_id, f.seq, f.ticks_us, f.scaled, f.values) for f in frames] == [
+        (0x48, 0, 0xFFFFFFFF, True, (21.5,)),
+        (0x1D, 1, 7, False, (-524288, 0, 524287)),
+    ]
+
+
+def test_decoders_agree_and_resync():
+    data = write_stream()
+    for size in (1, 2, 7, 64, len(data)):
+        decoder = FrameDecoder()
+        frames = feed_chunks(decoder, data, size)
+        assert [(f.sensor_id, f.ticks_us, f.summary) for f in frames] == [
+            (0x48, 1000, False), (0x1D, 2000, False), (0x1D, 3000, True), (0xF6, 5000, False)]
+        assert decoder.crc_errors == 1
+        assert decoder.lost_frames == 1
+
+        chunked = FrameChunkDecoder()
+        batches = feed_chunks(chunked, data, size)
+        decoded = sorted((b.sensor_id, int(t), tuple(v.tolist()))
+                         for b in batches for t, v in zip(b.ticks, b.values))
+        expected = sorted((f.sensor_id, f.ticks_us, tuple(f.values)) for f in frames if not f.summary)
+        assert decoded == expected
+        assert chunked.stats() == {"frames": 4, "summaries": 1, "crc_errors": 1, "lost_frames": 1}
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import machine
+import sim
+from sim.board import default_board
+from Scheduler import Scheduler
+from SensorsPool import SensorsPool
+
+
+def make_pool() -> SensorsPool:
+    sim.install(default_board())
+    return SensorsPool(i2c=machine.I2C(0, freq=400000), wdt=machine.WDT())
+
+
+def run_for(scheduler, seconds):
+    async def main():
+        scheduler.start()
+        await asyncio.sleep(seconds)
+        scheduler.stop()
+    asyncio.run(main())
+
+
+def test_rates_samples_and_jitter():
+    pool = make_pool()
+    scheduler = Scheduler(pool)
+    reads = []
+    temp = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])[0]
+    start = time.ticks_ms()
+    scheduler.set_rate(temp, 50, lambda: reads.append(temp.read_temp()))
+    planned = scheduler.set_rates(SensorsPool.SENSOR_DATA["Accelerometer"]["Name"], 20)
+    assert planned == 1
+
+    run_for(scheduler, 0.5)
+    # Slots are due from set_rate on, which may be a while before the loop starts
+    elapsed_ms = time.ticks_diff(time.ticks_ms(), start)
+
+    stats = {entry["name"]: entry for entry in scheduler.stats()}
+    temp_stats = stats[temp.name]
+    assert 15 <= temp_stats["samples"] <= elapsed_ms // 20 + 1
+    assert temp_stats["samples"] == len(reads)
+    assert temp_stats["errors"] == 0
+    assert 0 <= temp_stats["jitter_mean_us"] <= temp_stats["jitter_max_us"]
+    assert 5 <= stats[SensorsPool.SENSOR_DATA["Accelerometer"]["Name"]]["samples"] <= elapsed_ms // 50 + 1
+
+
+def test_overrun_counts_misses():
+    pool = make_pool()
+    scheduler = Scheduler(pool)
+    temp = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])[0]
+
+    def slow():
+        temp.read_temp()
+        time.sleep_ms(30)
+    scheduler.set_rate(temp, 100, slow)
+
+    run_for(scheduler, 0.3)
+
+    entry = scheduler.stats()[0]
+    assert entry["samples"] <= 12
+    assert entry["misses"] >= entry["samples"]
+    assert entry["jitter_max_us"] > 0
+
+
+def test_errors_are_counted():
+    pool = make_pool()
+    scheduler = Scheduler(pool)
+    temp = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])[0]
+
+    def failing():
+        raise OSError(5)
+    scheduler.set_rate(temp, 50, failing)
+
+    run_for(scheduler, 0.2)
+
+    entry = scheduler.stats()[0]
+    assert entry["samples"] > 0
+    assert entry["errors"] == entry["samples"]
+
+
+def test_rate_plan_change_keeps_dispatchers():
+    pool = make_pool()
+    scheduler = Scheduler(pool)
+    temps = pool.get_sensors(SensorsPool.SENSOR_DATA["Temperature"]["Name"])
+    counts = [0] * len(temps)
+
+    def counter(i):
+        def action():
+            counts[i] += 1
+        return action
+
+    async def main():
+        scheduler.start()
+        scheduler.set_rate(temps[0], 50, counter(0))
+        await asyncio.sleep(0.2)
+        scheduler.plan([(temps[1], 50, counter(1))])
+        before = counts[0]
+        await asyncio.sleep(0.2)
+        scheduler.stop()
+        return before
+    before = asyncio.run(main())
+
+    assert counts[0] == before
+    assert counts[1] > 0
+    assert len(scheduler.entries()) == 1
@@ -0,0 +1,32 @@
+import machine
+import sim
+import time
+from sim.board import default_board
+from SensorsPool import SensorsPool
+
+
+def test_snapshot_converts_forced_bme280_in_place():
+    sim.install(default_board())
+    pool = SensorsPool(i2c=machine.I2C(0, freq=400000), wdt=machine.WDT())
+    bme = pool.get_sensors(SensorsPool.SENSOR_DATA["Barometer"]["Name"])[0]
+    pool.snapshot()
+    time.sleep(0.3)
+
+    start = time.ticks_us()
+    snapshot = pool.snapshot()
+    records = snapshot.records()
+    i = snapshot.sensors.index(bme)
+    assert snapshot.converted[i] and snapshot.order[-1] == i
+    # A conversion made during this snapshot, not the one pipelined by the last
+    assert time.ticks_diff(snapshot.ticks[i], start) > 0
+    assert snapshot.skew_us < bme._delay_us // 4
+    assert len(records) == len(snapshot)
+    ticks = [record[2] for record in records]
+    assert all(time.ticks_diff(b, a) >= 0 for a, b in zip(ticks, ticks[1:]))
+
+
+def test_read_records_keeps_registry_order():
+    sim.install(default_board())
+    pool = SensorsPool(i2c=machine.I2C(0, freq=400000), wdt=machine.WDT())
+    records = pool.read_records()
+    assert [record[0] for record in records] == [dev.sensor_id for dev in pool.get_sensors()]